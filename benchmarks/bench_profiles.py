@@ -0,0 +1,109 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Measure the runtime of the run profiles and their agreement with default.
+
+Usage::
+
+    python benchmarks/bench_profiles.py --input reference.fa --database db/ \
+        --n-jobs 8
+
+Every profile is run with "virsorter run", which has to be on the PATH, on
+the same reference set. Calls are compared with those of the "default"
+profile per contig: recall is the share of contigs called by "default"
+that the profile calls as well, precision the share of the contigs called
+by the profile that "default" calls as well. The scores of contigs called
+by both are compared by their mean absolute difference.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import pandas as pd
+
+from q2_virsorter2._sharding import RUN_OUTPUTS
+from q2_virsorter2.virsorter2_run import RUN_PROFILES, _construct_run_cmd
+
+
+def run_profile(work_dir, sequences_fp, database, n_jobs, min_score, profile):
+    cmd = _construct_run_cmd(
+        work_dir, sequences_fp, database, n_jobs, min_score, 0, None, profile=profile
+    )
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def read_contig_scores(work_dir):
+    """Returns the best score of every contig with a viral call."""
+    df = pd.read_csv(os.path.join(work_dir, RUN_OUTPUTS["score"]), sep="\t")
+    df["contig"] = df["seqname"].str.split("||", n=1, regex=False).str[0]
+    return df.groupby("contig")["max_score"].max()
+
+
+def agreement(expected, observed):
+    shared = expected.index.intersection(observed.index)
+    return {
+        "recall": len(shared) / len(expected) if len(expected) else 1.0,
+        "precision": len(shared) / len(observed) if len(observed) else 1.0,
+        "score_diff": (
+            (expected[shared] - observed[shared]).abs().mean() if len(shared) else 0
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--input", required=True, help="Reference contigs (FASTA)")
+    parser.add_argument("--database", required=True, help="VirSorter2 database")
+    parser.add_argument(
+        "--profiles", nargs="+", default=list(RUN_PROFILES), choices=RUN_PROFILES
+    )
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--min-score", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if shutil.which("virsorter") is None:
+        print("skipped (virsorter not found on the PATH)")
+        return
+
+    # The reference calls are always made, even if not reported
+    profiles = ["default"] + [p for p in args.profiles if p != "default"]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in profiles:
+            work_dir = os.path.join(tmp, profile)
+            elapsed = run_profile(
+                work_dir,
+                args.input,
+                args.database,
+                args.n_jobs,
+                args.min_score,
+                profile,
+            )
+            results[profile] = (elapsed, read_contig_scores(work_dir))
+
+    default_time, default_scores = results["default"]
+    print("profile\ttime (s)\tspeedup\tcontigs\trecall\tprecision\tscore diff")
+    for profile in profiles:
+        if profile not in args.profiles:
+            continue
+        elapsed, scores = results[profile]
+        stats = agreement(default_scores, scores)
+        print(
+            f"{profile}\t{elapsed:.1f}\t{default_time / elapsed:.2f}x\t"
+            f"{len(scores)}\t{stats['recall']:.3f}\t{stats['precision']:.3f}\t"
+            f"{stats['score_diff']:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
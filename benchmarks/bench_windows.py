@@ -0,0 +1,125 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Compare windowed runs of long contigs with unsplit runs.
+
+Usage::
+
+    python benchmarks/bench_windows.py --input genomes.fa --database db/ \
+        --window-size 500000 --n-jobs 8
+
+Both runs use "virsorter run", which has to be on the PATH. The calls of
+the windowed run are stitched back into contig coordinates and matched to
+the calls of the unsplit run by overlap. Calls without a match, and
+matched calls whose boundaries or scores differ by more than the given
+tolerances, are listed.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import pandas as pd
+
+from q2_virsorter2._sharding import RUN_OUTPUTS
+from q2_virsorter2._windows import stitch_windows, write_windows
+from q2_virsorter2.virsorter2_run import _construct_run_cmd
+
+
+def run_virsorter(work_dir, sequences_fp, database, n_jobs):
+    cmd = _construct_run_cmd(work_dir, sequences_fp, database, n_jobs, 0.5, 0, None)
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def read_calls(work_dir):
+    df = pd.read_csv(os.path.join(work_dir, RUN_OUTPUTS["boundary"]), sep="\t")
+    return df[["seqname", "seqname_new", "trim_bp_start", "trim_bp_end"]].merge(
+        pd.read_csv(os.path.join(work_dir, RUN_OUTPUTS["score"]), sep="\t")[
+            ["seqname", "max_score"]
+        ],
+        left_on="seqname_new",
+        right_on="seqname",
+        suffixes=("", "_score"),
+    )
+
+
+def compare(expected, observed, bp_tolerance, score_tolerance):
+    mismatches = 0
+    for contig, calls in expected.groupby("seqname"):
+        candidates = observed[observed["seqname"] == contig]
+        for call in calls.itertuples():
+            match = candidates[
+                (candidates["trim_bp_start"] <= call.trim_bp_end)
+                & (candidates["trim_bp_end"] >= call.trim_bp_start)
+            ]
+            if match.empty:
+                print(f"  missing: {call.seqname_new}")
+                mismatches += 1
+                continue
+            other = match.iloc[0]
+            offset = max(
+                abs(other["trim_bp_start"] - call.trim_bp_start),
+                abs(other["trim_bp_end"] - call.trim_bp_end),
+            )
+            score_diff = abs(other["max_score"] - call.max_score)
+            if offset > bp_tolerance or score_diff > score_tolerance:
+                print(
+                    f"  differs: {call.seqname_new} vs. {other['seqname_new']} "
+                    f"({offset} bp, score {score_diff:.3f})"
+                )
+                mismatches += 1
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--input", required=True, help="FASTA file with contigs")
+    parser.add_argument("--database", required=True, help="VirSorter2 database")
+    parser.add_argument("--window-size", type=int, default=500_000)
+    parser.add_argument("--window-overlap", type=int, default=100_000)
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--bp-tolerance", type=int, default=1000)
+    parser.add_argument("--score-tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if shutil.which("virsorter") is None:
+        print("skipped (virsorter not found on the PATH)")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        unsplit_dir = os.path.join(tmp, "unsplit")
+        elapsed = run_virsorter(unsplit_dir, args.input, args.database, args.n_jobs)
+        print(f"unsplit: {elapsed:.1f}s")
+
+        windowed_dir = os.path.join(tmp, "windowed")
+        windows_fp = os.path.join(tmp, "windows.fa")
+        start = time.perf_counter()
+        windows = write_windows(
+            args.input, windows_fp, args.window_size, args.window_overlap
+        )
+        run_virsorter(windowed_dir, windows_fp, args.database, args.n_jobs)
+        stitch_windows(windowed_dir, windows, args.input, args.window_size)
+        elapsed = time.perf_counter() - start
+        print(f"windowed ({len(windows)} windows): {elapsed:.1f}s")
+
+        expected, observed = read_calls(unsplit_dir), read_calls(windowed_dir)
+        mismatches = compare(
+            expected, observed, args.bp_tolerance, args.score_tolerance
+        ) + compare(observed, expected, args.bp_tolerance, args.score_tolerance)
+        print(
+            f"{len(expected)} unsplit and {len(observed)} windowed calls, "
+            f"{mismatches} mismatch(es)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,4 +10,8 @@
 try:
     from ._version import __version__
 except ModuleNotFoundError:
-    __version__ = '0.0.0+notfound'
+    __version__ = "0.0.0+notfound"
+
+from ._results import ViralCall, iter_viral_calls
+
+__all__ = ["ViralCall", "iter_viral_calls"]
@@ -0,0 +1,182 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Rescoring of finished runs with the group models of a database.
+
+Every group of a VirSorter2 database has a trained classifier stored in
+"group/<group>/model" (a scikit-learn pipeline saved with joblib). The
+models are loaded once and applied to the feature tables that VirSorter2
+writes for every group ("all.pdg.ftr"), many contigs at a time, producing
+the columns of "final-viral-score.tsv".
+
+The scoring step of "virsorter run" is a script of its Snakemake workflow
+that loads the models itself, so runs do not use this module. It serves
+rescoring the feature tables of finished runs, e.g. through the worker's
+"rescore" operation, without running VirSorter2 again.
+"""
+
+import glob
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from q2_virsorter2._results import SCORE_COLUMNS
+
+BATCH_SIZE = 100_000
+
+
+def read_feature_table(ftr_fp):
+    """
+    Read a feature table written by VirSorter2 for the contigs of a group.
+
+    Args:
+    ftr_fp (str): Path to the table (e.g., "iter-0/<group>/all.pdg.ftr").
+
+    Returns:
+    pd.DataFrame: One row per contig, indexed by "seqname", with the
+        features in the order of the table.
+    """
+
+    return pd.read_csv(ftr_fp, sep="\t", index_col="seqname")
+
+
+def load_group_models(database_path, groups=None):
+    """
+    Load the classifiers of the groups of a VirSorter2 database.
+
+    Args:
+    database_path (str): Path to a VirSorter2 database directory.
+    groups (iterable of str): Only load these groups. Defaults to all
+        groups that have a model.
+
+    Returns:
+    dict: The models keyed by group name, in alphabetical order.
+    """
+
+    models = {}
+    for model_fp in sorted(
+        glob.glob(os.path.join(database_path, "group", "*", "model"))
+    ):
+        group = os.path.basename(os.path.dirname(model_fp))
+        if groups is not None and group not in groups:
+            continue
+        try:
+            models[group] = joblib.load(model_fp)
+        except Exception as e:
+            raise ValueError(
+                f"The model of group {group} ({model_fp}) could not be loaded: {e}"
+            )
+
+    missing = set(groups or ()) - set(models)
+    if missing:
+        raise ValueError(f"No model found for group(s): {', '.join(sorted(missing))}.")
+    return models
+
+
+class GroupClassifier:
+    """
+    Score contigs with the models of several groups.
+
+    Features are assembled once into a contiguous float64 matrix per
+    feature set and every model scores it in batches of 'batch_size'
+    contigs. Models need 'predict_proba' (e.g., scikit-learn estimators);
+    the probability of the viral class is used as the group score.
+
+    VirSorter2's models are fit on arrays, so they do not record feature
+    names and receive the columns of the feature table in file order.
+    Models that do record names get these columns instead.
+    """
+
+    def __init__(self, models, batch_size=BATCH_SIZE):
+        if not models:
+            raise ValueError("At least one group model is required.")
+        self.models = dict(models)
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_database(cls, database_path, groups=None, **kwargs):
+        return cls(load_group_models(database_path, groups), **kwargs)
+
+    @property
+    def groups(self):
+        return list(self.models)
+
+    @staticmethod
+    def _feature_names(model, features):
+        names = getattr(model, "feature_names_in_", None)
+        if names is not None:
+            return tuple(names)
+        n_features = getattr(model, "n_features_in_", features.shape[1])
+        if n_features != features.shape[1]:
+            raise ValueError(
+                f"The model expects {n_features} features, but the feature "
+                f"table has {features.shape[1]} columns."
+            )
+        return tuple(features.columns)
+
+    @staticmethod
+    def _viral_class(model):
+        classes = list(getattr(model, "classes_", [0, 1]))
+        return classes.index(1) if 1 in classes else len(classes) - 1
+
+    def score(self, features):
+        """
+        Compute the score of every group.
+
+        Args:
+        features (pd.DataFrame): A feature table as read by
+            'read_feature_table', one row per contig.
+
+        Returns:
+        pd.DataFrame: The score of every group, indexed like 'features'.
+        """
+
+        matrices, scores = {}, {}
+        for group, model in self.models.items():
+            names = self._feature_names(model, features)
+            # Models sharing a feature set also share the matrix
+            if names not in matrices:
+                matrices[names] = np.ascontiguousarray(
+                    features.loc[:, list(names)].to_numpy(dtype=np.float64)
+                )
+            X = matrices[names]
+
+            column = self._viral_class(model)
+            result = np.empty(len(X), dtype=np.float64)
+            for start in range(0, len(X), self.batch_size):
+                batch = X[start : start + self.batch_size]
+                result[start : start + len(batch)] = model.predict_proba(batch)[
+                    :, column
+                ]
+            scores[group] = result
+
+        return pd.DataFrame(scores, index=features.index, columns=self.groups)
+
+    def classify(self, features):
+        """
+        Score contigs and summarize them like "final-viral-score.tsv".
+
+        Args:
+        features (pd.DataFrame): A feature table as read by
+            'read_feature_table', with "length", "hallmark", "viral" and
+            "cellular" among its columns.
+
+        Returns:
+        pd.DataFrame: The group scores followed by max_score,
+            max_score_group, length, hallmark, viral and cellular.
+        """
+
+        result = self.score(features)
+        scores = result.to_numpy()
+        best = np.argmax(scores, axis=1)
+        result["max_score"] = scores[np.arange(len(scores)), best]
+        result["max_score_group"] = np.asarray(self.groups, dtype=object)[best]
+        for column in SCORE_COLUMNS[2:]:
+            result[column] = features[column].to_numpy()
+        return result
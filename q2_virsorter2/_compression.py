@@ -0,0 +1,850 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import argparse
+import bisect
+import fcntl
+import gzip
+import hashlib
+import io
+import itertools
+import os
+import queue
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from q2_virsorter2._scratch import get_directory_size
+
+# Files are compressed as a series of independent gzip members ("blocks"),
+# which together still form a valid gzip file but can be (de)compressed
+# in parallel.
+BLOCK_SIZE = 4 * 2**20
+
+# Databases are decompressed into a shared cache, limited to this size;
+# the least recently used entries are evicted first
+CACHE_DIR_ENV = "Q2_VIRSORTER2_CACHE_DIR"
+CACHE_SIZE_ENV = "Q2_VIRSORTER2_CACHE_MB"
+DEFAULT_CACHE_MB = 50_000
+# Entries used more recently are never evicted, as they may be in use
+MIN_EVICTION_AGE = 3600
+# Entries in use hold a shared lock on a file next to them, which keeps
+# them from being evicted (see 'hold_cache_entry')
+LOCK_SUFFIX = ".lock"
+# Entries that are not cached databases
+_CACHE_SKIP = ("downloads",)
+
+INDEX_FILE = "index.tsv"
+INDEX_HEADER = ["path", "size", "sha256", "blocks"]
+
+IndexEntry = namedtuple("IndexEntry", ["path", "size", "sha256", "blocks"])
+
+
+def _ordered_map(pool, func, items, window):
+    """Like pool.map, but with at most 'window' items in flight."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _read_blocks(fh, sizes):
+    for size in sizes:
+        yield fh.read(size)
+
+
+def compress_file(src, dst, pool, block_size=BLOCK_SIZE, level=6, window=4):
+    """
+    Compress a file into independent gzip blocks using a thread pool.
+
+    Args:
+    src (str): The file to compress.
+    dst (str): The compressed file to write.
+    pool (Executor): Executor used to compress blocks concurrently.
+    block_size (int): Uncompressed size of every block.
+    level (int): The gzip compression level.
+    window (int): Maximum number of blocks held in memory.
+
+    Returns:
+    IndexEntry: The entry describing the file (without its path).
+    """
+
+    digest = hashlib.sha256()
+    size = 0
+    blocks = []
+
+    def compress(data):
+        return gzip.compress(data, compresslevel=level, mtime=0)
+
+    with open(src, "rb") as fh, open(dst, "wb") as out:
+
+        def chunks():
+            nonlocal size
+            while data := fh.read(block_size):
+                digest.update(data)
+                size += len(data)
+                yield data
+
+        for block in _ordered_map(pool, compress, chunks(), window):
+            out.write(block)
+            blocks.append(len(block))
+
+    return IndexEntry(None, size, digest.hexdigest(), blocks)
+
+
+def decompress_file(src, dst, entry, pool, window=4):
+    """
+    Decompress a block-compressed file and verify its checksum.
+
+    Args:
+    src (str): The compressed file.
+    dst (str): The decompressed file to write, or None to only verify it.
+    entry (IndexEntry): The index entry of the file.
+    pool (Executor): Executor used to decompress blocks concurrently.
+    window (int): Maximum number of blocks held in memory.
+    """
+
+    digest = hashlib.sha256()
+    with open(src, "rb") as fh, open(dst or os.devnull, "wb") as out:
+        blocks = _read_blocks(fh, entry.blocks)
+        for data in _ordered_map(pool, gzip.decompress, blocks, window):
+            digest.update(data)
+            out.write(data)
+
+    if digest.hexdigest() != entry.sha256:
+        raise ValueError(f"Checksum mismatch for '{entry.path}'.")
+
+
+def write_index(entries, index_path):
+    with open(index_path, "w") as fh:
+        fh.write("\t".join(INDEX_HEADER) + "\n")
+        for e in entries:
+            blocks = ",".join(map(str, e.blocks)) or "-"
+            fh.write(f"{e.path}\t{e.size}\t{e.sha256}\t{blocks}\n")
+
+
+def read_index(index_path):
+    entries = []
+    with open(index_path) as fh:
+        header = fh.readline().rstrip("\n").split("\t")
+        if header != INDEX_HEADER:
+            raise ValueError(f"Unexpected header: {header}.")
+        for line in fh:
+            path, size, sha256, blocks = line.rstrip("\n").split("\t")
+            blocks = [] if blocks == "-" else [int(b) for b in blocks.split(",")]
+            entries.append(IndexEntry(path, int(size), sha256, blocks))
+    return entries
+
+
+def _list_files(directory):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(root, name), directory)
+
+
+def compress_directory(src_dir, dst_dir, n_jobs=1, block_size=BLOCK_SIZE):
+    """
+    Compress every file of a directory and write an index of them.
+
+    Files are processed concurrently and large files are additionally
+    split into blocks that are compressed concurrently.
+
+    Args:
+    src_dir (str): The directory to compress.
+    dst_dir (str): The directory receiving "<path>.gz" files and the index.
+    n_jobs (int): Number of threads.
+    block_size (int): Uncompressed size of every block.
+    """
+
+    def compress(rel_path):
+        dst = os.path.join(dst_dir, rel_path + ".gz")
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        entry = compress_file(
+            os.path.join(src_dir, rel_path),
+            dst,
+            block_pool,
+            block_size,
+            window=2 * n_jobs,
+        )
+        return entry._replace(path=rel_path)
+
+    with ThreadPoolExecutor(n_jobs) as file_pool, ThreadPoolExecutor(
+        n_jobs
+    ) as block_pool:
+        entries = list(file_pool.map(compress, sorted(_list_files(src_dir))))
+
+    write_index(entries, os.path.join(dst_dir, INDEX_FILE))
+
+
+def decompress_directory(src_dir, dst_dir, n_jobs=1):
+    """
+    Decompresses a directory written by 'compress_directory'.
+
+    If 'dst_dir' is None, the files are only decompressed to verify their
+    checksums and nothing is written.
+    """
+    entries = read_index(os.path.join(src_dir, INDEX_FILE))
+
+    def decompress(entry):
+        dst = None
+        if dst_dir is not None:
+            dst = os.path.join(dst_dir, entry.path)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+        src = os.path.join(src_dir, entry.path + ".gz")
+        decompress_file(src, dst, entry, block_pool, window=2 * n_jobs)
+
+    with ThreadPoolExecutor(n_jobs) as file_pool, ThreadPoolExecutor(
+        n_jobs
+    ) as block_pool:
+        # Consume the results to surface any exception
+        list(file_pool.map(decompress, entries))
+
+
+def get_cache_dir():
+    """Returns the directory holding decompressed databases."""
+    return os.environ.get(
+        CACHE_DIR_ENV, os.path.join(tempfile.gettempdir(), "q2-virsorter2-cache")
+    )
+
+
+def touch_cache_entry(path):
+    """Marks a cache entry as used, which protects it from eviction."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+# Lock files held open by this process, keyed by the path of their entry
+_held_locks = {}
+_held_locks_lock = threading.Lock()
+
+
+def hold_cache_entry(path):
+    """
+    Protect a cache entry from eviction for the life of this process.
+
+    A shared lock is taken on a file next to the entry, which 'prune_cache'
+    must lock exclusively to evict the entry. As the lock waits for an
+    ongoing eviction, it should be held before checking that the entry
+    exists. Holding an entry again has no effect.
+
+    Args:
+    path (str): The cache entry, which does not need to exist yet.
+    """
+
+    path = os.path.abspath(path)
+    with _held_locks_lock:
+        if path in _held_locks:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+        except OSError:
+            os.close(fd)
+            raise
+        _held_locks[path] = fd
+
+
+def release_cache_entry(path):
+    """Releases the lock taken by 'hold_cache_entry', if any."""
+    with _held_locks_lock:
+        fd = _held_locks.pop(os.path.abspath(path), None)
+    if fd is not None:
+        os.close(fd)
+
+
+def _evict(path):
+    """Removes a cache entry, unless it is held by any process."""
+    try:
+        fd = os.open(path + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o666)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    # The lock file is kept, as other processes may be waiting on it
+    try:
+        shutil.rmtree(path, ignore_errors=True)
+    finally:
+        os.close(fd)
+    return True
+
+
+def _cache_entries(cache_dir):
+    """Yields (last use, size, path) of the complete entries of a cache."""
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if not entry.is_dir() or entry.name in _CACHE_SKIP:
+                continue
+            if ".partial-" in entry.name:
+                continue
+            yield entry.stat().st_mtime, get_directory_size(entry.path), entry.path
+
+
+def prune_cache(cache_dir=None, max_mb=None, keep=(), min_age=MIN_EVICTION_AGE):
+    """
+    Evict the least recently used entries until the cache fits its size.
+
+    Entries are ordered by their last use (see 'touch_cache_entry').
+    Entries in 'keep', used within the last 'min_age' seconds or held by
+    any process (see 'hold_cache_entry') are never evicted, so the cache
+    may stay above its size while they are in use.
+
+    Args:
+    cache_dir (str): The cache directory. See 'get_cache_dir'.
+    max_mb (float): The maximal size of the cache, in MB. Defaults to
+        $Q2_VIRSORTER2_CACHE_MB, or 50 GB.
+    keep (iterable of str): Entries that must not be evicted.
+    min_age (float): Minimal time since the last use of evicted entries.
+
+    Returns:
+    list: The evicted entries.
+    """
+
+    cache_dir = cache_dir or get_cache_dir()
+    if max_mb is None:
+        max_mb = float(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_MB))
+    if not os.path.isdir(cache_dir):
+        return []
+
+    entries = sorted(_cache_entries(cache_dir))
+    total = sum(size for _, size, _ in entries)
+    keep = {os.path.abspath(path) for path in keep}
+    evicted = []
+    now = time.time()
+    for last_use, size, path in entries:
+        if total <= max_mb * 2**20:
+            break
+        if os.path.abspath(path) in keep or now - last_use < min_age:
+            continue
+        if not _evict(path):
+            continue
+        total -= size
+        evicted.append(path)
+    return evicted
+
+
+def materialize_directory(src_dir, cache_dir=None, n_jobs=None):
+    """
+    Decompress a compressed directory into the cache, unless already there.
+
+    Directories are keyed by the checksum of their index, so every version
+    is decompressed only once. Decompression happens in a temporary
+    directory that is renamed once complete, which makes concurrent calls
+    safe. The directory is held for the life of the process (see
+    'hold_cache_entry'), so it is not evicted while runs read it.
+
+    Args:
+    src_dir (str): The compressed directory.
+    cache_dir (str): The cache directory. See 'get_cache_dir'.
+    n_jobs (int): Number of threads. Defaults to the number of CPUs.
+
+    Returns:
+    str: Path of the decompressed directory.
+    """
+
+    cache_dir = cache_dir or get_cache_dir()
+    with open(os.path.join(src_dir, INDEX_FILE), "rb") as fh:
+        key = hashlib.sha256(fh.read()).hexdigest()[:32]
+    target = os.path.join(cache_dir, key)
+    hold_cache_entry(target)
+    if os.path.isdir(target):
+        touch_cache_entry(target)
+        return target
+
+    partial = tempfile.mkdtemp(prefix=f"{key}.partial-", dir=cache_dir)
+    try:
+        decompress_directory(src_dir, partial, n_jobs or os.cpu_count() or 1)
+        os.rename(partial, target)
+    except OSError:
+        # Another process completed the same directory first
+        if not os.path.isdir(target):
+            raise
+    finally:
+        if os.path.isdir(partial):
+            shutil.rmtree(partial)
+    prune_cache(cache_dir, keep=[target])
+    return target
+
+
+class _HashingReader:
+    """
+    A read-only file object computing a checksum of the raw bytes.
+
+    Raw chunks are read and hashed by a background thread while the
+    consumer (e.g., the decompressor) processes the previous chunks.
+    """
+
+    def __init__(self, path, algorithm, chunk_size=BLOCK_SIZE, prefetch=4):
+        self.digest = hashlib.new(algorithm)
+        self._path = path
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._buffer = memoryview(b"")
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            with open(self._path, "rb") as fh:
+                while not self._stop.is_set():
+                    chunk = fh.read(self._chunk_size)
+                    self.digest.update(chunk)
+                    self._queue.put(chunk)
+                    if not chunk:
+                        return
+        except OSError as e:
+            self._queue.put(e)
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if not len(self._buffer):
+                chunk = b"" if self._eof else self._queue.get()
+                if isinstance(chunk, OSError):
+                    raise chunk
+                if not chunk:
+                    self._eof = True
+                    break
+                self._buffer = memoryview(chunk)
+            n = len(self._buffer) if size < 0 else min(size, len(self._buffer))
+            parts.append(self._buffer[:n].tobytes())
+            self._buffer = self._buffer[n:]
+            if size > 0:
+                size -= n
+        return b"".join(parts)
+
+    def hexdigest(self):
+        """Returns the checksum; only valid once everything was read."""
+        self._thread.join()
+        return self.digest.hexdigest()
+
+    def close(self):
+        self._stop.set()
+        # Unblock the producer if it waits on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _member_path(name, strip_prefix):
+    """Returns the path of a tar member below the destination, or None."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if strip_prefix and parts[:1] == [strip_prefix]:
+        parts = parts[1:]
+    if not parts:
+        return None
+    if name.startswith("/") or ".." in parts:
+        raise ValueError(f"Archive member '{name}' points outside of the archive.")
+    return os.path.join(*parts)
+
+
+def extract_archive(
+    archive, dest_dir, n_jobs=1, algorithm="sha256", strip_prefix=None, window=None
+):
+    """
+    Extract a (compressed) tar archive in a single streaming pass.
+
+    The archive is read sequentially and decompressed on the fly, its
+    checksum is computed in a separate thread, and file contents are
+    written by 'n_jobs' threads. Only regular files and directories are
+    extracted.
+
+    Args:
+    archive (str): The tar archive (plain, gzip, bz2 or xz compressed).
+    dest_dir (str): The directory to extract into.
+    n_jobs (int): Number of threads writing files.
+    algorithm (str): The hashlib algorithm used to checksum the archive.
+    strip_prefix (str): A top-level directory to remove from member paths.
+    window (int): Maximum number of chunks waiting to be written.
+
+    Returns:
+    str: The checksum of the archive.
+    """
+
+    window = window or 2 * n_jobs
+    reader = _HashingReader(archive, algorithm)
+    pending = deque()
+    pool = ThreadPoolExecutor(n_jobs)
+
+    def write(fd, data, offset):
+        os.pwrite(fd, data, offset)
+
+    def close(fd, futures):
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            os.close(fd)
+
+    try:
+        with tarfile.open(fileobj=reader, mode="r|*") as tar:
+            for member in tar:
+                path = _member_path(member.name, strip_prefix)
+                if path is None:
+                    continue
+                dst = os.path.join(dest_dir, path)
+                if member.isdir():
+                    os.makedirs(dst, exist_ok=True)
+                    continue
+                if not member.isfile():
+                    continue
+
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                futures, offset = [], 0
+                try:
+                    src = tar.extractfile(member)
+                    while data := src.read(BLOCK_SIZE):
+                        futures.append(pool.submit(write, fd, data, offset))
+                        pending.append(futures[-1])
+                        offset += len(data)
+                        # Bound the amount of data held in memory
+                        while len(pending) >= window:
+                            pending.popleft().result()
+                finally:
+                    pending.append(pool.submit(close, fd, futures))
+
+            # Drain the remainder (e.g., trailing zero blocks) for the checksum
+            while reader.read(BLOCK_SIZE):
+                pass
+        while pending:
+            pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True)
+        reader.close()
+
+    return reader.hexdigest()
+
+
+# BGZF files (as written by bgzip) are gzip files whose members carry
+# their own compressed size in a "BC" extra field, so that the members
+# can be located without decompressing and then decoded in parallel.
+GZIP_MAGIC = b"\x1f\x8b"
+_BGZF_HEADER = 12
+
+
+def is_gzip(path):
+    with open(path, "rb") as fh:
+        return fh.read(2) == GZIP_MAGIC
+
+
+def is_bgzf(path):
+    with open(path, "rb") as fh:
+        header = fh.read(_BGZF_HEADER + 6)
+    return (
+        len(header) == _BGZF_HEADER + 6
+        and header[:4] == GZIP_MAGIC + b"\x08\x04"
+        and header[12:14] == b"BC"
+    )
+
+
+def _bgzf_size(header, extra):
+    """Returns the total size of a BGZF block from its header fields."""
+    pos = 0
+    while pos + 4 <= len(extra):
+        length = int.from_bytes(extra[pos + 2 : pos + 4], "little")
+        if extra[pos : pos + 2] == b"BC" and length == 2:
+            return int.from_bytes(extra[pos + 4 : pos + 6], "little") + 1
+        pos += 4 + length
+    raise ValueError("Not a BGZF block: the block size is missing.")
+
+
+def iter_bgzf_blocks(fh):
+    """Yields the raw (compressed) blocks of a BGZF stream."""
+    while header := fh.read(_BGZF_HEADER):
+        if len(header) < _BGZF_HEADER or header[:2] != GZIP_MAGIC:
+            raise ValueError("Not a BGZF block: invalid header.")
+        extra = fh.read(int.from_bytes(header[10:12], "little"))
+        size = _bgzf_size(header, extra)
+        block = header + extra + fh.read(size - _BGZF_HEADER - len(extra))
+        if len(block) != size:
+            raise ValueError("Truncated BGZF block.")
+        yield block
+
+
+class _ChunkReader(io.RawIOBase):
+    """A readable stream over an iterator of byte chunks."""
+
+    def __init__(self, chunks, on_close=None):
+        self._chunks = chunks
+        self._on_close = on_close
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b""
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed and self._on_close is not None:
+            self._on_close()
+        super().close()
+
+
+def open_compressed(path, n_jobs=1, window=None):
+    """
+    Open a gzip compressed file for streaming reads.
+
+    BGZF files are decoded block by block in a thread pool when more than
+    one job is given; other gzip files are decompressed in a single stream.
+    In both cases only a bounded amount of data is held in memory.
+
+    Args:
+    path (str): The compressed file.
+    n_jobs (int): Number of threads decompressing BGZF blocks.
+    window (int): Maximum number of BGZF blocks in flight.
+
+    Returns:
+    io.BufferedReader: The decompressed binary stream.
+    """
+
+    if n_jobs <= 1 or not is_bgzf(path):
+        return gzip.open(path, "rb")
+
+    fh = open(path, "rb")
+    pool = ThreadPoolExecutor(n_jobs)
+    blocks = _ordered_map(
+        pool, gzip.decompress, iter_bgzf_blocks(fh), window or 4 * n_jobs
+    )
+
+    def close():
+        blocks.close()
+        pool.shutdown()
+        fh.close()
+
+    return io.BufferedReader(_ChunkReader(blocks, close), BLOCK_SIZE // 4)
+
+
+# Uncompressed data per BGZF block, as used by htslib, so that the
+# compressed block stays below the 64 KiB limit of the format
+BGZF_BLOCK_SIZE = 0xFF00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def bgzf_block(data, level=6):
+    """Compresses data (at most BGZF_BLOCK_SIZE bytes) into a BGZF block."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    # Even incompressible data only grows by a few bytes per 16 KiB
+    deflated = compressor.compress(data) + compressor.flush()
+    size = _BGZF_HEADER + 6 + len(deflated) + 8
+    return (
+        GZIP_MAGIC
+        + b"\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+        + (size - 1).to_bytes(2, "little")
+        + deflated
+        + zlib.crc32(data).to_bytes(4, "little")
+        + len(data).to_bytes(4, "little")
+    )
+
+
+class BgzfWriter(io.RawIOBase):
+    """
+    Write a BGZF file, compressing its blocks in a thread pool.
+
+    Blocks are compressed while data is still being written and are written
+    in order, with at most 'window' blocks held in memory. The start of
+    every block (compressed and uncompressed offset) is recorded, so that a
+    .gzi index can be written with 'write_gzi' once the file is closed.
+    """
+
+    def __init__(self, path, n_jobs=1, level=6, window=None):
+        self._fh = open(path, "wb")
+        self._pool = ThreadPoolExecutor(max(n_jobs, 1))
+        self._window = window or 4 * max(n_jobs, 1)
+        self._level = level
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._compressed = 0
+        self._uncompressed = 0
+        self.offsets = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= BGZF_BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:BGZF_BLOCK_SIZE]))
+            del self._buffer[:BGZF_BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, data):
+        self._pending.append(
+            (len(data), self._pool.submit(bgzf_block, data, self._level))
+        )
+        while len(self._pending) >= self._window:
+            self._write_next()
+
+    def _write_next(self):
+        size, future = self._pending.popleft()
+        block = future.result()
+        self.offsets.append((self._compressed, self._uncompressed))
+        self._fh.write(block)
+        self._compressed += len(block)
+        self._uncompressed += size
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_next()
+            self._fh.write(BGZF_EOF)
+        finally:
+            self._pool.shutdown()
+            self._fh.close()
+            super().close()
+
+
+def write_gzi(offsets, gzi_path):
+    """
+    Write a .gzi index (as written by "bgzip -i") of a BGZF file.
+
+    Args:
+    offsets (list): The (compressed, uncompressed) offsets of all blocks.
+    gzi_path (str): The index to write.
+    """
+
+    # The first block always starts at (0, 0) and is left out
+    entries = [o for o in offsets if o != (0, 0)]
+    with open(gzi_path, "wb") as fh:
+        fh.write(len(entries).to_bytes(8, "little"))
+        for compressed, uncompressed in entries:
+            fh.write(compressed.to_bytes(8, "little"))
+            fh.write(uncompressed.to_bytes(8, "little"))
+
+
+def read_gzi(gzi_path):
+    """Reads the (compressed, uncompressed) block offsets of a .gzi index."""
+    with open(gzi_path, "rb") as fh:
+        data = fh.read()
+    n_entries = int.from_bytes(data[:8], "little")
+    if len(data) != 8 + 16 * n_entries:
+        raise ValueError("Invalid .gzi index: unexpected size.")
+    offsets = [(0, 0)]
+    for i in range(n_entries):
+        start = 8 + 16 * i
+        offsets.append(
+            (
+                int.from_bytes(data[start : start + 8], "little"),
+                int.from_bytes(data[start + 8 : start + 16], "little"),
+            )
+        )
+    return offsets
+
+
+class BgzfReader:
+    """
+    Random access to the uncompressed data of an indexed BGZF file.
+
+    Only the blocks overlapping a requested range are decompressed. The
+    object supports slicing and 'rfind', so that it can stand in for a
+    memory map of the uncompressed data.
+    """
+
+    def __init__(self, path, gzi_path=None):
+        self._fh = open(path, "rb")
+        offsets = read_gzi(gzi_path or f"{path}.gzi")
+        self._compressed = [c for c, _ in offsets]
+        self._uncompressed = [u for _, u in offsets]
+        self._cache = (None, b"")
+
+    def close(self):
+        self._fh.close()
+
+    def _block(self, i):
+        if self._cache[0] != i:
+            self._fh.seek(self._compressed[i])
+            (block,) = itertools.islice(iter_bgzf_blocks(self._fh), 1)
+            self._cache = (i, gzip.decompress(block))
+        return self._cache[1]
+
+    def read(self, offset, size):
+        """Reads 'size' uncompressed bytes starting at 'offset'."""
+        i = bisect.bisect_right(self._uncompressed, offset) - 1
+        chunks, remaining = [], size
+        while remaining > 0 and i < len(self._uncompressed):
+            data = self._block(i)
+            start = offset - self._uncompressed[i] if not chunks else 0
+            chunk = data[start : start + remaining]
+            if not data:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            i += 1
+        return b"".join(chunks)
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop
+        return self.read(start, stop - start) if stop > start else b""
+
+    def rfind(self, sub, start, end, chunk_size=4096):
+        """Finds the last occurrence of 'sub' in [start, end), reading back."""
+        while end > start:
+            begin = max(start, end - chunk_size)
+            pos = self.read(begin, end - begin).rfind(sub)
+            if pos >= 0:
+                return begin + pos
+            end = begin
+        return -1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Evict the least recently used databases from the cache."
+    )
+    parser.add_argument("command", choices=["prune-cache"])
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help=f"The cache directory (default: ${CACHE_DIR_ENV} or the temporary "
+        "directory).",
+    )
+    parser.add_argument(
+        "--max-mb",
+        type=float,
+        default=None,
+        help=f"Shrink the cache to this size (default: ${CACHE_SIZE_ENV}). Use 0 "
+        "to remove every entry that is not in use.",
+    )
+    args = parser.parse_args(argv)
+
+    for path in prune_cache(args.cache_dir, args.max_mb):
+        print(f"Removed {path}.")
+
+
+if __name__ == "__main__":
+    main()
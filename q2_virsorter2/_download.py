@@ -0,0 +1,224 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 32 * 2**20
+_BUFFER_SIZE = 2**20
+
+
+def _hash_file(fp, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(fp, "rb") as fh:
+        while data := fh.read(_BUFFER_SIZE):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _probe(url, timeout):
+    """
+    Returns the URL after redirects, the size and the ETag of the resource
+    and whether range requests are supported.
+    """
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        size = response.headers.get("Content-Length")
+        ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        return (
+            response.geturl(),
+            int(size) if size is not None else None,
+            response.headers.get("ETag"),
+            ranges,
+        )
+
+
+class _State:
+    """
+    The chunks of a partial download that were completely written.
+
+    The state is stored next to the partial file and is only reused if
+    it belongs to the same URL, size, ETag and chunk size.
+    """
+
+    def __init__(self, path, url, size, etag, chunk_size):
+        self.path = path
+        self.key = {"url": url, "size": size, "etag": etag, "chunk_size": chunk_size}
+        self.done = set()
+        self._lock = threading.Lock()
+        try:
+            with open(path) as fh:
+                state = json.load(fh)
+            if state["key"] == self.key:
+                self.done = set(state["done"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def complete(self, chunk):
+        with self._lock:
+            self.done.add(chunk)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as fh:
+                json.dump({"key": self.key, "done": sorted(self.done)}, fh)
+            os.replace(tmp, self.path)
+
+
+def _with_retries(func, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except OSError as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt
+            print(f"Download failed ({e}), retrying in {delay:.0f}s.")
+            time.sleep(delay)
+
+
+def _download_chunk(url, part, start, end, timeout):
+    request = urllib.request.Request(url, headers={"Range": f"bytes={start}-{end}"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        if response.status != 206:
+            raise OSError(f"Range request returned status {response.status}.")
+        fd = os.open(part, os.O_WRONLY)
+        try:
+            offset = start
+            while data := response.read(_BUFFER_SIZE):
+                os.pwrite(fd, data, offset)
+                offset += len(data)
+        finally:
+            os.close(fd)
+    if offset != end + 1:
+        raise OSError(f"Incomplete chunk (bytes {start}-{end}).")
+
+
+def _download_stream(url, part, timeout):
+    with urllib.request.urlopen(url, timeout=timeout) as response, open(
+        part, "wb"
+    ) as fh:
+        while data := response.read(_BUFFER_SIZE):
+            fh.write(data)
+
+
+def download(
+    url,
+    dest,
+    n_jobs=4,
+    checksum=None,
+    chunk_size=CHUNK_SIZE,
+    retries=3,
+    backoff=1.0,
+    timeout=60,
+):
+    """
+    Download a file using parallel range requests.
+
+    Data is written to "<dest>.part" and the completed chunks are recorded
+    in "<dest>.part.json", so that an interrupted download continues where
+    it stopped. Servers that do not support range requests are downloaded
+    in a single stream.
+
+    Args:
+    url (str): The URL to download.
+    dest (str): The file to create.
+    n_jobs (int): Number of chunks downloaded concurrently.
+    checksum (tuple): Expected (algorithm, hex digest) of the file.
+    chunk_size (int): Size of every chunk in bytes.
+    retries (int): Number of retries of every request.
+    backoff (float): Delay before the first retry, doubled for every retry.
+    timeout (float): Timeout of every request in seconds.
+
+    Returns:
+    str: The path of the downloaded file.
+    """
+
+    part, state_fp = f"{dest}.part", f"{dest}.part.json"
+    location, size, etag, ranges = _with_retries(
+        lambda: _probe(url, timeout), retries, backoff
+    )
+
+    if ranges and size:
+        state = _State(state_fp, url, size, etag, chunk_size)
+        if not os.path.exists(part) or os.path.getsize(part) != size:
+            state.done = set()
+            with open(part, "wb") as fh:
+                fh.truncate(size)
+
+        chunks = [c for c in range(-(-size // chunk_size)) if c not in state.done]
+        if state.done:
+            print(f"Resuming download, {len(chunks)} chunk(s) left.")
+
+        def fetch(chunk):
+            start = chunk * chunk_size
+            end = min(start + chunk_size, size) - 1
+            _with_retries(
+                lambda: _download_chunk(location, part, start, end, timeout),
+                retries,
+                backoff,
+            )
+            state.complete(chunk)
+
+        with ThreadPoolExecutor(n_jobs) as pool:
+            for future in [pool.submit(fetch, c) for c in chunks]:
+                future.result()
+    else:
+        _with_retries(
+            lambda: _download_stream(location, part, timeout), retries, backoff
+        )
+
+    if checksum is not None:
+        algorithm, expected = checksum
+        observed = _hash_file(part, algorithm)
+        if observed != expected:
+            # The data cannot be trusted, so the next attempt starts over
+            os.remove(part)
+            if os.path.exists(state_fp):
+                os.remove(state_fp)
+            raise ValueError(
+                f"The checksum of {url} ({algorithm}:{observed}) does not "
+                f"match the expected checksum ({algorithm}:{expected})."
+            )
+
+    os.replace(part, dest)
+    if os.path.exists(state_fp):
+        os.remove(state_fp)
+    return dest
+
+
+def cached_download(url, cache_dir, checksum=None, **kwargs):
+    """
+    Download a file into a cache unless it is already there.
+
+    Files are keyed by their URL. A cached file is verified against the
+    checksum (if given) before it is reused, and downloaded again if it
+    does not match. Interrupted downloads are resumed.
+
+    Args:
+    url (str): The URL to download.
+    cache_dir (str): The directory holding downloaded files.
+    checksum (tuple): Expected (algorithm, hex digest) of the file.
+    **kwargs: Passed to 'download'.
+
+    Returns:
+    str: The path of the cached file.
+    """
+
+    key = hashlib.sha256(url.encode()).hexdigest()[:32]
+    dest = os.path.join(cache_dir, key)
+    if os.path.exists(dest):
+        if checksum is None or _hash_file(dest, checksum[0]) == checksum[1]:
+            print(f"Using the cached download of {url}.")
+            return dest
+        os.remove(dest)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    return download(url, dest, checksum=checksum, **kwargs)
@@ -0,0 +1,248 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import contextlib
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+
+HEARTBEAT_INTERVAL = 60.0
+
+
+def read_proc_stats():
+    """
+    Read the parent, CPU time and resident memory of all processes.
+
+    Returns:
+    dict: (ppid, cpu seconds, rss bytes) keyed by pid; empty where /proc is
+        not available.
+    """
+
+    ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    stats = {}
+    try:
+        pids = [int(p) for p in os.listdir("/proc") if p.isdigit()]
+    except FileNotFoundError:
+        return stats
+
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as fh:
+                stat = fh.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, so fields are split after it
+        fields = stat[stat.rindex(")") + 2 :].split()
+        stats[pid] = (
+            int(fields[1]),
+            (int(fields[11]) + int(fields[12])) / ticks,
+            int(fields[21]) * page_size,
+        )
+    return stats
+
+
+def process_tree_usage(root_pid=None):
+    """
+    Measure the current resource use of a process and all its descendants.
+
+    Args:
+    root_pid (int): The root of the tree. Defaults to the current process.
+
+    Returns:
+    dict: Number of processes, summed CPU seconds and resident memory (MB).
+    """
+
+    root_pid = root_pid or os.getpid()
+    stats = read_proc_stats()
+    children = {}
+    for pid, (ppid, _, _) in stats.items():
+        children.setdefault(ppid, []).append(pid)
+
+    tree, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        if pid in stats:
+            tree.append(pid)
+            stack.extend(children.get(pid, []))
+
+    return {
+        "n_processes": len(tree),
+        "cpu_seconds": round(sum(stats[p][1] for p in tree), 1),
+        "rss_mb": round(sum(stats[p][2] for p in tree) / 2**20, 1),
+    }
+
+
+class EventStream:
+    """
+    Emit structured progress events as JSON lines.
+
+    Events are appended to a file and/or passed to a callback as dicts.
+    Every event has a "time" (ISO 8601, UTC), an "event" name and a
+    "source" identifying the emitting process. A stream without file and
+    callback is inactive and all of its methods are no-ops, so callers do
+    not need to check whether progress reporting was requested.
+
+    While started, a heartbeat with the current resource use of the
+    process tree is emitted every 'heartbeat_interval' seconds. Additional
+    heartbeat fields can be registered in 'probes' as name -> callable.
+    Fields given as 'tags' (e.g., the partition of a run) are added to
+    every event, so that several runs can share the same file.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        callback=None,
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+        tags=None,
+    ):
+        self.path = path
+        self.callback = callback
+        self.heartbeat_interval = heartbeat_interval
+        self.source = f"{socket.gethostname()}:{os.getpid()}"
+        self.tags = tags or {}
+        self.probes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = time.monotonic()
+        self._total = None
+        self._processed = 0
+
+    @property
+    def active(self):
+        return self.path is not None or self.callback is not None
+
+    def emit(self, event, **fields):
+        if not self.active:
+            return
+        record = {
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "event": event,
+            "source": self.source,
+            **self.tags,
+            **fields,
+        }
+        with self._lock:
+            if self.path is not None:
+                # Lines are appended in a single write, so that several
+                # processes can share the same file
+                with open(self.path, "a") as fh:
+                    fh.write(json.dumps(record) + "\n")
+            if self.callback is not None:
+                self.callback(record)
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """Emits "stage_started" and "stage_finished" around a block."""
+        start = time.monotonic()
+        self.emit("stage_started", stage=name, **fields)
+        try:
+            yield
+        except BaseException as e:
+            self.emit(
+                "stage_finished",
+                stage=name,
+                status="failed",
+                error=str(e) or type(e).__name__,
+                duration_seconds=round(time.monotonic() - start, 3),
+                **fields,
+            )
+            raise
+        self.emit(
+            "stage_finished",
+            stage=name,
+            status="ok",
+            duration_seconds=round(time.monotonic() - start, 3),
+            **fields,
+        )
+
+    def set_total(self, n_contigs):
+        """Sets the number of contigs to process and emits the progress."""
+        with self._lock:
+            self._total, self._processed = n_contigs, 0
+            self._start = time.monotonic()
+        self._emit_progress()
+
+    def advance(self, n_contigs):
+        """Records that 'n_contigs' more contigs were processed."""
+        with self._lock:
+            self._processed += n_contigs
+        self._emit_progress()
+
+    def finish(self):
+        """Records that all remaining contigs were processed."""
+        with self._lock:
+            if self._total is None or self._processed >= self._total:
+                return
+            self._processed = self._total
+        self._emit_progress()
+
+    def steps(self, done, total):
+        """Emits the number of finished steps of a workflow (e.g., Snakemake)."""
+        self.emit("steps", steps_done=done, steps_total=total)
+
+    def _emit_progress(self):
+        with self._lock:
+            processed, total = self._processed, self._total
+            elapsed = time.monotonic() - self._start
+
+        # The ETA assumes that the remaining contigs take as long as the
+        # ones processed so far
+        eta = None
+        if total is not None and processed:
+            eta = round(elapsed / processed * (total - processed), 1)
+
+        self.emit(
+            "progress",
+            contigs_processed=processed,
+            contigs_remaining=None if total is None else total - processed,
+            eta_seconds=eta,
+        )
+
+    def heartbeat(self):
+        fields = process_tree_usage()
+        fields["elapsed_seconds"] = round(time.monotonic() - self._start, 1)
+        fields["load_1m"] = os.getloadavg()[0]
+        for name, probe in self.probes.items():
+            try:
+                fields[name] = probe()
+            except Exception:
+                fields[name] = None
+        self.emit("heartbeat", **fields)
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self.heartbeat()
+
+    def start(self):
+        if self.active and self.heartbeat_interval:
+            self._thread = threading.Thread(target=self._beat, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def count_fasta_records(fasta_fp):
+    """Counts the records of a FASTA file without parsing the sequences."""
+    with open(fasta_fp, "rb") as fh:
+        return sum(1 for line in fh if line.startswith(b">"))
@@ -0,0 +1,338 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import io
+import mmap
+import os
+import shutil
+from collections import namedtuple
+
+from q2_virsorter2._compression import (
+    BgzfReader,
+    BgzfWriter,
+    is_bgzf,
+    is_gzip,
+    open_compressed,
+    write_gzi,
+)
+
+# A single line of a samtools-compatible FASTA index (.fai)
+FaidxRecord = namedtuple(
+    "FaidxRecord", ["name", "length", "offset", "linebases", "linewidth"]
+)
+
+
+class _FastaIndexer:
+    """Builds the index records of FASTA lines fed to it in order."""
+
+    def __init__(self):
+        self.records = []
+        self._pos = 0
+        self._record = None
+        self._last_line_short = False
+
+    def feed(self, line):
+        record = self._record
+        if line.startswith(b">"):
+            self._finish_record()
+            self._record = {
+                "name": line[1:].split(None, 1)[0].decode(),
+                "length": 0,
+                "offset": self._pos + len(line),
+                "linebases": 0,
+                "linewidth": 0,
+            }
+            self._last_line_short = False
+        elif record is not None:
+            bases = len(line.rstrip(b"\r\n"))
+            if not record["linebases"]:
+                record["linebases"], record["linewidth"] = bases, len(line)
+            elif bases and (self._last_line_short or bases > record["linebases"]):
+                raise ValueError(
+                    f"Different line length in sequence '{record['name']}'."
+                )
+            self._last_line_short = self._last_line_short or bases < record["linebases"]
+            record["length"] += bases
+        elif line.strip():
+            raise ValueError("FASTA file does not start with a header line.")
+        self._pos += len(line)
+
+    def _finish_record(self):
+        if self._record is not None:
+            self.records.append(FaidxRecord(**self._record))
+            self._record = None
+
+    def finish(self):
+        """Completes the last record and returns all of them."""
+        self._finish_record()
+        return self.records
+
+
+def _index_records(fh, out=None):
+    """Yields index records of a binary FASTA stream in a single pass.
+
+    If 'out' is given, every line read is also written to it, so that a
+    file can be copied and indexed at the same time.
+    """
+    indexer = _FastaIndexer()
+    for line in fh:
+        if out is not None:
+            out.write(line)
+        indexer.feed(line)
+        # Records are complete once the next header was read
+        yield from indexer.records
+        indexer.records.clear()
+    yield from indexer.finish()
+
+
+def iter_fasta(fh):
+    """Yields (name, sequence) pairs of a binary FASTA stream."""
+    name, lines = None, []
+    for line in fh:
+        if line.startswith(b">"):
+            if name is not None:
+                yield name, b"".join(lines)
+            name, lines = line[1:].split(None, 1)[0].decode(), []
+        elif name is not None:
+            lines.append(line.rstrip(b"\r\n"))
+    if name is not None:
+        yield name, b"".join(lines)
+
+
+def write_fasta_index(records, index_path):
+    """Writes index records in the samtools .fai layout."""
+    with open(index_path, "w") as fh:
+        for rec in records:
+            fh.write("\t".join(map(str, rec)) + "\n")
+
+
+def build_fasta_index(fasta_path, index_path, copy_to=None):
+    """
+    Index a FASTA file with a single streaming pass.
+
+    Args:
+    fasta_path (str): The FASTA file to index.
+    index_path (str): Where to write the .fai index.
+    copy_to (str): Optional path that receives a copy of the FASTA file,
+        written during the same pass.
+
+    Returns:
+    int: The number of indexed sequences.
+    """
+
+    with open(fasta_path, "rb") as fh:
+        if copy_to is None:
+            records = list(_index_records(fh))
+        else:
+            with open(copy_to, "wb") as out:
+                records = list(_index_records(fh, out))
+    write_fasta_index(records, index_path)
+    return len(records)
+
+
+class BgzfFastaWriter(io.RawIOBase):
+    """
+    Write FASTA records as a BGZF file, indexing them while they are written.
+
+    The records are compressed by a 'BgzfWriter' and the .fai and .gzi
+    indices (compatible with "samtools faidx") are written next to the
+    compressed file once the writer is closed.
+    """
+
+    def __init__(self, bgzf_path, n_jobs=1):
+        self.path = str(bgzf_path)
+        self.n_records = 0
+        self._writer = BgzfWriter(self.path, n_jobs=n_jobs)
+        self._indexer = _FastaIndexer()
+        self._partial = b""
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._writer.write(data)
+        # Only complete lines are indexed, the rest waits for the next write
+        end = data.rfind(b"\n") + 1
+        if end:
+            for line in io.BytesIO(self._partial + data[:end]):
+                self._indexer.feed(line)
+            self._partial = data[end:]
+        else:
+            self._partial += data
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._writer.close()
+            if self._partial:
+                self._indexer.feed(self._partial)
+            records = self._indexer.finish()
+            write_fasta_index(records, f"{self.path}.fai")
+            write_gzi(self._writer.offsets, f"{self.path}.gzi")
+            self.n_records = len(records)
+        finally:
+            super().close()
+
+
+def compress_fasta(fasta_fh, bgzf_path, n_jobs=1):
+    """
+    Compress a FASTA stream into an indexed BGZF file in a single pass.
+
+    Records are compressed in a thread pool as they are read, and the .fai
+    and .gzi indices (compatible with "samtools faidx") are written next to
+    the compressed file.
+
+    Args:
+    fasta_fh (io.BufferedReader): The FASTA file, opened in binary mode.
+    bgzf_path (str): The compressed file to write.
+    n_jobs (int): Number of threads compressing blocks.
+
+    Returns:
+    int: The number of records.
+    """
+
+    with BgzfFastaWriter(bgzf_path, n_jobs=n_jobs) as writer:
+        shutil.copyfileobj(fasta_fh, writer)
+    return writer.n_records
+
+
+def read_fasta_index(index_path):
+    """Reads a .fai index into an (insertion-ordered) dict of records."""
+    index = {}
+    with open(index_path) as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            name, *fields = line.rstrip("\n").split("\t")
+            index[name] = FaidxRecord(name, *map(int, fields[:4]))
+    return index
+
+
+class IndexedFasta:
+    """
+    Random access to the sequences of an indexed FASTA file.
+
+    The file is memory-mapped, so fetching a sequence, a region of it or
+    a subset of records only touches the bytes that are requested. BGZF
+    compressed files with a .gzi index (as written by 'compress_fasta' or
+    "bgzip -i") are read block by block instead.
+    """
+
+    def __init__(self, fasta_path, index_path=None, gzi_path=None):
+        self.fasta_path = str(fasta_path)
+        self.index = read_fasta_index(index_path or self.fasta_path + ".fai")
+        gzi_path = gzi_path or self.fasta_path + ".gzi"
+        self._fh = open(self.fasta_path, "rb")
+        if os.path.exists(gzi_path) and is_bgzf(self.fasta_path):
+            self._mm = BgzfReader(self.fasta_path, gzi_path)
+        elif os.path.getsize(self.fasta_path):
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # Empty files cannot be memory-mapped
+            self._mm = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def close(self):
+        if isinstance(self._mm, (mmap.mmap, BgzfReader)):
+            self._mm.close()
+        self._fh.close()
+
+    def _byte_offset(self, rec, pos):
+        """Converts a 0-based sequence position into a file offset."""
+        lines, col = divmod(pos, rec.linebases) if rec.linebases else (0, 0)
+        return rec.offset + lines * rec.linewidth + col
+
+    def fetch(self, name, start=0, end=None):
+        """
+        Fetch a sequence or a region of it.
+
+        Args:
+        name (str): The sequence ID.
+        start (int): 0-based start of the region (inclusive).
+        end (int): 0-based end of the region (exclusive). Defaults to the
+            end of the sequence.
+
+        Returns:
+        str: The requested (sub)sequence.
+        """
+
+        rec = self.index[name]
+        end = rec.length if end is None else min(end, rec.length)
+        start = max(start, 0)
+        if start >= end:
+            return ""
+        raw = self._mm[self._byte_offset(rec, start) : self._byte_offset(rec, end)]
+        return raw.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    def record_span(self, name):
+        """Returns the byte span of a full record, including its header."""
+        rec = self.index[name]
+        # Descriptions may contain ">", so look for the end of the previous
+        # line instead (the header itself ends right before 'rec.offset')
+        header_start = self._mm.rfind(b"\n", 0, rec.offset - 1) + 1
+        return header_start, self._byte_offset(rec, rec.length)
+
+    def write_records(self, names, fh):
+        """Copies the full records of the given IDs to a binary file handle."""
+        for name in names:
+            start, end = self.record_span(name)
+            record = self._mm[start:end]
+            fh.write(record if record.endswith(b"\n") else record + b"\n")
+
+
+class SequenceFile:
+    """
+    A FASTA file that may be gzip (or BGZF) compressed.
+
+    Compressed files are only ever read as a stream, so no uncompressed
+    copy of them is written. Uncompressed files may come with their .fai
+    index ('index_path'), which is then used instead of indexing again.
+
+    Files that do not exist yet are created with 'create', compressed if
+    their name ends in ".gz". 'owner' keeps the directory format holding
+    the file (and its temporary directory) alive, so that actions can
+    return the file as the view of an output.
+    """
+
+    def __init__(self, path, index_path=None, owner=None):
+        self.path = str(path)
+        self.index_path = str(index_path) if index_path else None
+        self.owner = owner
+        if os.path.exists(self.path):
+            self.compressed = is_gzip(self.path)
+        else:
+            self.compressed = self.path.endswith(".gz")
+
+    def __str__(self):
+        return self.path
+
+    def open(self, n_jobs=1):
+        """Opens the (decompressed) sequences as a binary stream."""
+        if self.compressed:
+            return open_compressed(self.path, n_jobs=n_jobs)
+        return open(self.path, "rb")
+
+    def create(self, n_jobs=1):
+        """Opens the file for writing, as indexed BGZF if compressed."""
+        if self.compressed:
+            return BgzfFastaWriter(self.path, n_jobs=n_jobs)
+        return open(self.path, "wb")
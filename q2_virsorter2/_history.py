@@ -0,0 +1,466 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""A local history of run metrics, for spotting performance regressions.
+
+Recording is opt-in: it is enabled by pointing the Q2_VIRSORTER2_HISTORY
+environment variable at an SQLite file, which is created if needed. Every
+invocation of a recorded action then appends its input size, database
+fingerprint (a hash of its contents), parameters, plugin and VirSorter2
+versions, stage timings and peak memory.
+
+The history is reported with::
+
+    python -m q2_virsorter2._history report [--action classify]
+
+which lists trends by version and flags runs that were slower than the
+earlier runs on comparable inputs.
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import resource
+import socket
+import sqlite3
+import statistics
+import sys
+import time
+from importlib import metadata
+
+from q2_virsorter2._compression import get_cache_dir
+
+HISTORY_ENV = "Q2_VIRSORTER2_HISTORY"
+# Runs with a z-score above this are flagged as slower than their baseline
+Z_THRESHOLD = 2.0
+# Baselines need a few runs, so that their spread is meaningful
+MIN_BASELINE = 3
+# Inputs within this factor of each other are considered comparable
+SIZE_FACTOR = 2.0
+# Parameters that do not affect the work done and are not compared
+IGNORED_PARAMETERS = ("progress_file", "worker_socket")
+# Fingerprints of databases, kept in the cache directory
+DIGESTS_FILE = "database-digests.json"
+# Number of databases whose fingerprints are kept
+MAX_DIGESTS = 64
+CHUNK_SIZE = 2**20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    action TEXT NOT NULL,
+    status TEXT NOT NULL,
+    host TEXT,
+    input_bytes INTEGER,
+    n_contigs INTEGER,
+    database_checksum TEXT,
+    parameters TEXT,
+    plugin_version TEXT,
+    virsorter2_version TEXT,
+    duration_seconds REAL,
+    peak_memory_mb REAL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    stage TEXT NOT NULL,
+    n_calls INTEGER NOT NULL,
+    duration_seconds REAL NOT NULL,
+    PRIMARY KEY (run_id, stage)
+);
+"""
+
+
+def _file_digest(fp):
+    digest = hashlib.sha256()
+    with open(fp, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_digests(digests_fp):
+    try:
+        with open(digests_fp) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _database_files(database_path):
+    for root, dirs, files in os.walk(database_path):
+        dirs.sort()
+        for name in sorted(files):
+            fp = os.path.join(root, name)
+            yield fp, os.path.relpath(fp, database_path)
+
+
+def database_manifest(database_path):
+    """
+    Identify a database by the names and sizes of its files.
+
+    Nothing is read from the files, so this is cheap enough to be computed
+    on every run, and copies of a database (e.g., every extraction of the
+    same artifact) get the same identifier.
+
+    Args:
+    database_path (str): Path to a VirSorter2 database directory.
+
+    Returns:
+    str: The first 16 hex digits of the identifier.
+    """
+
+    digest = hashlib.sha256()
+    for fp, rel_path in _database_files(database_path):
+        digest.update(f"{rel_path}\t{os.path.getsize(fp)}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def database_checksum(database_path, cache_dir=None):
+    """
+    Fingerprint a database by the contents of its files.
+
+    Fingerprints are kept in the cache directory, keyed by the manifest of
+    the database (see 'database_manifest'), so the files of every database
+    are only read the first time it is seen, wherever it was extracted to.
+    Only the most recently used MAX_DIGESTS fingerprints are kept. Files of
+    a database are not expected to be edited in place; an edit that keeps
+    the size of every file is not noticed until its fingerprint is evicted.
+
+    Args:
+    database_path (str): Path to a VirSorter2 database directory.
+    cache_dir (str): Where the fingerprints are kept. Defaults to the
+        cache of decompressed databases.
+
+    Returns:
+    str: The first 16 hex digits of the fingerprint.
+    """
+
+    digests_fp = os.path.join(cache_dir or get_cache_dir(), DIGESTS_FILE)
+    digests = _read_digests(digests_fp)
+    manifest = database_manifest(database_path)
+
+    cached = digests.get(manifest)
+    if cached is None:
+        digest = hashlib.sha256()
+        for fp, rel_path in _database_files(database_path):
+            digest.update(f"{rel_path}\t{_file_digest(fp)}\n".encode())
+        cached = {"checksum": digest.hexdigest()[:16]}
+    digests[manifest] = {**cached, "used": time.time()}
+
+    # Only the most recently used fingerprints are kept
+    if len(digests) > MAX_DIGESTS:
+        by_use = sorted(digests, key=lambda k: digests[k]["used"], reverse=True)
+        digests = {k: digests[k] for k in by_use[:MAX_DIGESTS]}
+
+    # Written atomically, concurrent runs at most fingerprint again
+    try:
+        os.makedirs(os.path.dirname(digests_fp), exist_ok=True)
+        tmp_fp = f"{digests_fp}.{os.getpid()}.tmp"
+        with open(tmp_fp, "w") as fh:
+            json.dump(digests, fh)
+        os.replace(tmp_fp, digests_fp)
+    except OSError:
+        pass
+    return cached["checksum"]
+
+
+def virsorter2_version():
+    try:
+        return metadata.version("virsorter")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _peak_memory_mb():
+    # ru_maxrss is in KB on Linux and covers the lifetime of the process;
+    # for children, it is the largest one that has finished
+    return (
+        max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        )
+        / 2**10
+    )
+
+
+class RunHistory:
+    """An SQLite store of run records. Several processes may share it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def add(self, run, stages=None):
+        """
+        Append a run record.
+
+        Args:
+        run (dict): Values of the columns of the "runs" table.
+        stages (dict): (number of calls, summed seconds) by stage name.
+
+        Returns:
+        int: The id of the record.
+        """
+
+        run = {**run, "parameters": json.dumps(run.get("parameters"), sort_keys=True)}
+        columns = ", ".join(run)
+        values = ", ".join(f":{k}" for k in run)
+        with self._conn:
+            cursor = self._conn.execute(
+                f"INSERT INTO runs ({columns}) VALUES ({values})", run
+            )
+            run_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO stages VALUES (?, ?, ?, ?)",
+                [(run_id, name, n, s) for name, (n, s) in (stages or {}).items()],
+            )
+        return run_id
+
+    def runs(self, action=None):
+        """Returns the run records (oldest first) with their stage timings."""
+        query = "SELECT * FROM runs"
+        args = ()
+        if action is not None:
+            query, args = query + " WHERE action = ?", (action,)
+        records = [
+            dict(row) for row in self._conn.execute(query + " ORDER BY id", args)
+        ]
+        stages = {}
+        for row in self._conn.execute("SELECT * FROM stages"):
+            stages.setdefault(row["run_id"], {})[row["stage"]] = row["duration_seconds"]
+        for record in records:
+            record["parameters"] = json.loads(record["parameters"] or "null")
+            record["stages"] = stages.get(record["id"], {})
+        return records
+
+
+class RunRecorder:
+    """
+    Record the metrics of a single invocation of an action.
+
+    The recorder is a context manager around the invocation. Stage timings
+    and peak memory are collected from the progress events passed to
+    'on_event' (see EventStream). If no history file is configured, the
+    recorder is inactive and does nothing. Failures to write the history
+    are reported but never fail the run.
+    """
+
+    def __init__(
+        self, action, parameters=None, input_fp=None, database=None, path=None
+    ):
+        self.action = action
+        self.parameters = dict(parameters or {})
+        self.input_fp = input_fp
+        self.database = database
+        self.n_contigs = None
+        self.path = path or os.environ.get(HISTORY_ENV) or None
+        self.stages = {}
+        self._peak_mb = 0.0
+        self._start = None
+        self._started = None
+
+    @property
+    def active(self):
+        return self.path is not None
+
+    def on_event(self, record):
+        event = record["event"]
+        if event == "stage_finished":
+            n, seconds = self.stages.get(record["stage"], (0, 0.0))
+            self.stages[record["stage"]] = (n + 1, seconds + record["duration_seconds"])
+        elif event == "heartbeat":
+            self._peak_mb = max(self._peak_mb, record.get("rss_mb") or 0)
+        elif event == "memory_usage":
+            self._peak_mb = max(self._peak_mb, record.get("peak_mb") or 0)
+
+    def __enter__(self):
+        self._started = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if self.active:
+            self.write("failed" if exc_type else "ok")
+        return False
+
+    def write(self, status):
+        # Recording must never fail the run itself
+        try:
+            run = {
+                "started": self._started,
+                "action": self.action,
+                "status": status,
+                "host": socket.gethostname(),
+                "input_bytes": (
+                    os.path.getsize(self.input_fp) if self.input_fp else None
+                ),
+                "n_contigs": self.n_contigs,
+                "database_checksum": (
+                    database_checksum(str(self.database)) if self.database else None
+                ),
+                "parameters": self.parameters,
+                "plugin_version": _plugin_version(),
+                "virsorter2_version": virsorter2_version(),
+                "duration_seconds": round(time.monotonic() - self._start, 3),
+                "peak_memory_mb": round(max(self._peak_mb, _peak_memory_mb()), 1),
+            }
+            with RunHistory(self.path) as history:
+                history.add(run, self.stages)
+        except Exception as e:
+            print(f"The run could not be recorded in {self.path}: {e}")
+
+
+def _plugin_version():
+    from q2_virsorter2 import __version__
+
+    return __version__
+
+
+def _comparable(run):
+    parameters = {
+        k: v
+        for k, v in (run["parameters"] or {}).items()
+        if k not in IGNORED_PARAMETERS
+    }
+    return run["action"], run["database_checksum"], json.dumps(parameters)
+
+
+def _cost(run):
+    # Runtimes are compared per MB of input, which evens out the size
+    # differences between comparable inputs
+    if run["input_bytes"]:
+        return run["duration_seconds"] / max(run["input_bytes"] / 2**20, 1e-3)
+    return run["duration_seconds"]
+
+
+def _similar_size(a, b):
+    if not a or not b:
+        return a == b
+    return max(a, b) / min(a, b) <= SIZE_FACTOR
+
+
+def score_runs(runs, min_baseline=MIN_BASELINE):
+    """
+    Compute the z-score of every run against its historical baseline.
+
+    The baseline of a run consists of the earlier successful runs of the
+    same action with the same database and parameters, on inputs of similar
+    size. Runs with a too small baseline (or one without spread) get a
+    z-score of None.
+
+    Args:
+    runs (list): Run records, oldest first (see 'RunHistory.runs').
+    min_baseline (int): The minimal number of runs in a baseline.
+
+    Returns:
+    list: The z-score of every run, in the order of 'runs'.
+    """
+
+    scores, earlier = [], {}
+    for run in runs:
+        baseline = [
+            _cost(r)
+            for r in earlier.get(_comparable(run), [])
+            if _similar_size(r["input_bytes"], run["input_bytes"])
+        ]
+        z = None
+        if run["status"] == "ok" and len(baseline) >= min_baseline:
+            sd = statistics.stdev(baseline)
+            if sd > 0:
+                z = (_cost(run) - statistics.mean(baseline)) / sd
+        scores.append(z)
+        if run["status"] == "ok":
+            earlier.setdefault(_comparable(run), []).append(run)
+    return scores
+
+
+def _format_mb(n_bytes):
+    return "-" if n_bytes is None else f"{n_bytes / 2**20:.1f}"
+
+
+def report(runs, threshold=Z_THRESHOLD, last=20, out=None):
+    """Prints the trends by version and the last runs, flagging slow ones."""
+    out = out or sys.stdout
+    scores = score_runs(runs)
+
+    trends = {}
+    for run in runs:
+        if run["status"] == "ok":
+            key = (run["action"], run["plugin_version"], run["virsorter2_version"])
+            trends.setdefault(key, []).append(run)
+    print("Median runtime by version:", file=out)
+    print("action\tplugin\tvirsorter2\truns\ts/MB (or s)\tpeak MB", file=out)
+    for (action, plugin, vs2), group in trends.items():
+        print(
+            f"{action}\t{plugin}\t{vs2}\t{len(group)}\t"
+            f"{statistics.median(map(_cost, group)):.2f}\t"
+            f"{statistics.median(r['peak_memory_mb'] for r in group):.0f}",
+            file=out,
+        )
+
+    print(f"\nLast {min(last, len(runs))} run(s):", file=out)
+    print("id\tstarted\taction\tstatus\tinput MB\ts\tpeak MB\tz", file=out)
+    n_slow = 0
+    for run, z in list(zip(runs, scores))[-last:]:
+        slow = z is not None and z > threshold
+        n_slow += slow
+        print(
+            f"{run['id']}\t{run['started'][:19]}\t{run['action']}\t"
+            f"{run['status']}\t{_format_mb(run['input_bytes'])}\t"
+            f"{run['duration_seconds']:.1f}\t{run['peak_memory_mb']:.0f}\t"
+            + ("-" if z is None else f"{z:.2f}")
+            + ("\tSLOWER" if slow else ""),
+            file=out,
+        )
+    print(f"\n{n_slow} run(s) slower than their baseline (z > {threshold}).", file=out)
+    return n_slow
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report the recorded VirSorter2 run history."
+    )
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument(
+        "--history",
+        default=os.environ.get(HISTORY_ENV),
+        help=f"The SQLite history file (default: ${HISTORY_ENV}).",
+    )
+    parser.add_argument("--action", help="Only report runs of this action.")
+    parser.add_argument("--last", type=int, default=20, help="Runs to list.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=Z_THRESHOLD,
+        help="Flag runs with a z-score above this value.",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.history or not os.path.exists(args.history):
+        parser.error(f"No history found; set ${HISTORY_ENV} or --history.")
+    with RunHistory(args.history) as history:
+        runs = history.runs(args.action)
+    report(runs, threshold=args.threshold, last=args.last)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""A process-wide cache of parsed HMM profiles.
+
+Profiles are keyed by the path, size and modification time of their file,
+so a file that changes is parsed again. Entries are evicted in least
+recently used order once their estimated size exceeds the memory budget,
+which can be set with the Q2_VIRSORTER2_HMM_CACHE_MB environment variable.
+
+The worker (see _worker.py) loads the profiles of its database through
+this cache, and the hmmsearch steps of the runs it executes are served
+from them. Its jobs run in threads, so they all share the one copy of the
+process. HMMFormat validation only reads the first profile of a file and
+does not use the cache.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from pyhmmer.plan7 import Background, HMMFile, Profile
+
+DEFAULT_BUDGET_MB = 2048
+# Profiles are configured for this target length and reconfigured by the
+# search pipeline for every target sequence
+_TARGET_LENGTH = 400
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return os.path.realpath(path), stat.st_size, stat.st_mtime_ns
+
+
+def _optimize(hmms):
+    """Converts HMMs into the striped profiles searched by HMMER."""
+    profiles = []
+    for hmm in hmms:
+        background = Background(hmm.alphabet)
+        profile = Profile(hmm.M, hmm.alphabet)
+        profile.configure(hmm, background, _TARGET_LENGTH)
+        profiles.append(profile.to_optimized())
+    return profiles
+
+
+class HMMCache:
+    """
+    A thread-safe LRU cache of the profiles of HMM files.
+
+    Profiles are cached either as parsed HMMs or as optimized profiles,
+    which skip the conversion HMMER does before every search. Optimized
+    profiles are modified while they are searched, so every search needs
+    its own copy (see 'get').
+
+    The size of an entry is estimated from the size of its file, which is
+    larger than the parsed HMMs. The most recently used entry is kept even
+    if it exceeds the budget on its own.
+    """
+
+    def __init__(self, budget_mb=DEFAULT_BUDGET_MB):
+        self.budget = budget_mb * 2**20
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        key = _file_key(path)
+        return any(file_key == key for file_key, _ in self._entries)
+
+    def get(self, path, optimized=False):
+        """
+        Get the profiles of an HMM file, parsing it if it is not cached.
+
+        Args:
+        path (str): The HMM file.
+        optimized (bool): Return optimized profiles instead of HMMs. The
+            cached profiles are copied, so they can be searched right away.
+
+        Returns:
+        list: The HMMs or optimized profiles of the file, in file order.
+        """
+
+        profiles = self._load(path, optimized)
+        return [p.copy() for p in profiles] if optimized else profiles
+
+    def _load(self, path, optimized):
+        key = (_file_key(path), optimized)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Files are parsed outside of the lock, so that other files can be
+        # served meanwhile
+        with HMMFile(path) as fh:
+            profiles = list(fh)
+        if optimized:
+            profiles = _optimize(profiles)
+        self._add(key, profiles, key[0][1])
+        return profiles
+
+    def _add(self, key, profiles, size):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (profiles, size)
+            self.size += size
+            while self.size > self.budget and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """Returns the cache shared by the whole process."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            budget = os.environ.get("Q2_VIRSORTER2_HMM_CACHE_MB", DEFAULT_BUDGET_MB)
+            _CACHE = HMMCache(int(budget))
+        return _CACHE
+
+
+def load_hmms(path, optimized=False):
+    """Returns the profiles of an HMM file through the process-wide cache."""
+    return get_cache().get(path, optimized=optimized)
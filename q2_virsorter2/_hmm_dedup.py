@@ -0,0 +1,315 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Store HMM profiles that occur in several files of a database only once.
+
+Profiles are compared by their text without their name, so copies that
+were renamed are deduplicated as well. Profiles occurring more than once
+are moved to "hmm/shared/shared.hmm", named by their digest, and the
+membership index "hmm/shared/membership.tsv" records where every copy was:
+
+    hmm_file    position    profile    shared_profile
+
+Profiles occurring once stay in their files, in their original order.
+Files of which every profile is shared are left out entirely. The original
+files can be restored byte for byte with 'expand_database', which is what
+"virsorter run" needs.
+"""
+
+import glob
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+import pandas as pd
+
+from q2_virsorter2._compression import (
+    get_cache_dir,
+    hold_cache_entry,
+    prune_cache,
+    touch_cache_entry,
+)
+from q2_virsorter2._history import database_checksum
+from q2_virsorter2._utils import link_or_copy
+
+SHARED_HMM = os.path.join("hmm", "shared", "shared.hmm")
+MEMBERSHIP_FILE = os.path.join("hmm", "shared", "membership.tsv")
+MEMBERSHIP_COLUMNS = ["hmm_file", "position", "profile", "shared_profile"]
+
+
+def iter_hmm_records(hmm_fp):
+    """Yields the text of every profile of an HMM file, including "//"."""
+    record = []
+    with open(hmm_fp, "rb") as fh:
+        for line in fh:
+            record.append(line)
+            if line.rstrip() == b"//":
+                yield b"".join(record)
+                record = []
+    # A trailing profile without terminator is kept as it is
+    if record:
+        yield b"".join(record)
+
+
+# The name of a profile, between what precedes and follows it on its line
+_NAME_LINE = re.compile(rb"^(NAME +)(\S*)(.*)$", re.DOTALL)
+
+
+def _is_name_line(line):
+    return line.startswith(b"NAME ")
+
+
+def profile_name(record):
+    for line in record.splitlines():
+        if _is_name_line(line):
+            return line[5:].strip().decode()
+    return ""
+
+
+def rename_profile(record, name):
+    """Replaces the name of a profile, keeping the rest of its NAME line."""
+    lines = record.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if _is_name_line(line):
+            prefix, _, suffix = _NAME_LINE.match(line).groups()
+            lines[i] = prefix + name.encode() + suffix
+            break
+    return b"".join(lines)
+
+
+def profile_digest(record):
+    """
+    Hashes a profile, ignoring its name.
+
+    The rest of the NAME line (spacing and line ending) is hashed, so that
+    the copies of a shared profile only differ by their names, which makes
+    renaming the shared profile restore every copy byte for byte.
+    """
+    digest = hashlib.sha256()
+    for line in record.splitlines(keepends=True):
+        if _is_name_line(line):
+            prefix, _, suffix = _NAME_LINE.match(line).groups()
+            line = prefix + suffix
+        digest.update(line)
+    return digest.hexdigest()[:32]
+
+
+def _hmm_files(database_path):
+    return sorted(
+        os.path.relpath(fp, database_path)
+        for fp in glob.glob(os.path.join(database_path, "hmm", "*", "*.hmm"))
+    )
+
+
+def is_deduplicated(database_path):
+    return os.path.isfile(os.path.join(str(database_path), MEMBERSHIP_FILE))
+
+
+def read_membership(database_path):
+    """
+    Read the membership index of a deduplicated database.
+
+    Returns:
+    dict: For every original HMM file, a dict of its shared profiles as
+        position -> (profile name, shared profile name).
+    """
+
+    membership = {}
+    df = pd.read_csv(
+        os.path.join(str(database_path), MEMBERSHIP_FILE),
+        sep="\t",
+        dtype={"position": int},
+        keep_default_na=False,
+    )
+    for hmm_file, position, profile, shared in df[MEMBERSHIP_COLUMNS].itertuples(
+        index=False
+    ):
+        membership.setdefault(hmm_file, {})[position] = (profile, shared)
+    return membership
+
+
+def deduplicate_database(src_path, dst_path):
+    """
+    Write a copy of a database in which duplicated profiles are stored once.
+
+    Files other than the HMM files are hard-linked where possible. The HMM
+    files are read twice (counting and writing), so that only the digests
+    are held in memory.
+
+    Args:
+    src_path (str): The database to deduplicate.
+    dst_path (str): The (existing, empty) directory to write.
+
+    Returns:
+    dict: The number of "profiles", "unique" profiles and profiles that
+        were "shared" by several files.
+    """
+
+    if is_deduplicated(src_path):
+        raise ValueError("The database has already been deduplicated.")
+
+    hmm_files = _hmm_files(src_path)
+    counts = {}
+    for hmm_file in hmm_files:
+        for record in iter_hmm_records(os.path.join(src_path, hmm_file)):
+            digest = profile_digest(record)
+            counts[digest] = counts.get(digest, 0) + 1
+
+    # Everything but the HMM files is taken over unchanged
+    for root, _, files in os.walk(src_path):
+        for name in files:
+            rel_path = os.path.relpath(os.path.join(root, name), src_path)
+            if rel_path not in hmm_files:
+                link_or_copy(
+                    os.path.join(src_path, rel_path), os.path.join(dst_path, rel_path)
+                )
+
+    shared = {k for k, n in counts.items() if n > 1}
+    if not shared:
+        for hmm_file in hmm_files:
+            link_or_copy(
+                os.path.join(src_path, hmm_file), os.path.join(dst_path, hmm_file)
+            )
+        return {"profiles": sum(counts.values()), "unique": len(counts), "shared": 0}
+
+    os.makedirs(os.path.dirname(os.path.join(dst_path, SHARED_HMM)))
+    written, rows = set(), []
+    with open(os.path.join(dst_path, SHARED_HMM), "wb") as shared_fh:
+        for hmm_file in hmm_files:
+            out = None
+            for position, record in enumerate(
+                iter_hmm_records(os.path.join(src_path, hmm_file))
+            ):
+                digest = profile_digest(record)
+                if digest in shared:
+                    rows.append((hmm_file, position, profile_name(record), digest))
+                    if digest not in written:
+                        shared_fh.write(rename_profile(record, digest))
+                        written.add(digest)
+                    continue
+                if out is None:
+                    out_fp = os.path.join(dst_path, hmm_file)
+                    os.makedirs(os.path.dirname(out_fp), exist_ok=True)
+                    out = open(out_fp, "wb")
+                out.write(record)
+            if out is not None:
+                out.close()
+
+    pd.DataFrame(rows, columns=MEMBERSHIP_COLUMNS).to_csv(
+        os.path.join(dst_path, MEMBERSHIP_FILE), sep="\t", index=False
+    )
+    return {
+        "profiles": sum(counts.values()),
+        "unique": len(counts),
+        "shared": len(shared),
+    }
+
+
+def _restore_hmm_files(src_path, dst_path, membership):
+    shared = {}
+    for record in iter_hmm_records(os.path.join(src_path, SHARED_HMM)):
+        shared[profile_name(record)] = record
+
+    hmm_files = set(_hmm_files(src_path)) - {SHARED_HMM}
+    for hmm_file in sorted(hmm_files | set(membership)):
+        positions = membership.get(hmm_file, {})
+        unique_fp = os.path.join(src_path, hmm_file)
+        unique = iter_hmm_records(unique_fp) if hmm_file in hmm_files else iter(())
+        out_fp = os.path.join(dst_path, hmm_file)
+        os.makedirs(os.path.dirname(out_fp), exist_ok=True)
+        with open(out_fp, "wb") as out:
+            for _, record in merge_positions(unique, positions):
+                if isinstance(record, tuple):
+                    name, digest = record
+                    record = rename_profile(shared[digest], name)
+                out.write(record)
+
+
+def merge_positions(unique, positions):
+    """
+    Restore the original order of the profiles of a file.
+
+    Args:
+    unique (iterable): The items of the profiles that were not shared, in
+        order.
+    positions (dict): The items of the shared profiles by their position.
+
+    Yields:
+    tuple: The position and item of every profile.
+    """
+
+    unique = iter(unique)
+    position, remaining = 0, len(positions)
+    while True:
+        if position in positions:
+            yield position, positions[position]
+            remaining -= 1
+        else:
+            item = next(unique, None)
+            if item is None:
+                if remaining == 0:
+                    return
+            else:
+                yield position, item
+        position += 1
+
+
+def expand_database(database_path, cache_dir=None):
+    """
+    Restore the original HMM files of a deduplicated database in the cache.
+
+    Expanded databases are keyed by the fingerprint of their contents
+    (see 'database_checksum'), so every version is expanded only once, and
+    are written to a temporary directory that is renamed once complete.
+    Files other than HMM profiles are hard linked where possible, so the
+    expanded copy mostly takes the space of the restored profiles. Like
+    decompressed databases, expanded ones are held for the life of the
+    process and otherwise evicted from the cache in least recently used
+    order (see 'hold_cache_entry' and 'prune_cache').
+
+    Args:
+    database_path (str): The deduplicated database.
+    cache_dir (str): The cache directory. See 'get_cache_dir'.
+
+    Returns:
+    str: Path of the expanded database.
+    """
+
+    database_path = str(database_path)
+    cache_dir = cache_dir or get_cache_dir()
+    key = f"expanded-{database_checksum(database_path, cache_dir)}"
+    target = os.path.join(cache_dir, key)
+    hold_cache_entry(target)
+    if os.path.isdir(target):
+        touch_cache_entry(target)
+        return target
+
+    partial = tempfile.mkdtemp(prefix=f"{key}.partial-", dir=cache_dir)
+    try:
+        shared_dir = os.path.dirname(SHARED_HMM)
+        for root, _, files in os.walk(database_path):
+            for name in files:
+                rel_path = os.path.relpath(os.path.join(root, name), database_path)
+                if os.path.dirname(rel_path) == shared_dir or rel_path.endswith(".hmm"):
+                    continue
+                link_or_copy(
+                    os.path.join(database_path, rel_path),
+                    os.path.join(partial, rel_path),
+                )
+        _restore_hmm_files(database_path, partial, read_membership(database_path))
+        os.rename(partial, target)
+    except OSError:
+        # Another process completed the same database first
+        if not os.path.isdir(target):
+            raise
+    finally:
+        if os.path.isdir(partial):
+            shutil.rmtree(partial)
+    prune_cache(cache_dir, keep=[target])
+    return target
@@ -0,0 +1,139 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""A stand-in for HMMER's hmmsearch that searches the profiles of a worker.
+
+"virsorter run" searches the proteins of every split with hmmsearch, which
+parses the HMM files again in every process. Runs executed by a worker
+(see _worker.py) find this script first on their PATH, so that these
+searches use the optimized profiles the worker keeps loaded. Invocations
+that it does not support, or that the worker fails to serve, are passed on
+to hmmsearch itself.
+"""
+
+import os
+import shutil
+import stat
+import sys
+
+# Socket of the worker serving the searches of the current run
+SOCKET_ENV = "Q2_VIRSORTER2_HMMSEARCH_SOCKET"
+# PATH without the stand-in, to find hmmsearch itself
+PATH_ENV = "Q2_VIRSORTER2_HMMSEARCH_PATH"
+
+# Options that are passed on to the search, and the type of their value
+_SEARCH_OPTIONS = {"-T": float, "-E": float, "--cpu": int}
+# Options without any effect on the table of hits
+_IGNORED_FLAGS = ("--noali", "--notextw")
+
+# The plugin is imported from where the worker imported it
+_SCRIPT = """#!{executable}
+import sys
+
+sys.path.insert(0, {package_dir!r})
+from q2_virsorter2._hmmsearch import main
+
+sys.exit(main())
+"""
+
+
+def parse_args(argv):
+    """
+    Parse the arguments of an hmmsearch invocation.
+
+    Only searches that write nothing but a table of hits per sequence
+    ("--tblout") are supported.
+
+    Args:
+    argv (list): The arguments passed to hmmsearch.
+
+    Returns:
+    dict: The arguments of the search, or None if they are not supported.
+    """
+
+    options, positional = {}, []
+    args = iter(argv)
+    for arg in args:
+        if arg in _IGNORED_FLAGS:
+            continue
+        if arg in _SEARCH_OPTIONS or arg in ("--tblout", "-o"):
+            value = next(args, None)
+            if value is None:
+                return None
+            options[arg] = value
+        elif arg.startswith("-") and arg != "-":
+            return None
+        else:
+            positional.append(arg)
+
+    # The main output can only be discarded, as it is not written
+    if "--tblout" not in options or options.get("-o", os.devnull) != os.devnull:
+        return None
+    if len(positional) != 2 or "-" in positional:
+        return None
+
+    try:
+        search_options = {
+            opt.lstrip("-"): _SEARCH_OPTIONS[opt](value)
+            for opt, value in options.items()
+            if opt in _SEARCH_OPTIONS
+        }
+    except ValueError:
+        return None
+    return {
+        "hmm_file": os.path.abspath(positional[0]),
+        "sequences": os.path.abspath(positional[1]),
+        "output": os.path.abspath(options["--tblout"]),
+        **search_options,
+    }
+
+
+def write_script(bin_dir):
+    """Writes the stand-in as an executable named hmmsearch into 'bin_dir'."""
+    os.makedirs(bin_dir, exist_ok=True)
+    script_fp = os.path.join(bin_dir, "hmmsearch")
+    with open(script_fp, "w") as fh:
+        fh.write(
+            _SCRIPT.format(
+                executable=sys.executable,
+                package_dir=os.path.dirname(os.path.dirname(__file__)),
+            )
+        )
+    os.chmod(script_fp, os.stat(script_fp).st_mode | stat.S_IXUSR | stat.S_IXGRP)
+    return script_fp
+
+
+def _exec_hmmsearch(argv):
+    hmmsearch = shutil.which("hmmsearch", path=os.environ.get(PATH_ENV))
+    if hmmsearch is None:
+        print("hmmsearch was not found on the PATH.", file=sys.stderr)
+        return 127
+    os.execv(hmmsearch, [hmmsearch, *argv])
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    socket_path = os.environ.get(SOCKET_ENV)
+
+    if args is not None and socket_path:
+        # Imported here, so that falling back to hmmsearch stays cheap
+        from q2_virsorter2._worker import submit_job
+
+        try:
+            submit_job(socket_path, "tblout", **args)
+            return 0
+        except Exception as e:
+            print(
+                f"The worker could not run the search, running hmmsearch: {e}",
+                file=sys.stderr,
+            )
+    return _exec_hmmsearch(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import glob
+import math
+import os
+import threading
+
+from q2_virsorter2._events import read_proc_stats
+
+# Every job is assumed to need at least Snakemake's default of 1 GB and
+# twice the size of its input (a split of the contigs or of the proteins).
+MIN_JOB_MB = 1000
+INPUT_FACTOR = 2
+# Unpickled classification models take about three times their file size
+MODEL_FACTOR = 3
+
+
+def database_memory(database_path):
+    """
+    Estimate the memory a single job needs to hold database files (MB).
+
+    HMM profiles are streamed by hmmsearch, so only the largest model that
+    a classification job loads is counted.
+    """
+
+    sizes = [
+        os.path.getsize(fp)
+        for fp in glob.glob(os.path.join(str(database_path), "group", "*", "model"))
+    ]
+    return math.ceil(MODEL_FACTOR * max(sizes, default=0) / 2**20)
+
+
+def memory_estimate(database_path, cap_mb):
+    """
+    Create a Snakemake expression estimating the memory of every job (MB).
+
+    The expression is evaluated by Snakemake for every job, so estimates
+    grow with the size of each job's input. They are capped, so that a
+    single job never needs more than the whole budget.
+
+    Args:
+    database_path (str): The VirSorter2 database.
+    cap_mb (int): The memory budget of the run.
+
+    Returns:
+    str: The expression, to be used as a default resource.
+    """
+
+    db_mb = database_memory(database_path)
+    return f"min(max({INPUT_FACTOR}*input.size_mb+{db_mb},{MIN_JOB_MB}),{int(cap_mb)})"
+
+
+def _process_label(pid):
+    """Names a process by its executable, or by its script for interpreters."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as fh:
+            args = fh.read().split(b"\0")
+        with open(f"/proc/{pid}/comm") as fh:
+            comm = fh.read().strip()
+    except OSError:
+        return None
+    if comm.startswith(("python", "perl", "Rscript")):
+        scripts = [a for a in args[1:] if a.endswith((b".py", b".pl", b".R"))]
+        if scripts:
+            return os.path.basename(scripts[0].decode())
+    return comm
+
+
+class MemoryMonitor:
+    """
+    Record the peak memory of a process tree in a background thread.
+
+    Processes are grouped by their executable (or script), which identifies
+    the rule a Snakemake job belongs to. For every group, the peak resident
+    memory of a single process is recorded next to the peak of the tree.
+    """
+
+    def __init__(self, root_pid=None, cap_mb=None, interval=2.0, events=None):
+        self.root_pid = root_pid or os.getpid()
+        self.cap_mb = cap_mb
+        self.interval = interval
+        self.events = events
+        self.peak_mb = 0.0
+        self.peak_by_process = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Take a single measurement of the process tree."""
+        stats = read_proc_stats()
+        children = {}
+        for pid, (ppid, _, _) in stats.items():
+            children.setdefault(ppid, []).append(pid)
+
+        total, stack = 0, list(children.get(self.root_pid, []))
+        while stack:
+            pid = stack.pop()
+            stack.extend(children.get(pid, []))
+            rss_mb = stats[pid][2] / 2**20
+            total += rss_mb
+            label = _process_label(pid)
+            if label is not None:
+                self.peak_by_process[label] = max(
+                    self.peak_by_process.get(label, 0.0), rss_mb
+                )
+        self.peak_mb = max(self.peak_mb, total)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self):
+        usage = {k: round(v, 1) for k, v in sorted(self.peak_by_process.items())}
+        cap = f" of the {self.cap_mb} MB budget" if self.cap_mb else ""
+        print(f"Peak memory of all jobs: {self.peak_mb:.1f} MB{cap}.")
+        for label, peak_mb in usage.items():
+            print(f"  {label}: {peak_mb} MB")
+        if self.events is not None:
+            self.events.emit(
+                "memory_usage",
+                peak_mb=round(self.peak_mb, 1),
+                cap_mb=self.cap_mb,
+                peak_by_process=usage,
+            )
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        self.report()
+        return False
@@ -0,0 +1,196 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""External k-way merge of the result tables of many runs.
+
+Records of "key, source, line" are sorted in chunks of at most
+MAX_RUN_ROWS, which are spilled to run files. The runs are then merged in
+key order while at most MAX_OPEN_FILES of them are open, merging in
+several passes if needed. Memory use is therefore bounded by the chunk
+size and the number of open files, not by the number or size of the
+inputs, apart from the indexes of the FASTA files that are open.
+"""
+
+import heapq
+import itertools
+import os
+import tempfile
+from collections import OrderedDict
+
+from q2_virsorter2._fasta import IndexedFasta, build_fasta_index
+
+MAX_OPEN_FILES = 128
+# Records sorted in memory at once before they are spilled to a run file
+MAX_RUN_ROWS = 1_000_000
+
+
+def _skip_types(fh):
+    """Returns the header line, skipping a QIIME 2 column types line."""
+    header = fh.readline()
+    position = fh.tell()
+    if not fh.readline().startswith("#q2:"):
+        fh.seek(position)
+    return header
+
+
+def read_header(table_fp):
+    with open(table_fp) as fh:
+        return _skip_types(fh).rstrip("\r\n").split("\t")
+
+
+def read_records(table_fp, source, key_column=0):
+    """
+    Read the rows of a TSV table as records of a merge.
+
+    Args:
+    table_fp (str): The table, with a header line.
+    source (int): Identifies the table in the merged records.
+    key_column (int): Position of the key column.
+
+    Yields:
+    tuple: (key, source, row) in the order of the table.
+    """
+
+    with open(table_fp) as fh:
+        _skip_types(fh)
+        for line in fh:
+            if line.strip() and not line.startswith("#"):
+                row = line.rstrip("\r\n")
+                yield row.split("\t")[key_column], source, row
+
+
+def _write_run(records, run_fp):
+    with open(run_fp, "w") as out:
+        for key, source, row in records:
+            out.write(f"{key}\t{source}\t{row}\n")
+
+
+def sort_records(records, tmp_dir, name, max_rows=MAX_RUN_ROWS):
+    """
+    Sort records into run files that 'merge_runs' merges in key order.
+
+    At most 'max_rows' records are held in memory: every chunk of them is
+    sorted and spilled to its own run file. Chunks are sorted stably, so
+    records with equal keys and sources keep their order.
+
+    Args:
+    records (iterable): (key, source, row) records; keys and rows must not
+        contain line breaks, and keys no tabs.
+    tmp_dir (str): Directory receiving the run files.
+    name (str): Prefix of the run files.
+    max_rows (int): Maximum number of records per run file.
+
+    Returns:
+    list: The run files, which are empty for no records.
+    """
+
+    records, run_fps = iter(records), []
+    for i in itertools.count():
+        chunk = list(itertools.islice(records, max_rows))
+        if not chunk:
+            return run_fps
+        chunk.sort(key=_merge_key)
+        run_fps.append(os.path.join(tmp_dir, f"{name}-{i}.run"))
+        _write_run(chunk, run_fps[-1])
+
+
+def _read_run(run_fp):
+    with open(run_fp) as fh:
+        for line in fh:
+            key, source, row = line.rstrip("\n").split("\t", 2)
+            yield key, int(source), row
+
+
+def _merge_key(record):
+    return record[0], record[1]
+
+
+def merge_runs(run_fps, tmp_dir, max_open=MAX_OPEN_FILES):
+    """
+    Merge sorted run files into a single stream.
+
+    Several streams may be merged at the same time in the same 'tmp_dir',
+    as every multi-pass merge writes its runs to a directory of its own.
+
+    Args:
+    run_fps (list): The run files.
+    tmp_dir (str): Directory for intermediate runs of multi-pass merges.
+    max_open (int): Maximum number of runs merged at once.
+
+    Yields:
+    tuple: (key, source, row) in key order; equal keys in source order.
+    """
+
+    run_fps, level = list(run_fps), 0
+    if len(run_fps) > max_open:
+        tmp_dir = tempfile.mkdtemp(prefix="merge-", dir=tmp_dir)
+    while len(run_fps) > max_open:
+        merged = []
+        for i in range(0, len(run_fps), max_open):
+            merged_fp = os.path.join(tmp_dir, f"merge-{level}-{i}.run")
+            records = heapq.merge(
+                *map(_read_run, run_fps[i : i + max_open]), key=_merge_key
+            )
+            _write_run(records, merged_fp)
+            merged.append(merged_fp)
+        run_fps, level = merged, level + 1
+    yield from heapq.merge(*map(_read_run, run_fps), key=_merge_key)
+
+
+def group_by_key(records):
+    """Groups the records of a merged stream by their key."""
+    for key, group in itertools.groupby(records, key=lambda record: record[0]):
+        yield key, list(group)
+
+
+class FastaPool:
+    """
+    Random access to the sequences of many FASTA files.
+
+    The files are indexed once and at most 'max_open' of them are kept
+    open (least recently used first out).
+    """
+
+    def __init__(self, fasta_fps, index_dir, max_open=MAX_OPEN_FILES):
+        self.max_open = max_open
+        self._files = {}
+        for i, fasta_fp in enumerate(fasta_fps):
+            index_fp = os.path.join(index_dir, f"sequences-{i}.fai")
+            build_fasta_index(fasta_fp, index_fp)
+            self._files[i] = (fasta_fp, index_fp)
+        self._open = OrderedDict()
+
+    def _get(self, source):
+        if source in self._open:
+            self._open.move_to_end(source)
+        else:
+            if len(self._open) >= self.max_open:
+                self._open.popitem(last=False)[1].close()
+            self._open[source] = IndexedFasta(*self._files[source])
+        return self._open[source]
+
+    def fetch(self, source, name):
+        """Returns a sequence, or None if the file does not contain it."""
+        fasta = self._get(source)
+        return fasta.fetch(name) if name in fasta else None
+
+    def write_record(self, source, name, fh):
+        """Copies a full record to a binary file handle, if it exists."""
+        fasta = self._get(source)
+        if name in fasta:
+            fasta.write_records([name], fh)
+
+    def close(self):
+        while self._open:
+            self._open.popitem()[1].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
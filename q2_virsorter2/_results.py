@@ -0,0 +1,256 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Streaming access to VirSorter2 results without pandas.
+
+Example::
+
+    from q2_virsorter2 import iter_viral_calls
+
+    for call in iter_viral_calls(
+        "final-viral-score.tsv", min_score=0.9, groups={"dsDNAphage"}
+    ):
+        print(call.contig, call.max_score, call.length)
+"""
+
+import os
+
+from q2_virsorter2._fasta import _index_records, read_fasta_index
+
+# Columns that follow the per-group scores in "final-viral-score.tsv"
+SCORE_COLUMNS = (
+    "max_score",
+    "max_score_group",
+    "length",
+    "hallmark",
+    "viral",
+    "cellular",
+)
+
+
+class ViralCall:
+    """
+    A single viral call of VirSorter2.
+
+    Boundary fields are None unless a boundary table was given and sequence
+    fields are None unless the viral sequences were given. The group names
+    are shared between all calls read from the same table.
+    """
+
+    __slots__ = (
+        "seqname",
+        "groups",
+        "group_scores",
+        "max_score",
+        "max_score_group",
+        "length",
+        "hallmark",
+        "viral",
+        "cellular",
+        "trim_bp_start",
+        "trim_bp_end",
+        "shape",
+        "sequence_offset",
+        "sequence_length",
+    )
+
+    def __init__(
+        self,
+        seqname,
+        groups,
+        group_scores,
+        max_score,
+        max_score_group,
+        length,
+        hallmark,
+        viral,
+        cellular,
+        trim_bp_start=None,
+        trim_bp_end=None,
+        shape=None,
+        sequence_offset=None,
+        sequence_length=None,
+    ):
+        self.seqname = seqname
+        self.groups = groups
+        self.group_scores = group_scores
+        self.max_score = max_score
+        self.max_score_group = max_score_group
+        self.length = length
+        self.hallmark = hallmark
+        self.viral = viral
+        self.cellular = cellular
+        self.trim_bp_start = trim_bp_start
+        self.trim_bp_end = trim_bp_end
+        self.shape = shape
+        self.sequence_offset = sequence_offset
+        self.sequence_length = sequence_length
+
+    @property
+    def contig(self):
+        """The name of the input contig (without the "||" suffix)."""
+        return self.seqname.split("||", 1)[0]
+
+    def score(self, group):
+        """Returns the score of the call for a viral group."""
+        return self.group_scores[self.groups.index(group)]
+
+    def __repr__(self):
+        return (
+            f"ViralCall(seqname={self.seqname!r}, max_score={self.max_score}, "
+            f"max_score_group={self.max_score_group!r}, length={self.length})"
+        )
+
+
+def _table_path(path):
+    """Tables can be given as files or as exported metadata directories."""
+    path = str(path)
+    if os.path.isdir(path):
+        return os.path.join(path, "metadata.tsv")
+    return path
+
+
+def _optional_float(value):
+    return float(value) if value not in ("", "nan", "NaN") else None
+
+
+class _LineIndex:
+    """
+    Random access to the lines of a table by the value of a key column.
+
+    Only the byte offset of every line is kept in memory.
+    """
+
+    def __init__(self, path, key_column):
+        self._fh = open(_table_path(path), "rb")
+        self.header = self._fh.readline().decode().rstrip("\r\n").split("\t")
+        key = self.header.index(key_column)
+
+        self._offsets = {}
+        offset = self._fh.tell()
+        for line in self._fh:
+            if not line.startswith(b"#"):
+                fields = line.rstrip(b"\r\n").split(b"\t")
+                self._offsets[fields[key].decode()] = offset
+            offset += len(line)
+
+    def get(self, key):
+        """Returns the fields of the line with the given key, or None."""
+        offset = self._offsets.get(key)
+        if offset is None:
+            return None
+        self._fh.seek(offset)
+        values = self._fh.readline().decode().rstrip("\r\n").split("\t")
+        return dict(zip(self.header, values))
+
+    def close(self):
+        self._fh.close()
+
+
+def _sequence_offsets(sequences_fp):
+    """Maps sequence names to their (offset, length), using a .fai if present."""
+    index_fp = f"{sequences_fp}.fai"
+    if os.path.exists(index_fp):
+        records = read_fasta_index(index_fp).values()
+    else:
+        with open(sequences_fp, "rb") as fh:
+            records = list(_index_records(fh))
+    return {r.name: (r.offset, r.length) for r in records}
+
+
+def iter_viral_calls(
+    score_fp,
+    boundary_fp=None,
+    sequences_fp=None,
+    min_score=None,
+    groups=None,
+    min_length=None,
+    max_length=None,
+):
+    """
+    Iterate over the viral calls of a VirSorter2 score table.
+
+    The score table is streamed line by line and the filters are applied to
+    the raw fields, so that records are only created for matching calls.
+    Attaching boundaries or sequence offsets additionally keeps one offset
+    per line of the boundary table or sequence in memory.
+
+    Args:
+    score_fp (str): The "final-viral-score.tsv" table, or a directory with
+        the exported viral score metadata.
+    boundary_fp (str): The "final-viral-boundary.tsv" table (or directory),
+        used to attach the trimmed boundaries.
+    sequences_fp (str): The "final-viral-combined.fa" file, used to attach
+        the offset and length of every viral sequence.
+    min_score (float): Only yield calls with at least this maximum score.
+    groups (iterable of str): Only yield calls whose best group is listed.
+    min_length (int): Only yield calls of at least this length.
+    max_length (int): Only yield calls of at most this length.
+
+    Yields:
+    ViralCall: The matching calls, in the order of the score table.
+    """
+
+    groups = set(groups) if groups is not None else None
+    boundaries = _LineIndex(boundary_fp, "seqname_new") if boundary_fp else None
+    offsets = _sequence_offsets(sequences_fp) if sequences_fp else None
+
+    try:
+        with open(_table_path(score_fp)) as fh:
+            header = fh.readline().rstrip("\r\n").split("\t")
+            first = header.index(SCORE_COLUMNS[0])
+            score_groups = tuple(header[1:first])
+            i_score, i_group, i_length, i_hallmark, i_viral, i_cellular = (
+                header.index(c) for c in SCORE_COLUMNS
+            )
+
+            for line in fh:
+                if line.startswith("#"):
+                    continue
+                fields = line.rstrip("\r\n").split("\t")
+
+                # Cheap filters first; records are only built for matches
+                if groups is not None and fields[i_group] not in groups:
+                    continue
+                length = int(fields[i_length])
+                if min_length is not None and length < min_length:
+                    continue
+                if max_length is not None and length > max_length:
+                    continue
+                # Calls with too few genes have no score
+                max_score = _optional_float(fields[i_score])
+                if min_score is not None and (
+                    max_score is None or max_score < min_score
+                ):
+                    continue
+
+                call = ViralCall(
+                    fields[0],
+                    score_groups,
+                    tuple(_optional_float(v) for v in fields[1:first]),
+                    max_score,
+                    fields[i_group],
+                    length,
+                    int(fields[i_hallmark]),
+                    _optional_float(fields[i_viral]),
+                    _optional_float(fields[i_cellular]),
+                )
+
+                if boundaries is not None:
+                    row = boundaries.get(call.seqname)
+                    if row is not None:
+                        call.trim_bp_start = int(row["trim_bp_start"])
+                        call.trim_bp_end = int(row["trim_bp_end"])
+                        call.shape = row["shape"]
+
+                if offsets is not None and call.seqname in offsets:
+                    call.sequence_offset, call.sequence_length = offsets[call.seqname]
+
+                yield call
+    finally:
+        if boundaries is not None:
+            boundaries.close()
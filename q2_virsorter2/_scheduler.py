@@ -0,0 +1,170 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class _Attempt:
+    """Book-keeping for a single execution of a shard."""
+
+    def __init__(self, shard, number, speculative):
+        self.shard = shard
+        self.number = number
+        self.speculative = speculative
+        self.start = time.monotonic()
+        self.cancel = threading.Event()
+        self.timed_out = False
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+
+def run_shards(
+    shards,
+    attempt_func,
+    n_workers,
+    timeout=None,
+    max_retries=0,
+    backoff=1.0,
+    speculative=False,
+    speculative_factor=1.5,
+    poll_interval=0.5,
+    discard=None,
+):
+    """
+    Execute shards in parallel with timeouts, retries and speculation.
+
+    'attempt_func(shard, attempt, cancel)' is called for every attempt,
+    where 'attempt' is a unique, increasing number for that shard and
+    'cancel' is a threading.Event. When the event is set the attempt has
+    been abandoned (because it timed out or a copy of it already finished)
+    and the function should stop its work as soon as possible.
+
+    A failed or timed-out shard is retried up to 'max_retries' times, with
+    an exponentially growing delay starting at 'backoff' seconds; other
+    shards are never recomputed. With 'speculative' enabled, idle workers
+    start a second copy of any shard that has been running for longer than
+    'speculative_factor' times the median duration of finished shards. The
+    first copy to finish wins and the other one is cancelled.
+
+    Attempts clean up after themselves when they fail or are cancelled.
+    Results of attempts that finished but were superseded (a losing copy,
+    or one that finished after its timeout) are passed to 'discard', so
+    that their outputs can be removed right away.
+
+    Args:
+    shards (list): The shards to execute.
+    attempt_func (callable): The function executing a single attempt.
+    n_workers (int): The maximum number of concurrent attempts.
+    discard (callable): Called with the result of every superseded attempt.
+
+    Returns:
+    list: The results of the winning attempts, in the order of 'shards'.
+    """
+
+    results = {}
+    failures = {i: 0 for i in range(len(shards))}
+    attempt_counts = {i: 0 for i in range(len(shards))}
+    pending = [(0.0, i) for i in range(len(shards))]
+    running = {}
+    durations = []
+
+    def launch(pool, i, is_speculative=False):
+        attempt_counts[i] += 1
+        attempt = _Attempt(i, attempt_counts[i], is_speculative)
+        future = pool.submit(attempt_func, shards[i], attempt.number, attempt.cancel)
+        running[future] = attempt
+
+    def copies(i):
+        return [a for a in running.values() if a.shard == i and not a.cancel.is_set()]
+
+    def superseded(future):
+        if discard is None or future.cancelled() or future.exception() is not None:
+            return
+        if future.result() is not None:
+            discard(future.result())
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        try:
+            while len(results) < len(shards):
+                now = time.monotonic()
+
+                # Start pending (re)tries whose backoff has passed
+                pending.sort()
+                while pending and pending[0][0] <= now and len(running) < n_workers:
+                    launch(pool, pending.pop(0)[1])
+
+                # Duplicate the slowest straggler on an idle worker
+                if speculative and not pending and durations:
+                    threshold = speculative_factor * statistics.median(durations)
+                    stragglers = [
+                        a
+                        for a in running.values()
+                        if len(copies(a.shard)) == 1 and a.elapsed() > threshold
+                    ]
+                    if stragglers and len(running) < n_workers:
+                        slowest = max(stragglers, key=_Attempt.elapsed)
+                        print(f"Starting a speculative copy of shard {slowest.shard}.")
+                        launch(pool, slowest.shard, is_speculative=True)
+
+                # Abandon attempts that exceeded the timeout
+                if timeout is not None:
+                    for attempt in running.values():
+                        if not attempt.cancel.is_set() and attempt.elapsed() > timeout:
+                            attempt.timed_out = True
+                            attempt.cancel.set()
+
+                if not running:
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(
+                    list(running), timeout=poll_interval, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    attempt = running.pop(future)
+                    i = attempt.shard
+                    if i in results:
+                        superseded(future)
+                        continue
+
+                    try:
+                        result = future.result()
+                        if attempt.timed_out:
+                            raise TimeoutError(f"Timed out after {timeout} seconds.")
+                    except Exception as e:
+                        if attempt.timed_out:
+                            superseded(future)
+                        # Another copy of the shard may still succeed
+                        if any(a.shard == i for a in running.values()):
+                            continue
+                        failures[i] += 1
+                        if failures[i] > max_retries:
+                            raise Exception(
+                                f"Shard {i} failed after {failures[i]} attempt(s): "
+                                f"{e}"
+                            ) from e
+                        delay = backoff * 2 ** (failures[i] - 1)
+                        print(f"Shard {i} failed ({e}), retrying in {delay:.0f}s.")
+                        pending.append((time.monotonic() + delay, i))
+                        continue
+
+                    results[i] = result
+                    durations.append(attempt.elapsed())
+                    for other in copies(i):
+                        other.cancel.set()
+        finally:
+            for attempt in running.values():
+                attempt.cancel.set()
+
+    # Copies still running were waited for when the pool was shut down
+    for future in running:
+        superseded(future)
+    return [results[i] for i in range(len(shards))]
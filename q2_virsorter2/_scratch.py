@@ -0,0 +1,204 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import glob
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+# An intermediate (glob relative to the work directory) can be removed once
+# every file matching the "done_when" globs exists and is non-empty.
+PruneRule = namedtuple("PruneRule", ["pattern", "done_when"])
+
+# Split/merge intermediates written by "virsorter run" into its "iter-0"
+# temporary directory. Split contigs are only read by the per-split gene
+# calling jobs and per-split HMM tables only by the taxonomy merge step.
+PRUNE_RULES = (
+    PruneRule(
+        "iter-0/pp-infile.fa.split",
+        ("iter-0/all.pdg.faa", "iter-0/all.pdg.gff"),
+    ),
+    PruneRule("iter-0/*.split/*.hmmtbl", ("iter-0/all.pdg.hmm.tax",)),
+    PruneRule("iter-0/*.split/*.tblout", ("iter-0/all.pdg.hmm.tax",)),
+)
+
+
+def get_directory_size(path):
+    """
+    Compute the total size of all files below a directory.
+
+    Files that disappear while the directory is being walked are ignored,
+    which makes it safe to call on a directory that is actively in use.
+
+    Args:
+    path (str): The directory to measure.
+
+    Returns:
+    int: The total size in bytes.
+    """
+
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                continue
+    return total
+
+
+def _is_settled(path, min_age):
+    """Checks that a path was not modified in the last 'min_age' seconds."""
+    newest = os.path.getmtime(path)
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+                except FileNotFoundError:
+                    continue
+    return time.time() - newest >= min_age
+
+
+def _find_work_dirs(root):
+    """Finds all VirSorter2 work directories below (and including) root."""
+    tmp_dirs = glob.glob(os.path.join(root, "**", "iter-0"), recursive=True)
+    return sorted({root, *(os.path.dirname(d) for d in tmp_dirs)})
+
+
+def prune_intermediates(work_dir, rules=PRUNE_RULES, min_age=0.0):
+    """
+    Delete intermediates whose downstream outputs have been produced.
+
+    Rules are applied to the given work directory and to any VirSorter2 work
+    directory nested within it (e.g., the work directories of shards).
+
+    Args:
+    work_dir (str): The VirSorter2 work directory.
+    rules (iterable of PruneRule): The intermediates to consider.
+    min_age (float): Only paths not modified for this many seconds are
+        deleted, so that files still being written are left alone.
+
+    Returns:
+    int: The number of bytes freed.
+    """
+
+    freed = 0
+    for root in _find_work_dirs(work_dir):
+        for rule in rules:
+            done = all(
+                (matches := glob.glob(os.path.join(root, marker)))
+                and all(os.path.getsize(m) > 0 for m in matches)
+                for marker in rule.done_when
+            )
+            if not done:
+                continue
+
+            for path in glob.glob(os.path.join(root, rule.pattern)):
+                try:
+                    if not _is_settled(path, min_age):
+                        continue
+                    if os.path.isdir(path):
+                        size = get_directory_size(path)
+                        shutil.rmtree(path)
+                    else:
+                        size = os.path.getsize(path)
+                        os.remove(path)
+                except FileNotFoundError:
+                    continue
+                freed += size
+    return freed
+
+
+class ScratchMonitor:
+    """
+    Watch a work directory in a background thread while a run is ongoing.
+
+    The monitor records the peak size of the directory and, if requested,
+    prunes intermediates as soon as their downstream outputs exist. When a
+    cap is given, a warning is printed the first time usage reaches 90% of
+    it; the cap itself is enforced by Snakemake's scheduler (see
+    'vs2_run_execution').
+    """
+
+    def __init__(
+        self,
+        work_dir,
+        prune=False,
+        cap_mb=None,
+        rules=PRUNE_RULES,
+        interval=5.0,
+        min_age=30.0,
+    ):
+        self.work_dir = work_dir
+        self.prune = prune
+        self.cap_mb = cap_mb
+        self.rules = rules
+        self.interval = interval
+        self.min_age = min_age
+        self.peak_bytes = 0
+        self.pruned_bytes = 0
+        self._warned = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Take a single measurement and prune if enabled."""
+        usage = get_directory_size(self.work_dir)
+        self.peak_bytes = max(self.peak_bytes, usage)
+
+        if self.cap_mb and not self._warned and usage >= 0.9 * self.cap_mb * 2**20:
+            self._warned = True
+            print(
+                f"Scratch usage ({usage / 2**20:.0f} MB) is approaching "
+                f"the cap of {self.cap_mb} MB."
+            )
+
+        if self.prune:
+            self.pruned_bytes += prune_intermediates(
+                self.work_dir, self.rules, self.min_age
+            )
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        # A final measurement catches usage that built up since the last poll
+        self.poll()
+
+    def report(self):
+        print(
+            f"Peak scratch usage: {self.peak_bytes / 2**20:.1f} MB "
+            f"(pruned {self.pruned_bytes / 2**20:.1f} MB of intermediates)."
+        )
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        self.report()
+        return False
@@ -0,0 +1,165 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import heapq
+import os
+import shutil
+
+from q2_virsorter2._fasta import IndexedFasta, _index_records, build_fasta_index
+
+RUN_OUTPUTS = {
+    "sequences": "final-viral-combined.fa",
+    "score": "final-viral-score.tsv",
+    "boundary": "final-viral-boundary.tsv",
+}
+
+
+def balance_shards(lengths, n_shards):
+    """
+    Distribute sequences over shards so that their total lengths are even.
+
+    Sequences are assigned longest first, each to the currently smallest
+    shard, which keeps the largest shard close to the average.
+
+    Args:
+    lengths (dict): Sequence ID: length pairs.
+    n_shards (int): The maximum number of shards.
+
+    Returns:
+    list: Lists of sequence IDs, one per non-empty shard.
+    """
+
+    heap = [(0, i) for i in range(n_shards)]
+    shards = [[] for _ in range(n_shards)]
+    for name in sorted(lengths, key=lengths.get, reverse=True):
+        total, i = heapq.heappop(heap)
+        shards[i].append(name)
+        heapq.heappush(heap, (total + lengths[name], i))
+    return [shard for shard in shards if shard]
+
+
+def partition_fasta(fasta_path, out_dir, n_shards, index_path=None):
+    """
+    Split a FASTA file into shards of similar total length.
+
+    The input is indexed once (unless its index is given) and every shard
+    is then written through random access, so the input is never held in
+    memory.
+
+    Args:
+    fasta_path (str): The FASTA file to split.
+    out_dir (str): The directory to write the shards to.
+    n_shards (int): The maximum number of shards.
+    index_path (str): An existing .fai index of the FASTA file.
+
+    Returns:
+    list: Paths of the written shards.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    if index_path is None:
+        index_path = os.path.join(out_dir, "input.fasta.fai")
+        build_fasta_index(fasta_path, index_path)
+
+    shard_paths = []
+    with IndexedFasta(fasta_path, index_path) as fasta:
+        lengths = {name: rec.length for name, rec in fasta.index.items()}
+        order = {name: i for i, name in enumerate(fasta.index)}
+        for i, names in enumerate(balance_shards(lengths, n_shards)):
+            shard_path = os.path.join(out_dir, f"shard-{i}.fasta")
+            with open(shard_path, "wb") as fh:
+                # Keep the input order to read the file sequentially
+                fasta.write_records(sorted(names, key=order.get), fh)
+            shard_paths.append(shard_path)
+    return shard_paths
+
+
+def _partition_stream(sequences, out_dir, n_shards, n_jobs=1):
+    # Compressed input cannot be accessed randomly, so it is read twice:
+    # once for the lengths and once to route every record to its shard
+    with sequences.open(n_jobs) as fh:
+        lengths = {rec.name: rec.length for rec in _index_records(fh)}
+    shards = balance_shards(lengths, n_shards)
+    shard_of = {name: i for i, names in enumerate(shards) for name in names}
+
+    shard_paths = [
+        os.path.join(out_dir, f"shard-{i}.fasta") for i in range(len(shards))
+    ]
+    outs = [open(path, "wb") for path in shard_paths]
+    try:
+        with sequences.open(n_jobs) as fh:
+            out = None
+            for line in fh:
+                if line.startswith(b">"):
+                    out = outs[shard_of[line[1:].split(None, 1)[0].decode()]]
+                if out is not None:
+                    out.write(line if line.endswith(b"\n") else line + b"\n")
+    finally:
+        for out in outs:
+            out.close()
+    return shard_paths
+
+
+def partition_sequence_file(sequences, out_dir, n_shards, n_jobs=1):
+    """
+    Split a (possibly compressed) FASTA file into shards of similar length.
+
+    Compressed input is decompressed as a stream directly into the shards,
+    so that no uncompressed copy of the whole input is written.
+
+    Args:
+    sequences (SequenceFile): The sequences to split.
+    out_dir (str): The directory to write the shards to.
+    n_shards (int): The maximum number of shards.
+    n_jobs (int): Number of threads decompressing BGZF input.
+
+    Returns:
+    list: Paths of the written shards.
+    """
+
+    if not sequences.compressed:
+        return partition_fasta(
+            sequences.path, out_dir, n_shards, index_path=sequences.index_path
+        )
+    os.makedirs(out_dir, exist_ok=True)
+    return _partition_stream(sequences, out_dir, n_shards, n_jobs)
+
+
+def _concatenate_tables(paths, out_path):
+    """Concatenates TSV files that share a header line."""
+    with open(out_path, "w") as out:
+        header = None
+        for path in paths:
+            with open(path) as fh:
+                first = fh.readline()
+                if header is None:
+                    header = first
+                    out.write(header)
+                elif first != header:
+                    raise ValueError(f"Unexpected header in {path}.")
+                shutil.copyfileobj(fh, out)
+
+
+def collate_run_outputs(work_dirs, out_dir):
+    """
+    Combine the outputs of several "virsorter run" work directories.
+
+    Args:
+    work_dirs (list): The work directories to collate, in order.
+    out_dir (str): The directory to write the combined outputs to.
+    """
+
+    with open(os.path.join(out_dir, RUN_OUTPUTS["sequences"]), "wb") as out:
+        for work_dir in work_dirs:
+            with open(os.path.join(work_dir, RUN_OUTPUTS["sequences"]), "rb") as fh:
+                shutil.copyfileobj(fh, out)
+
+    for key in ("score", "boundary"):
+        _concatenate_tables(
+            [os.path.join(work_dir, RUN_OUTPUTS[key]) for work_dir in work_dirs],
+            os.path.join(out_dir, RUN_OUTPUTS[key]),
+        )
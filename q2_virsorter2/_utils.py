@@ -5,8 +5,13 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import contextlib
 import os
+import re
+import shutil
+import signal
 import subprocess
+import sys
 from typing import List
 
 EXTERNAL_CMD_WARNING = (
@@ -32,6 +37,15 @@ def get_full_path(file_name):
     return os.path.abspath(file_name)
 
 
+def link_or_copy(src, dst):
+    """Hard links a file if possible, e.g. when on the same file system."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
 def create_directory(path):
     """
     Create a directory at the specified path. If the directory already exists,
@@ -51,12 +65,79 @@ def create_directory(path):
         return False
 
 
-def run_command(cmd, verbose=True):
+# Logged by Snakemake (and so by "virsorter run") whenever a job finishes
+SNAKEMAKE_PROGRESS = re.compile(rb"^(\d+) of (\d+) steps \(\d+%\) done")
+
+
+def _command_stage(cmd, events):
+    """Reports the command as a stage if an event stream is given."""
+    if events is None:
+        return contextlib.nullcontext()
+    return events.stage("command", command=" ".join(map(str, cmd)))
+
+
+def run_command(cmd, verbose=True, events=None, env=None):
+    if verbose:
+        print(EXTERNAL_CMD_WARNING)
+        print("\nCommand:", end=" ")
+        print(" ".join(cmd), end="\n\n")
+    with _command_stage(cmd, events):
+        if events is None or not events.active:
+            subprocess.run(cmd, check=True, env=env)
+            return
+
+        # Snakemake's log is passed through and its finished steps are
+        # reported as they are, since they do not map onto contigs
+        proc = subprocess.Popen(cmd, stderr=subprocess.PIPE, env=env)
+        for line in proc.stderr:
+            sys.stderr.write(line.decode(errors="replace"))
+            sys.stderr.flush()
+            match = SNAKEMAKE_PROGRESS.match(line)
+            if match:
+                events.steps(*map(int, match.groups()))
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def run_cancellable_command(cmd, cancel, verbose=True, poll_interval=0.5, events=None):
+    """
+    Run a command that is terminated as soon as an event is set.
+
+    The command is started in its own process group, so that any processes
+    it spawned (e.g., Snakemake jobs) are terminated together with it.
+
+    Args:
+    cmd (list): The command to run.
+    cancel (threading.Event): Terminates the command once set.
+    verbose (bool): Print the command before running it.
+    events (EventStream): Stream receiving the start and end of the command.
+
+    Returns:
+    bool: True if the command finished, False if it was cancelled.
+    """
+
     if verbose:
         print(EXTERNAL_CMD_WARNING)
         print("\nCommand:", end=" ")
         print(" ".join(cmd), end="\n\n")
-    subprocess.run(cmd, check=True)
+
+    with _command_stage(cmd, events):
+        proc = subprocess.Popen(cmd, start_new_session=True)
+        while True:
+            try:
+                returncode = proc.wait(timeout=poll_interval)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel.is_set():
+                    os.killpg(proc.pid, signal.SIGTERM)
+                    proc.wait()
+                    if events is not None:
+                        events.emit("command_cancelled", command=" ".join(cmd))
+                    return False
+
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+    return True
 
 
 def run_commands_with_pipe(cmd1, cmd2, cmd3, outfile_path, verbose=True):
@@ -121,3 +202,32 @@ def _process_common_input_params(processing_func, params: dict) -> List[str]:
 def _get_sample_from_path(fp):
     """Extracts sample name from a contig's file path."""
     return os.path.basename(fp).rsplit("_contigs.fa", maxsplit=1)[0]
+
+
+def _construct_snakemake_resources(
+    resources: dict, estimates: dict = None
+) -> List[str]:
+    """Converts global resource limits into Snakemake command line arguments.
+
+    Jobs are given Snakemake's default resource estimates (e.g., disk_mb is
+    derived from the size of each job's input), so that the scheduler can
+    keep the sum over all running jobs below the provided limits.
+
+    Args:
+        resources (dict): Dictionary of resource: limit pairs. Resources
+            without a limit are skipped.
+        estimates (dict): Dictionary of resource: expression pairs that
+            replace Snakemake's default estimate of a limited resource.
+
+    Returns:
+        args (list): Arguments to be passed through to Snakemake.
+    """
+    limits = [f"{name}={int(limit)}" for name, limit in resources.items() if limit]
+    if not limits:
+        return []
+    defaults = [
+        f"{name}={expression}"
+        for name, expression in (estimates or {}).items()
+        if resources.get(name)
+    ]
+    return ["--default-resources", *defaults, "--resources", *limits]
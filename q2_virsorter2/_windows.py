@@ -0,0 +1,237 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""Split very long contigs into overlapping windows and stitch the results.
+
+A single long contig is a single serial work item for gene calling and
+classification. Cut into windows, its parts are processed in parallel like
+any other contigs. The calls made on the windows are then moved back into
+contig coordinates, and calls that overlap (e.g., a provirus crossing the
+edge between two windows) are merged into one.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from q2_virsorter2._fasta import IndexedFasta, build_fasta_index, iter_fasta
+from q2_virsorter2._sharding import RUN_OUTPUTS
+
+# The position of a window, as a 0-based offset into its contig
+Window = namedtuple("Window", ["contig", "start", "contig_length", "n_windows"])
+
+# Boundary columns with 1-based positions that are shifted into the contig
+BP_COLUMNS = (
+    "trim_bp_start",
+    "trim_bp_end",
+    "prox_bp_start",
+    "prox_bp_end",
+    "full_bp_start",
+    "full_bp_end",
+)
+# ORF indices refer to the genes of a window and are dropped when stitching
+ORF_COLUMNS = (
+    "trim_orf_index_start",
+    "trim_orf_index_end",
+    "prox_orf_index_start",
+    "prox_orf_index_end",
+    "full_orf_index_start",
+    "full_orf_index_end",
+)
+
+
+def window_starts(length, window_size, overlap):
+    """Returns the 0-based starts of the windows covering a sequence."""
+    if overlap >= window_size:
+        raise ValueError(
+            f"The window overlap ({overlap}) must be smaller than the window "
+            f"size ({window_size})."
+        )
+    if length <= window_size:
+        return [0]
+    step = window_size - overlap
+    starts = list(range(0, length - window_size, step))
+    # The last window ends at the end of the contig
+    return starts + [length - window_size]
+
+
+def write_windows(sequences_fp, windows_fp, window_size, overlap):
+    """
+    Copy sequences, cutting those longer than 'window_size' into windows.
+
+    Args:
+    sequences_fp (str): The input FASTA file.
+    windows_fp (str): The FASTA file to write.
+    window_size (int): The maximum length of a window.
+    overlap (int): The number of bases shared by consecutive windows. It
+        should exceed the longest expected provirus, so that every provirus
+        is complete in at least one window.
+
+    Returns:
+    dict: The written windows (Window) by their names.
+    """
+
+    windows = {}
+    with open(sequences_fp, "rb") as fh, open(windows_fp, "wb") as out:
+        for name, seq in iter_fasta(fh):
+            starts = window_starts(len(seq), window_size, overlap)
+            if len(starts) == 1:
+                out.write(b">%s\n%s\n" % (name.encode(), seq))
+                continue
+            for start in starts:
+                window = f"{name}__window_{start}"
+                windows[window] = Window(name, start, len(seq), len(starts))
+                out.write(
+                    b">%s\n%s\n" % (window.encode(), seq[start : start + window_size])
+                )
+    return windows
+
+
+def _read_table(fp):
+    # Values are kept as text, so that rows that are not stitched are
+    # written back unchanged
+    return pd.read_csv(fp, sep="\t", dtype=str, keep_default_na=False)
+
+
+def _window_calls(score_df, boundary_df, windows, window_size):
+    """Collects the calls made on windows, in contig coordinates."""
+    boundaries = {b["seqname_new"]: b for b in boundary_df.to_dict("records")}
+    calls = []
+    for row in score_df.to_dict("records"):
+        window = windows[row["seqname"].split("||", 1)[0]]
+        boundary = boundaries.get(row["seqname"])
+        if boundary is not None:
+            boundary = dict(boundary)
+            for column in BP_COLUMNS:
+                if boundary.get(column, "") != "":
+                    boundary[column] = int(float(boundary[column])) + window.start
+            start, end = boundary["trim_bp_start"], boundary["trim_bp_end"]
+            full = boundary.get("partial", "0") in ("0", "0.0")
+        else:
+            # Calls without a boundary (e.g., too few genes) span the window
+            start = window.start + 1
+            end = min(window.start + window_size, window.contig_length)
+            full = True
+        calls.append((window, start, end, full, row, boundary))
+    return calls
+
+
+def _group_calls(calls):
+    """Groups overlapping calls of the same contig."""
+    calls = sorted(calls, key=lambda c: (c[0].contig, c[1], c[2]))
+    groups = []
+    for call in calls:
+        last = groups[-1][-1] if groups else None
+        if (
+            last is not None
+            and last[0].contig == call[0].contig
+            and call[1] <= max(c[2] for c in groups[-1]) + 1
+        ):
+            groups[-1].append(call)
+        else:
+            groups.append([call])
+    return groups
+
+
+def _score(row):
+    score = row["max_score"]
+    return float(score) if score not in ("", "nan", "NaN") else -np.inf
+
+
+def _stitch_group(group, name, full):
+    """Merges a group of overlapping calls into one score and boundary row."""
+    _, _, _, _, row, boundary = max(group, key=lambda c: _score(c[4]))
+    start, end = min(c[1] for c in group), max(c[2] for c in group)
+    row = {**row, "seqname": name, "length": str(end - start + 1)}
+    if boundary is None:
+        return row, None, start, end
+
+    boundary = dict(boundary)
+    pieces = [c[5] for c in group if c[5] is not None]
+    for column in BP_COLUMNS:
+        values = [p[column] for p in pieces if p.get(column, "") != ""]
+        if values:
+            boundary[column] = (min if column.endswith("start") else max)(values)
+    for column in ORF_COLUMNS:
+        if column in boundary:
+            boundary[column] = ""
+    boundary.update(
+        trim_bp_start=start,
+        trim_bp_end=end,
+        seqname=group[0][0].contig,
+        seqname_new=name,
+    )
+    if "partial" in boundary:
+        boundary["partial"] = "0" if full else "1"
+    return row, {k: str(v) for k, v in boundary.items()}, start, end
+
+
+def stitch_windows(work_dir, windows, sequences_fp, window_size):
+    """
+    Move the calls made on windows back into the coordinates of the contigs.
+
+    Overlapping calls of a contig are merged into a single call, taking the
+    scores of the best-scoring one. A contig is called in full if every one
+    of its windows was called in full; otherwise the merged calls are
+    numbered as partial calls. The outputs in 'work_dir' are rewritten and
+    the sequences of merged calls are taken from the input sequences.
+
+    Args:
+    work_dir (str): The directory with the outputs of "virsorter run".
+    windows (dict): The windows, as returned by 'write_windows'.
+    sequences_fp (str): The (unwindowed) input sequences.
+    window_size (int): The maximum length of a window.
+    """
+
+    paths = {k: os.path.join(work_dir, fn) for k, fn in RUN_OUTPUTS.items()}
+    score_df, boundary_df = _read_table(paths["score"]), _read_table(paths["boundary"])
+    in_window = score_df["seqname"].str.split("||", n=1, regex=False).str[0]
+    in_window = in_window.isin(list(windows))
+    boundary_in_window = boundary_df["seqname"].isin(list(windows))
+
+    calls = _window_calls(score_df[in_window], boundary_df, windows, window_size)
+    scores, boundaries, regions, n_partial = [], [], [], {}
+    for group in _group_calls(calls):
+        window = group[0][0]
+        n_full = len({c[0].start for c in group if c[3]})
+        full = n_full == window.n_windows and all(c[3] for c in group)
+        if full:
+            name = f"{window.contig}||full"
+        else:
+            i = n_partial[window.contig] = n_partial.get(window.contig, -1) + 1
+            name = f"{window.contig}||{i}_partial"
+        row, boundary, start, end = _stitch_group(group, name, full)
+        scores.append(row)
+        if boundary is not None:
+            boundaries.append(boundary)
+        regions.append((name, window.contig, start, end))
+
+    pd.concat([score_df[~in_window], pd.DataFrame(scores)]).to_csv(
+        paths["score"], sep="\t", index=False, columns=score_df.columns
+    )
+    pd.concat([boundary_df[~boundary_in_window], pd.DataFrame(boundaries)]).to_csv(
+        paths["boundary"], sep="\t", index=False, columns=boundary_df.columns
+    )
+
+    # Sequences of windows are replaced by the regions of the contigs
+    stitched_fp = os.path.join(work_dir, "stitched-viral-combined.fa")
+    index_fp = os.path.join(work_dir, "input-sequences.fai")
+    build_fasta_index(sequences_fp, index_fp)
+    with open(paths["sequences"], "rb") as fh, open(stitched_fp, "wb") as out:
+        keep = True
+        for line in fh:
+            if line.startswith(b">"):
+                contig = line[1:].split(None, 1)[0].split(b"||", 1)[0]
+                keep = contig.decode() not in windows
+            if keep:
+                out.write(line)
+        with IndexedFasta(sequences_fp, index_fp) as fasta:
+            for name, contig, start, end in regions:
+                out.write(f">{name}\n{fasta.fetch(contig, start - 1, end)}\n".encode())
+    os.replace(stitched_fp, paths["sequences"])
@@ -0,0 +1,464 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+"""A local worker that keeps a VirSorter2 database loaded between jobs.
+
+Start it with::
+
+    python -m q2_virsorter2._worker --database db.qza --socket /tmp/vs2.sock
+
+and pass the socket path to the classify action (or the run pipeline).
+Requests and responses are exchanged as JSON lines over a Unix socket.
+
+The worker keeps the optimized profiles of all HMM files loaded. The
+hmmsearch invocations of the runs it executes are served from them (see
+_hmmsearch.py), while the other steps of "virsorter run" (including the
+scoring with the group models) run as they do without a worker.
+"""
+
+import argparse
+import contextlib
+import glob
+import itertools
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+
+import pyhmmer
+from pyhmmer.easel import Alphabet, SequenceFile
+
+from q2_virsorter2._classifier import GroupClassifier, read_feature_table
+from q2_virsorter2._history import database_manifest
+from q2_virsorter2._hmm_cache import load_hmms
+from q2_virsorter2._hmm_dedup import expand_database, is_deduplicated
+from q2_virsorter2._hmmsearch import PATH_ENV, SOCKET_ENV, write_script
+from q2_virsorter2._utils import run_command
+
+# Group models are only loaded once the first rescoring is requested
+_CLASSIFIER_LOCK = threading.Lock()
+
+
+def _decode(name):
+    """Names are bytes in older versions of pyhmmer."""
+    return name.decode() if isinstance(name, bytes) else name
+
+
+def load_database(database_path):
+    """
+    Load the parts of a VirSorter2 database that are expensive to parse.
+
+    Deduplicated databases are expanded first, as runs read the original
+    HMM files.
+
+    Args:
+    database_path (str): Path to a VirSorter2 database directory.
+
+    Returns:
+    dict: The database path, its manifest, the path of the database that
+        runs read and the optimized profiles of its HMM files, keyed by
+        relative path.
+    """
+
+    run_database = str(database_path)
+    if is_deduplicated(database_path):
+        run_database = expand_database(database_path)
+
+    hmms = {}
+    for hmm_fp in sorted(glob.glob(os.path.join(run_database, "hmm", "*", "*.hmm"))):
+        hmms[os.path.relpath(hmm_fp, run_database)] = load_hmms(hmm_fp, optimized=True)
+    return {
+        "database": str(database_path),
+        "manifest": database_manifest(database_path),
+        "run_database": run_database,
+        "hmms": hmms,
+    }
+
+
+def _profiles(resources, hmm_file):
+    # Optimized profiles are modified while searched, so every search needs
+    # its own copy
+    return [profile.copy() for profile in resources["hmms"][hmm_file]]
+
+
+def _read_proteins(proteins):
+    alphabet = Alphabet.amino()
+    with SequenceFile(proteins, digital=True, alphabet=alphabet) as fh:
+        return fh.read_block()
+
+
+def _tblout_job(resources, hmm_file, sequences, output, cpu=1, **options):
+    """Searches proteins like "hmmsearch --tblout" with loaded profiles."""
+    run_database = os.path.realpath(resources["run_database"])
+    rel_path = os.path.relpath(os.path.realpath(hmm_file), run_database)
+    if rel_path not in resources["hmms"]:
+        raise ValueError(f"{hmm_file} is not an HMM file of {run_database}.")
+
+    all_hits = pyhmmer.hmmsearch(
+        _profiles(resources, rel_path), _read_proteins(sequences), cpus=cpu, **options
+    )
+    # Written atomically, so that a failed search leaves no partial table
+    tmp_fp = f"{output}.tmp"
+    with open(tmp_fp, "wb") as out:
+        for i, top_hits in enumerate(all_hits):
+            top_hits.write(out, format="targets", header=i == 0)
+    os.replace(tmp_fp, output)
+    return {"output": output}
+
+
+# Operations of the servers answering the searches of a single run
+SEARCH_HANDLERS = {"tblout": _tblout_job}
+
+
+@contextlib.contextmanager
+def _served_searches(resources, n_jobs):
+    """
+    Serve the hmmsearch invocations of a run from the loaded profiles.
+
+    Searches are served by a server of their own, so that they never wait
+    behind the queued jobs (including the run they belong to).
+
+    Yields:
+    dict: The environment to run "virsorter run" in.
+    """
+
+    # Socket paths are limited to about 100 characters
+    with tempfile.TemporaryDirectory(prefix="vs2-") as tmp:
+        server = WorkerServer(
+            os.path.join(tmp, "search.sock"),
+            resources,
+            handlers=SEARCH_HANDLERS,
+            n_workers=n_jobs,
+        )
+        thread = threading.Thread(target=server.serve, daemon=True)
+        thread.start()
+        bin_dir = os.path.join(tmp, "bin")
+        write_script(bin_dir)
+        path = os.environ.get("PATH", os.defpath)
+        try:
+            yield {
+                **os.environ,
+                "PATH": os.pathsep.join([bin_dir, path]),
+                PATH_ENV: path,
+                SOCKET_ENV: server.socket_path,
+            }
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+def _run_job(
+    resources,
+    sequences,
+    work_dir,
+    n_jobs,
+    min_score,
+    min_length,
+    database_manifest,
+    **kw,
+):
+    """Runs "virsorter run" against the database held by the worker."""
+    # Results must come from the database the caller records as its input
+    if database_manifest != resources["manifest"]:
+        raise ValueError(
+            f"The worker holds the database {resources['database']} (manifest "
+            f"{resources['manifest']}), but the database given to the action "
+            f"has the manifest {database_manifest}. Start a worker with that "
+            "database."
+        )
+
+    # Imported here to avoid a circular import with the action module
+    from q2_virsorter2.virsorter2_run import _construct_run_cmd
+
+    cmd = _construct_run_cmd(
+        work_dir,
+        sequences,
+        resources["run_database"],
+        n_jobs,
+        min_score,
+        min_length,
+        kw.get("snakemake_args"),
+        profile=kw.get("profile", "default"),
+    )
+    with _served_searches(resources, n_jobs) as env:
+        run_command(cmd, env=env)
+    return {"work_dir": work_dir}
+
+
+def _hmmsearch_job(resources, proteins, output, n_jobs=0):
+    """Searches proteins against all loaded profiles and writes a hit table."""
+    sequences = _read_proteins(proteins)
+
+    n_hits = 0
+    with open(output, "w") as out:
+        out.write("protein\tprofile\thmm_file\tscore\tevalue\n")
+        for hmm_file in sorted(resources["hmms"]):
+            queries = _profiles(resources, hmm_file)
+            for top_hits in pyhmmer.hmmsearch(queries, sequences, cpus=n_jobs):
+                profile = _decode(top_hits.query.name)
+                for hit in top_hits.included:
+                    out.write(
+                        f"{_decode(hit.name)}\t{profile}\t{hmm_file}\t"
+                        f"{hit.score:.1f}\t{hit.evalue:.3g}\n"
+                    )
+                    n_hits += 1
+    return {"output": output, "n_hits": n_hits}
+
+
+def _get_classifier(resources):
+    with _CLASSIFIER_LOCK:
+        if "classifier" not in resources:
+            resources["classifier"] = GroupClassifier.from_database(
+                resources["database"]
+            )
+        return resources["classifier"]
+
+
+def _rescore_job(resources, features, output):
+    """Rescores a feature table of a finished run with the group models."""
+    scores = _get_classifier(resources).classify(read_feature_table(features))
+    scores.round(3).to_csv(output, sep="\t", na_rep="")
+    return {"output": output, "n_contigs": len(scores)}
+
+
+JOB_HANDLERS = {
+    "ping": lambda resources: {"database": resources.get("database")},
+    "run": _run_job,
+    "hmmsearch": _hmmsearch_job,
+    "rescore": _rescore_job,
+}
+
+
+class FairQueue:
+    """
+    A queue that serves its clients in turn.
+
+    Every client has its own FIFO queue and items are taken from the
+    clients in round-robin order, so that a client submitting many jobs
+    cannot starve the others.
+    """
+
+    def __init__(self):
+        self._queues = OrderedDict()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def put(self, client, item):
+        with self._cond:
+            self._queues.setdefault(client, deque()).append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Returns the next item, or None if none arrived within 'timeout'."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queues, timeout):
+                return None
+            client, queue = self._queues.popitem(last=False)
+            item = queue.popleft()
+            # Clients with more work go to the back of the line
+            if queue:
+                self._queues[client] = queue
+            return item
+
+
+class _Job:
+    def __init__(self, op, args):
+        self.op = op
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    _connection_ids = itertools.count()
+
+    def handle(self):
+        default_client = f"connection-{next(self._connection_ids)}"
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                job = _Job(request["op"], request.get("args", {}))
+            except (ValueError, KeyError) as e:
+                response = {"status": "error", "message": f"Invalid request: {e}"}
+            else:
+                self.server.submit(request.get("client", default_client), job)
+                job.done.wait()
+                if job.error is None:
+                    response = {"status": "ok", "result": job.result}
+                else:
+                    response = {"status": "error", "message": job.error}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+
+
+class WorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serve jobs over a Unix socket using resources that are loaded only once.
+
+    Jobs are executed by 'n_workers' threads in fair order across clients.
+    The server shuts itself down after 'idle_timeout' seconds without jobs.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, socket_path, resources, handlers=None, n_workers=1, idle_timeout=None
+    ):
+        super().__init__(str(socket_path), _RequestHandler)
+        self.socket_path = str(socket_path)
+        self.resources = resources
+        self.handlers = handlers if handlers is not None else JOB_HANDLERS
+        self.n_workers = n_workers
+        self.idle_timeout = idle_timeout
+        self.queue = FairQueue()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_activity = time.monotonic()
+        self._stopped = threading.Event()
+
+    def submit(self, client, job):
+        if job.op not in self.handlers:
+            job.error = f"Unknown operation '{job.op}'."
+            job.done.set()
+            return
+        with self._lock:
+            self._last_activity = time.monotonic()
+        self.queue.put(client, job)
+
+    def _work(self):
+        while not self._stopped.is_set():
+            job = self.queue.get(timeout=0.1)
+            if job is None:
+                continue
+            with self._lock:
+                self._active += 1
+            try:
+                job.result = self.handlers[job.op](self.resources, **job.args)
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._last_activity = time.monotonic()
+                job.done.set()
+
+    def _watch_idle(self):
+        while not self._stopped.wait(min(1.0, self.idle_timeout)):
+            with self._lock:
+                idle = time.monotonic() - self._last_activity
+                busy = self._active or len(self.queue)
+            if not busy and idle >= self.idle_timeout:
+                print(f"No jobs received for {idle:.0f}s, shutting down.")
+                self.shutdown()
+                return
+
+    def serve(self):
+        """Serve requests until shut down or idle for too long."""
+        threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(self.n_workers)
+        ]
+        if self.idle_timeout:
+            threads.append(threading.Thread(target=self._watch_idle, daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            self.serve_forever(poll_interval=0.1)
+        finally:
+            self._stopped.set()
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+def submit_job(socket_path, op, client=None, timeout=None, **args):
+    """
+    Submit a job to a running worker and wait for its result.
+
+    Args:
+    socket_path (str): The socket the worker listens on.
+    op (str): The operation to run (e.g., "run", "hmmsearch" or "rescore").
+    client (str): Identifies the caller for fair queueing. Defaults to
+        one identity per call.
+    timeout (float): Maximum time to wait for the result, in seconds.
+    **args: Arguments of the operation.
+
+    Returns:
+    dict: The result of the operation.
+    """
+
+    request = {"op": op, "args": args}
+    if client is not None:
+        request["client"] = client
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(socket_path))
+        with sock.makefile("rwb") as fh:
+            fh.write((json.dumps(request) + "\n").encode())
+            fh.flush()
+            line = fh.readline()
+
+    if not line:
+        raise Exception("The worker closed the connection without responding.")
+    response = json.loads(line)
+    if response["status"] != "ok":
+        raise Exception(f"The worker failed to run '{op}': {response['message']}")
+    return response["result"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Keep a VirSorter2 database loaded and serve jobs over a "
+        "Unix socket."
+    )
+    parser.add_argument(
+        "--database",
+        required=True,
+        help="VirSorter2 database directory or Virsorter2Db artifact (.qza).",
+    )
+    parser.add_argument("--socket", required=True, help="Path of the socket.")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of concurrent jobs."
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=3600,
+        help="Shut down after this many seconds without jobs (0 to disable).",
+    )
+    args = parser.parse_args(argv)
+
+    database = args.database
+    if database.endswith(".qza"):
+        import qiime2
+
+        from q2_virsorter2.types._format import Virsorter2DbDirFmt
+
+        artifact = qiime2.Artifact.load(database)
+        database = str(artifact.view(Virsorter2DbDirFmt).path)
+
+    print(f"Loading the database from {database}...")
+    server = WorkerServer(
+        args.socket,
+        load_database(database),
+        n_workers=args.workers,
+        idle_timeout=args.idle_timeout or None,
+    )
+    print(f"Listening on {args.socket}.")
+    server.serve()
+
+
+if __name__ == "__main__":
+    main()
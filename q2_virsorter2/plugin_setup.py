@@ -5,16 +5,61 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import importlib
 
 from q2_types.feature_data import FeatureData, Sequence
 from q2_types.metadata import ImmutableMetadata
-from qiime2.plugin import Citations, Float, Int, Plugin, Range
+from qiime2.plugin import (
+    Bool,
+    Choices,
+    Citations,
+    Collection,
+    Float,
+    Int,
+    List,
+    Metadata,
+    Plugin,
+    Range,
+    Str,
+    TypeMap,
+)
 
 from q2_virsorter2 import __version__
-from q2_virsorter2.types._format import Virsorter2DbDirFmt
-from q2_virsorter2.types._type import Virsorter2Db
-from q2_virsorter2.virsorter2_fetch_db import fetch_db
-from q2_virsorter2.virsorter2_run import run
+from q2_virsorter2.types._format import (
+    BgzfIndexFormat,
+    FastaIndexFormat,
+    GzippedDNAFASTAFormat,
+    GzippedDNASequencesDirFmt,
+    IndexedDNAFASTADirFmt,
+    Virsorter2CompressedDbDirFmt,
+    Virsorter2DbDirFmt,
+    Virsorter2DbIndexFormat,
+    Virsorter2ResultsDirFmt,
+    Virsorter2TableFormat,
+)
+from q2_virsorter2.types._type import (
+    CompressedSequence,
+    IndexedSequence,
+    Virsorter2CompressedDb,
+    Virsorter2Db,
+    Virsorter2Results,
+)
+from q2_virsorter2.virsorter2_collate import collate_results
+from q2_virsorter2.virsorter2_compress_db import compress_db
+from q2_virsorter2.virsorter2_extract_regions import extract_regions
+from q2_virsorter2.virsorter2_fetch_db import fetch_db, import_db
+from q2_virsorter2.virsorter2_index_sequences import index_sequences
+from q2_virsorter2.virsorter2_merge import merge_results
+from q2_virsorter2.virsorter2_optimize_db import optimize_db
+from q2_virsorter2.virsorter2_partition import partition_sequences
+from q2_virsorter2.virsorter2_run import (
+    RUN_PROFILES,
+    _classify_partition,
+    classify,
+    run,
+)
+from q2_virsorter2.virsorter2_summarize import summarize
+from q2_virsorter2.virsorter2_update_db import update_db
 
 citations = Citations.load("citations.bib", package="q2_virsorter2")
 
@@ -30,9 +75,24 @@ plugin = Plugin(
 
 plugin.register_formats(
     Virsorter2DbDirFmt,
+    FastaIndexFormat,
+    IndexedDNAFASTADirFmt,
+    Virsorter2DbIndexFormat,
+    Virsorter2CompressedDbDirFmt,
+    GzippedDNAFASTAFormat,
+    GzippedDNASequencesDirFmt,
+    BgzfIndexFormat,
+    Virsorter2TableFormat,
+    Virsorter2ResultsDirFmt,
 )
 
-plugin.register_semantic_types(Virsorter2Db)
+plugin.register_semantic_types(
+    Virsorter2Db,
+    Virsorter2CompressedDb,
+    CompressedSequence,
+    IndexedSequence,
+    Virsorter2Results,
+)
 
 plugin.register_artifact_class(
     Virsorter2Db,
@@ -40,15 +100,71 @@ plugin.register_artifact_class(
     description=("VirSorter2 database."),
 )
 
+plugin.register_artifact_class(
+    Virsorter2CompressedDb,
+    directory_format=Virsorter2CompressedDbDirFmt,
+    description=("VirSorter2 database with block-compressed files."),
+)
+
+plugin.register_artifact_class(
+    Virsorter2Results,
+    directory_format=Virsorter2ResultsDirFmt,
+    description=(
+        "Viral sequences, scores and boundaries of a single VirSorter2 run, "
+        "which may not contain any viral calls."
+    ),
+)
+
+plugin.register_artifact_class(
+    FeatureData[CompressedSequence],
+    directory_format=GzippedDNASequencesDirFmt,
+    description=(
+        "DNA sequences in a gzip (or BGZF) compressed FASTA file, optionally "
+        "with .fai and .gzi indices for random access."
+    ),
+)
+
+plugin.register_artifact_class(
+    FeatureData[IndexedSequence],
+    directory_format=IndexedDNAFASTADirFmt,
+    description=(
+        "DNA sequences in a FASTA file stored with their .fai index for "
+        "random access."
+    ),
+)
+
+# Viral sequences are written uncompressed or as an indexed BGZF file
+P_compress, T_viral_sequences = TypeMap(
+    {
+        Bool % Choices(False): FeatureData[Sequence],
+        Bool % Choices(True): FeatureData[CompressedSequence],
+    }
+)
+compress_param_description = (
+    "Write the viral sequences as a BGZF compressed FASTA file with .fai and "
+    ".gzi indices, compressed in parallel while the records are written. "
+    "The indexed file can be read at random positions, e.g., with "
+    "'samtools faidx'."
+)
+
 plugin.methods.register_function(
     function=fetch_db,
     inputs={},
     parameters={
         "n_jobs": Int % Range(1, None),
+        "url": Str,
+        "checksum": Str,
     },
     outputs=[("database", Virsorter2Db)],
     parameter_descriptions={
         "n_jobs": "Number of simultaneous downloads.",
+        "url": "URL of the database archive (e.g., "
+        "https://osf.io/v46sc/download). If given, the archive is downloaded "
+        "in parallel chunks instead of running 'virsorter setup'. Interrupted "
+        "downloads are resumed and the archive is cached between invocations "
+        "(see the Q2_VIRSORTER2_CACHE_DIR environment variable).",
+        "checksum": "Expected checksum of the archive downloaded from 'url', "
+        "given as '<algorithm>:<digest>' (e.g., 'md5:<digest>').",
     },
     output_descriptions={"database": "Virsorter2 database."},
     name="Fetch virsorter2 database.",
@@ -61,40 +177,386 @@ plugin.methods.register_function(
 )
 
 plugin.methods.register_function(
+    function=import_db,
+    inputs={},
+    parameters={
+        "archive": Str,
+        "checksum": Str,
+        "n_jobs": Int % Range(1, None),
+    },
+    outputs=[("database", Virsorter2Db)],
+    parameter_descriptions={
+        "archive": "Path to a local copy of the VirSorter2 database archive "
+        "(db.tgz).",
+        "checksum": "Expected checksum of the archive, given as "
+        "'<algorithm>:<digest>' (e.g., 'md5:<digest>'). The checksum is "
+        "computed while the archive is extracted and always reported.",
+        "n_jobs": "Number of threads writing the extracted files.",
+    },
+    output_descriptions={"database": "Virsorter2 database."},
+    name="Import virsorter2 database from a local archive.",
+    description=(
+        "Import a previously downloaded Virsorter2 database archive without "
+        "accessing the network. The archive is decompressed, verified and "
+        "extracted in a single streaming pass."
+    ),
+    citations=[citations["VirSorter2"]],
+)
+
+plugin.methods.register_function(
+    function=update_db,
+    inputs={"database": Virsorter2Db},
+    parameters={
+        "release": Str,
+        "n_jobs": Int % Range(1, None),
+    },
+    outputs=[("updated_database", Virsorter2Db)],
+    input_descriptions={"database": "The Virsorter2 database to update."},
+    parameter_descriptions={
+        "release": "Path to the new database release, either as a directory "
+        "or as an archive (db.tgz).",
+        "n_jobs": "Number of threads used to compare and write files.",
+    },
+    output_descriptions={"updated_database": "The updated Virsorter2 database."},
+    name="Update virsorter2 database.",
+    description=(
+        "Update a Virsorter2 database to a newer release. Files are compared "
+        "by their checksums; only new and changed files are taken from the "
+        "release, while unchanged files are reused from the existing "
+        "database. A summary of the changes is printed."
+    ),
+    citations=[citations["VirSorter2"]],
+)
+
+plugin.methods.register_function(
+    function=compress_db,
+    inputs={"database": Virsorter2Db},
+    parameters={
+        "n_jobs": Int % Range(1, None),
+    },
+    outputs=[("compressed_database", Virsorter2CompressedDb)],
+    input_descriptions={"database": "Virsorter2 database."},
+    parameter_descriptions={
+        "n_jobs": "Number of threads used for compression.",
+    },
+    output_descriptions={"compressed_database": "Compressed Virsorter2 database."},
+    name="Compress virsorter2 database.",
+    description=(
+        "Compress every file of a Virsorter2 database in independent blocks. "
+        "The compressed database is several times smaller and can be used "
+        "wherever a database is expected; it is decompressed in parallel "
+        "into a cache the first time it is used. The cache location and its "
+        "size (least recently used databases are evicted first) can be set "
+        "with the Q2_VIRSORTER2_CACHE_DIR and Q2_VIRSORTER2_CACHE_MB "
+        "environment variables."
+    ),
+)
+
+plugin.methods.register_function(
+    function=optimize_db,
+    inputs={"database": Virsorter2Db},
+    parameters={},
+    outputs=[("optimized_database", Virsorter2Db)],
+    input_descriptions={"database": "Virsorter2 database."},
+    output_descriptions={
+        "optimized_database": "Virsorter2 database with every distinct HMM "
+        "profile stored once."
+    },
+    name="Deduplicate the HMM profiles of a virsorter2 database.",
+    description=(
+        "Store HMM profiles that occur in several files of the database only "
+        "once, in 'hmm/shared', together with an index of the files (and "
+        "names) they belong to, which makes the stored artifact smaller. "
+        "Searches are not reduced: 'virsorter run' needs the original files, "
+        "so classify and the worker restore them byte for byte once per "
+        "database version into the cache (see compress-db) and search every "
+        "copy as before, with results identical to those of the original "
+        "database."
+    ),
+)
+
+run_params = {
+    "n_jobs": Int % Range(1, None),
+    "min_score": Float % Range(0, 1),
+    "min_length": Int % Range(0, None),
+    "profile": Str % Choices(list(RUN_PROFILES)),
+    "prune_intermediates": Bool,
+    "scratch_cap": Int % Range(1, None),
+    "memory_cap": Int % Range(1, None),
+    "window_size": Int % Range(1000, None),
+    "window_overlap": Int % Range(0, None),
+    "n_shards": Int % Range(1, None),
+    "shard_timeout": Int % Range(1, None),
+    "max_retries": Int % Range(0, None),
+    "speculative": Bool,
+    "worker_socket": Str,
+    "progress_file": Str,
+    "compress_sequences": P_compress,
+}
+run_param_descriptions = {
+    "n_jobs": "Max number of jobs allowed in parallel.",
+    "min_score": "Minimal score to be identified as viral.",
+    "min_length": "Minimal sequence length required. All sequences "
+    "shorter than this will be removed.",
+    "profile": "Set of VirSorter2 options to run with. 'fast' skips the "
+    "provirus boundary extension and samples at most 20 ORFs per sequence, "
+    "for a first-pass triage of large inputs at a small loss of recall. "
+    "'sensitive' scores the sequences against the models of all viral "
+    "groups (including NCLDV, RNA viruses and lavidaviruses) instead of only "
+    "dsDNA phages and ssDNA viruses.",
+    "prune_intermediates": "Delete intermediate files from the work "
+    "directory as soon as the steps consuming them have finished. The "
+    "peak scratch usage is reported at the end of the run.",
+    "scratch_cap": "Approximate scratch space available for the run (in "
+    "MB). Parallelism is reduced so that the estimated disk usage of the "
+    "running jobs stays below this value.",
+    "memory_cap": "Memory available for the run (in MB). Every job is "
+    "given an estimate that grows with the size of its input split and the "
+    "classification models of the database, and jobs are only run "
+    "concurrently while their summed estimates stay below this value. The "
+    "peak memory used by every kind of job is reported at the end of the run.",
+    "window_size": "Contigs longer than this (in bp) are cut into "
+    "overlapping windows that are processed in parallel. The calls made on "
+    "the windows are moved back into contig coordinates and calls that "
+    "overlap between windows are merged. By default, contigs are not cut.",
+    "window_overlap": "Number of bases shared by consecutive windows. It "
+    "should exceed the length of the longest expected provirus, so that "
+    "every provirus is complete in at least one window.",
+    "n_shards": "Number of shards the input sequences are split into. "
+    "Shards have similar total lengths and are processed independently, "
+    "so that only failed shards need to be recomputed.",
+    "shard_timeout": "Maximum time (in seconds) a single shard may run "
+    "before it is terminated and considered failed.",
+    "max_retries": "Number of times a failed or timed-out shard is "
+    "retried, with an exponentially growing delay between attempts.",
+    "speculative": "Start a second copy of shards that run much longer "
+    "than the already finished ones on idle workers. The copy that "
+    "finishes first is used.",
+    "worker_socket": "Path to the Unix socket of a running VirSorter2 worker "
+    "(started with 'python -m q2_virsorter2._worker'). The worker runs the "
+    "classification instead of this action and serves its HMM searches from "
+    "the profiles it keeps loaded. It uses its own copy of the database, "
+    "which must have the same files (names and sizes) as the database input; "
+    "otherwise the run is refused.",
+    "progress_file": "Path to a file that structured progress events are "
+    "appended to as JSON lines: stage starts and ends, the number of "
+    "contigs processed and remaining with an estimated time to completion, "
+    "the Snakemake steps that are done (unsharded runs), and a periodic "
+    "heartbeat with the current resource use. Partitioned runs tag the "
+    "events of every partition with its ID.",
+    "compress_sequences": compress_param_description,
+}
+run_inputs = {
+    "sequences": FeatureData[Sequence],
+    "database": Virsorter2Db | Virsorter2CompressedDb,
+}
+run_input_descriptions = {
+    "sequences": "Input sequences from an assembly or genome "
+    "data for virus detection.",
+    "database": "VirSorter2 database, optionally compressed.",
+}
+run_outputs = [
+    ("viral_sequences", T_viral_sequences),
+    ("viral_score", ImmutableMetadata),
+    ("viral_boundary", ImmutableMetadata),
+]
+run_output_descriptions = {
+    "viral_sequences": "Identified viral sequences.",
+    "viral_score": "Viral score table.",
+    "viral_boundary": "Viral boundary table.",
+}
+
+plugin.methods.register_function(
+    function=classify,
+    inputs=run_inputs,
+    parameters=run_params,
+    input_descriptions=run_input_descriptions,
+    parameter_descriptions=run_param_descriptions,
+    outputs=run_outputs,
+    output_descriptions=run_output_descriptions,
+    name="Identify viral sequences and produce corresponding metadata.",
+    description="Performs analysis for identifying and categorizing viral "
+    "sequences from metagenomic data using VirSorter2 and provides "
+    "corresponding metadata data. This method processes all sequences in a "
+    "single job; use the run pipeline to distribute the work. It fails if "
+    "no viral sequences are identified, as metadata cannot be empty.",
+    citations=[citations["VirSorter2"]],
+)
+
+plugin.methods.register_function(
+    function=_classify_partition,
+    inputs=run_inputs,
+    parameters={
+        **{k: v for k, v in run_params.items() if k != "compress_sequences"},
+        "partition": Str,
+    },
+    input_descriptions=run_input_descriptions,
+    parameter_descriptions={
+        **{
+            k: v for k, v in run_param_descriptions.items() if k != "compress_sequences"
+        },
+        "partition": "ID of the partition, which tags its progress events.",
+    },
+    outputs=[("results", Virsorter2Results)],
+    output_descriptions={"results": "VirSorter2 results of the partition."},
+    name="Identify viral sequences in a partition.",
+    description="Classify a single partition of the input sequences for the "
+    "run pipeline. The results may be empty and are collated with "
+    "collate-results.",
+    citations=[citations["VirSorter2"]],
+)
+
+plugin.methods.register_function(
+    function=index_sequences,
+    inputs={"sequences": FeatureData[Sequence]},
+    parameters={},
+    input_descriptions={"sequences": "The sequences to index."},
+    parameter_descriptions={},
+    outputs=[("indexed_sequences", FeatureData[IndexedSequence])],
+    output_descriptions={
+        "indexed_sequences": "The sequences stored together with their index."
+    },
+    name="Index sequences.",
+    description="Store sequences together with a samtools-compatible FASTA "
+    "index (.fai), so that later actions (e.g., partitioning or extracting "
+    "viral regions) read only the records and regions they need instead of "
+    "indexing the whole file again.",
+)
+
+plugin.methods.register_function(
+    function=partition_sequences,
+    inputs={"sequences": FeatureData[Sequence | CompressedSequence | IndexedSequence]},
+    parameters={"num_partitions": Int % Range(1, None)},
+    input_descriptions={
+        "sequences": "The sequences to partition, optionally compressed or "
+        "indexed. Compressed sequences are decompressed while they are "
+        "partitioned; the index of indexed sequences is used as it is."
+    },
+    parameter_descriptions={
+        "num_partitions": "The number of partitions to split the sequences "
+        "into. Partitions have similar total sequence lengths.",
+    },
+    outputs=[("partitioned_sequences", Collection[FeatureData[Sequence]])],
+    output_descriptions={"partitioned_sequences": "The partitioned sequences."},
+    name="Partition sequences.",
+    description="Partition sequences into groups of similar total length.",
+)
+
+plugin.methods.register_function(
+    function=collate_results,
+    inputs={"results": List[Virsorter2Results]},
+    parameters={"compress_sequences": P_compress},
+    input_descriptions={"results": "VirSorter2 results of each partition."},
+    parameter_descriptions={"compress_sequences": compress_param_description},
+    outputs=run_outputs,
+    output_descriptions=run_output_descriptions,
+    name="Collate VirSorter2 results.",
+    description="Collate the viral sequences, scores and boundaries "
+    "identified in separate partitions of the input sequences. Partitions "
+    "without any viral calls are skipped.",
+)
+
+plugin.methods.register_function(
+    function=merge_results,
+    inputs={
+        "viral_sequences": List[FeatureData[Sequence | CompressedSequence]],
+        "viral_score": List[ImmutableMetadata],
+        "viral_boundary": List[ImmutableMetadata],
+    },
+    parameters={"compress_sequences": P_compress},
+    input_descriptions={
+        "viral_sequences": "Viral sequences of each run, optionally compressed.",
+        "viral_score": "Viral score tables of each run, in the same order.",
+        "viral_boundary": "Viral boundary tables of each run, in the same order.",
+    },
+    parameter_descriptions={"compress_sequences": compress_param_description},
+    outputs=run_outputs,
+    output_descriptions=run_output_descriptions,
+    name="Merge VirSorter2 results.",
+    description="Merge the outputs of many VirSorter2 runs in a streaming "
+    "k-way pass. Only the best-scoring call is kept for every ID and calls "
+    "with identical sequences are reduced to the best-scoring one. Tables "
+    "are sorted externally in bounded chunks, so memory use does not grow "
+    "with the number or size of the inputs.",
+)
+
+plugin.pipelines.register_function(
     function=run,
     inputs={
-        "sequences": FeatureData[Sequence],
-        "database": Virsorter2Db,
+        **run_inputs,
+        "sequences": FeatureData[Sequence | CompressedSequence | IndexedSequence],
     },
     parameters={
-        "n_jobs": Int % Range(1, None),
-        "min_score": Float % Range(0, 1),
-        "min_length": Int % Range(0, None),
+        **run_params,
+        "num_partitions": Int % Range(1, None),
     },
     input_descriptions={
-        "sequences": "Input sequences from an assembly or genome "
-        "data for virus detection.",
-        "database": "VirSorter2 database.",
+        **run_input_descriptions,
+        "sequences": "Input sequences from an assembly or genome data for "
+        "virus detection, optionally gzip (or BGZF) compressed or indexed. "
+        "Compressed sequences are decompressed directly into the partitions.",
     },
     parameter_descriptions={
-        "n_jobs": "Max number of jobs allowed in parallel.",
-        "min_score": "Minimal score to be identified as viral.",
-        "min_length": "Minimal sequence length required. All sequences "
-        "shorter than this will be removed.",
-    },
-    outputs=[
-        ("viral_sequences", FeatureData[Sequence]),
-        ("viral_score", ImmutableMetadata),
-        ("viral_boundary", ImmutableMetadata),
-    ],
-    output_descriptions={
-        "viral_sequences": "Identified viral sequences.",
-        "viral_score": "Viral score table.",
-        "viral_boundary": "Viral boundary table.",
+        **run_param_descriptions,
+        "num_partitions": "The number of partitions to split the sequences "
+        "into. Partitions are classified independently and can be executed "
+        "in parallel, depending on the configured executor. Uncompressed "
+        "sequences are classified directly if there is a single partition.",
     },
+    outputs=run_outputs,
+    output_descriptions=run_output_descriptions,
     name="Identify viral sequences and produce corresponding metadata.",
     description="Performs analysis for identifying and categorizing viral "
     "sequences from metagenomic data using VirSorter2 and provides "
     "corresponding metadata data.",
     citations=[citations["VirSorter2"]],
 )
+
+plugin.methods.register_function(
+    function=extract_regions,
+    inputs={"sequences": FeatureData[Sequence | IndexedSequence]},
+    parameters={"viral_boundary": Metadata},
+    input_descriptions={
+        "sequences": "The sequences that were used as input to the run action, "
+        "optionally indexed (see index-sequences).",
+    },
+    parameter_descriptions={
+        "viral_boundary": "Viral boundary table produced by the run action.",
+    },
+    outputs=[("regions", FeatureData[Sequence])],
+    output_descriptions={
+        "regions": "Viral regions trimmed according to the viral boundaries.",
+    },
+    name="Extract viral regions.",
+    description=(
+        "Extract the trimmed viral regions (e.g., proviruses) from the input "
+        "sequences using the boundaries identified by VirSorter2. Indexed "
+        "sequences are read directly through their index, so only the viral "
+        "regions are read. Other sequences are first copied and indexed in a "
+        "single pass over the whole file."
+    ),
+    citations=[citations["VirSorter2"]],
+)
+
+plugin.visualizers.register_function(
+    function=summarize,
+    inputs={
+        "viral_score": ImmutableMetadata,
+        "viral_boundary": ImmutableMetadata,
+    },
+    parameters={},
+    input_descriptions={
+        "viral_score": "Viral score table produced by the run action.",
+        "viral_boundary": "Viral boundary table produced by the run action.",
+    },
+    name="Summarize VirSorter2 results.",
+    description=(
+        "Summarize the viral scores and boundaries as histograms of scores "
+        "and lengths, a density of length versus score and the counts of "
+        "viral groups and shapes. Both tables are read in chunks into "
+        "fixed bins, so the visualization has the same size for any number "
+        "of viral calls."
+    ),
+)
+
+importlib.import_module("q2_virsorter2.types._transformer")
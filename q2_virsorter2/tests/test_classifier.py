@@ -0,0 +1,163 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from q2_virsorter2._classifier import (
+    GroupClassifier,
+    load_group_models,
+    read_feature_table,
+)
+from q2_virsorter2._results import SCORE_COLUMNS
+
+DB = os.path.join(os.path.dirname(__file__), "data", "type", "vs2_db")
+
+# Columns of a feature table, after "seqname"
+COLUMNS = ("length", "coding_perc", "hallmark", "viral", "cellular")
+
+
+class LinearModel:
+    """A minimal classifier with the scikit-learn interface."""
+
+    n_calls = 0
+
+    def __init__(self, weights, feature_names=None):
+        self.weights = np.asarray(weights, dtype=float)
+        self.classes_ = np.array([0, 1])
+        if feature_names is not None:
+            self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    def predict_proba(self, X):
+        LinearModel.n_calls += 1
+        viral = 1 / (1 + np.exp(-(X @ self.weights)))
+        return np.column_stack([1 - viral, viral])
+
+
+def make_features(n):
+    rng = np.random.default_rng(0)
+    features = pd.DataFrame(
+        rng.random((n, len(COLUMNS))),
+        columns=COLUMNS,
+        index=pd.Index([f"contig_{i}||full" for i in range(n)], name="seqname"),
+    )
+    features["length"] = 1000 * (np.arange(n) + 1)
+    return features
+
+
+def make_pipeline(features):
+    """A group model as VirSorter2 trains it, on an array of features."""
+    model = Pipeline(
+        [
+            ("scale", StandardScaler()),
+            ("forest", RandomForestClassifier(n_estimators=5, random_state=0)),
+        ]
+    )
+    labels = (features["viral"] > features["cellular"]).astype(int)
+    return model.fit(features.to_numpy(), labels.to_numpy())
+
+
+class TestLoadGroupModels(unittest.TestCase):
+    def test_load_group_models(self):
+        features = make_features(20)
+        with tempfile.TemporaryDirectory() as db:
+            for group in ["ssDNA", "dsDNAphage", "NCLDV"]:
+                os.makedirs(os.path.join(db, "group", group))
+            for group in ["ssDNA", "dsDNAphage"]:
+                joblib.dump(
+                    make_pipeline(features), os.path.join(db, "group", group, "model")
+                )
+
+            models = load_group_models(db)
+            self.assertEqual(list(models), ["dsDNAphage", "ssDNA"])
+            self.assertIsInstance(models["ssDNA"], Pipeline)
+
+            self.assertEqual(list(load_group_models(db, groups=["ssDNA"])), ["ssDNA"])
+            with self.assertRaisesRegex(ValueError, "NCLDV"):
+                load_group_models(db, groups=["NCLDV"])
+
+    def test_load_group_models_database(self):
+        # The model of the test database is not a valid joblib file
+        with self.assertRaisesRegex(
+            ValueError, "model of group dsDNAphage .*could not be loaded"
+        ):
+            load_group_models(DB)
+
+
+class TestGroupClassifier(unittest.TestCase):
+    def setUp(self):
+        self.models = {
+            "dsDNAphage": LinearModel(np.ones(len(COLUMNS)) / 1000),
+            "ssDNA": LinearModel([-5.0, 5.0], feature_names=["hallmark", "viral"]),
+        }
+
+    def test_read_feature_table(self):
+        features = make_features(3)
+        with tempfile.TemporaryDirectory() as tmp:
+            ftr_fp = os.path.join(tmp, "all.pdg.ftr")
+            features.to_csv(ftr_fp, sep="\t")
+
+            obs = read_feature_table(ftr_fp)
+
+        self.assertEqual(list(obs.columns), list(COLUMNS))
+        pd.testing.assert_frame_equal(obs, features)
+
+    def test_score_in_batches(self):
+        features = make_features(10)
+        exp = GroupClassifier(self.models).score(features)
+
+        LinearModel.n_calls = 0
+        obs = GroupClassifier(self.models, batch_size=4).score(features)
+
+        # Three batches for each of the two models
+        self.assertEqual(LinearModel.n_calls, 6)
+        pd.testing.assert_frame_equal(obs, exp)
+        self.assertEqual(list(obs.columns), ["dsDNAphage", "ssDNA"])
+        exp_ssdna = 1 / (1 + np.exp(5 * features["hallmark"] - 5 * features["viral"]))
+        np.testing.assert_allclose(obs["ssDNA"], exp_ssdna)
+
+    def test_score_pipeline_in_table_order(self):
+        features = make_features(30)
+        model = make_pipeline(features)
+
+        obs = GroupClassifier({"dsDNAphage": model}).score(features)
+
+        exp = model.predict_proba(features.to_numpy())[:, 1]
+        np.testing.assert_allclose(obs["dsDNAphage"], exp)
+        with self.assertRaisesRegex(ValueError, "expects 5 features.*4 columns"):
+            GroupClassifier({"dsDNAphage": model}).score(features.iloc[:, 1:])
+
+    def test_classify(self):
+        features = make_features(5)
+
+        obs = GroupClassifier(self.models).classify(features)
+
+        self.assertEqual(list(obs.columns), ["dsDNAphage", "ssDNA", *SCORE_COLUMNS])
+        np.testing.assert_allclose(
+            obs["max_score"], obs[["dsDNAphage", "ssDNA"]].max(axis=1)
+        )
+        self.assertEqual(
+            list(obs["max_score_group"]),
+            list(obs[["dsDNAphage", "ssDNA"]].idxmax(axis=1)),
+        )
+        pd.testing.assert_series_equal(obs["length"], features["length"])
+
+    def test_no_models(self):
+        with self.assertRaisesRegex(ValueError, "At least one"):
+            GroupClassifier({})
+
+
+if __name__ == "__main__":
+    unittest.main()
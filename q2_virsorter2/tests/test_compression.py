@@ -0,0 +1,355 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import filecmp
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from q2_virsorter2._compression import (
+    BGZF_BLOCK_SIZE,
+    BGZF_EOF,
+    BgzfReader,
+    BgzfWriter,
+    bgzf_block,
+    compress_directory,
+    compress_file,
+    decompress_directory,
+    extract_archive,
+    hold_cache_entry,
+    is_bgzf,
+    is_gzip,
+    iter_bgzf_blocks,
+    materialize_directory,
+    open_compressed,
+    prune_cache,
+    read_gzi,
+    read_index,
+    release_cache_entry,
+    write_gzi,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+DB = os.path.join(DATA, "type", "vs2_db")
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.compressed = os.path.join(self.tmp.name, "compressed")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_compress_file_blocks(self):
+        src = os.path.join(DB, "hmm", "pfam", "Pfam-A.hmm")
+        dst = os.path.join(self.tmp.name, "Pfam-A.hmm.gz")
+        with ThreadPoolExecutor(2) as pool:
+            entry = compress_file(src, dst, pool, block_size=10000)
+
+        self.assertEqual(entry.size, os.path.getsize(src))
+        self.assertEqual(len(entry.blocks), 9)
+        self.assertEqual(sum(entry.blocks), os.path.getsize(dst))
+        # The blocks form a regular gzip file
+        with gzip.open(dst, "rb") as fh, open(src, "rb") as exp:
+            self.assertEqual(fh.read(), exp.read())
+
+    def test_round_trip(self):
+        out = os.path.join(self.tmp.name, "out")
+        compress_directory(DB, self.compressed, n_jobs=3, block_size=50000)
+        decompress_directory(self.compressed, out, n_jobs=3)
+
+        entries = read_index(os.path.join(self.compressed, "index.tsv"))
+        self.assertIn("hmm/pfam/Pfam-A.hmm", [e.path for e in entries])
+        for entry in entries:
+            self.assertTrue(
+                filecmp.cmp(
+                    os.path.join(DB, entry.path),
+                    os.path.join(out, entry.path),
+                    shallow=False,
+                )
+            )
+
+    def test_decompress_checksum_mismatch(self):
+        src = os.path.join(DATA, "type", "vs2_db_compressed_neg", "corrupted")
+        with self.assertRaisesRegex(ValueError, "Checksum mismatch.*Done_all_setup"):
+            decompress_directory(src, os.path.join(self.tmp.name, "out"))
+
+    def test_decompress_directory_verify_only(self):
+        compress_directory(DB, self.compressed)
+        with patch("q2_virsorter2._compression.os.makedirs") as mock:
+            decompress_directory(self.compressed, None, n_jobs=2)
+        mock.assert_not_called()
+
+        src = os.path.join(DATA, "type", "vs2_db_compressed_neg", "corrupted")
+        with self.assertRaisesRegex(ValueError, "Checksum mismatch"):
+            decompress_directory(src, None)
+
+    def test_read_index_bad_header(self):
+        fp = os.path.join(self.tmp.name, "index.tsv")
+        with open(fp, "w") as fh:
+            fh.write("path\tsize\n")
+        with self.assertRaisesRegex(ValueError, "Unexpected header"):
+            read_index(fp)
+
+    def test_materialize_directory_cached(self):
+        cache = os.path.join(self.tmp.name, "cache")
+        compress_directory(DB, self.compressed)
+
+        first = materialize_directory(self.compressed, cache_dir=cache, n_jobs=2)
+        self.addCleanup(release_cache_entry, first)
+        with patch("q2_virsorter2._compression.decompress_directory") as mock:
+            second = materialize_directory(self.compressed, cache_dir=cache)
+        mock.assert_not_called()
+
+        self.assertEqual(first, second)
+        name = os.path.basename(first)
+        self.assertEqual(sorted(os.listdir(cache)), [name, name + ".lock"])
+        self.assertTrue(os.path.isfile(os.path.join(first, "hmm/pfam/Pfam-A.hmm")))
+
+    def _cache_entry(self, cache, name, size, last_use):
+        path = os.path.join(cache, name)
+        os.makedirs(path)
+        with open(os.path.join(path, "data"), "wb") as fh:
+            fh.truncate(size)
+        os.utime(path, (last_use, last_use))
+        return path
+
+    def test_prune_cache(self):
+        cache = os.path.join(self.tmp.name, "cache")
+        now = time.time()
+        oldest = self._cache_entry(cache, "a", 2**20, now - 3 * 3600)
+        older = self._cache_entry(cache, "b", 2**20, now - 2 * 3600)
+        recent = self._cache_entry(cache, "c", 2**20, now - 60)
+        self._cache_entry(cache, "downloads", 2**20, now - 5 * 3600)
+        self._cache_entry(cache, "d.partial-x", 2**20, now - 5 * 3600)
+
+        # Only entries not used in the last hour are evicted, oldest first
+        self.assertEqual(prune_cache(cache, max_mb=2.5), [oldest])
+        self.assertEqual(prune_cache(cache, max_mb=0, keep=[older]), [])
+        self.assertEqual(
+            sorted(os.listdir(cache)),
+            ["a.lock", "b", "c", "d.partial-x", "downloads"],
+        )
+        self.assertTrue(os.path.isdir(recent))
+
+    def test_prune_cache_held_entries(self):
+        cache = os.path.join(self.tmp.name, "cache")
+        now = time.time()
+        held = self._cache_entry(cache, "a", 2**20, now - 3 * 3600)
+        self._cache_entry(cache, "b", 2**20, now - 2 * 3600)
+
+        # Entries held by a run are never evicted, whatever their last use
+        hold_cache_entry(held)
+        self.addCleanup(release_cache_entry, held)
+        self.assertEqual(prune_cache(cache, max_mb=0), [os.path.join(cache, "b")])
+        self.assertTrue(os.path.isdir(held))
+
+        release_cache_entry(held)
+        self.assertEqual(prune_cache(cache, max_mb=0), [held])
+
+    @patch.dict(os.environ, {"Q2_VIRSORTER2_CACHE_MB": "0"})
+    def test_materialize_directory_evicts_unused(self):
+        cache = os.path.join(self.tmp.name, "cache")
+        stale = self._cache_entry(cache, "stale", 2**20, time.time() - 7200)
+        compress_directory(DB, self.compressed)
+
+        target = materialize_directory(self.compressed, cache_dir=cache)
+        self.addCleanup(release_cache_entry, target)
+
+        # The new entry is held, so only the stale one is evicted
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.isdir(target))
+
+    def test_materialize_directory_failure_leaves_no_partial(self):
+        cache = os.path.join(self.tmp.name, "cache")
+        src = os.path.join(DATA, "type", "vs2_db_compressed_neg", "corrupted")
+        with self.assertRaises(ValueError):
+            materialize_directory(src, cache_dir=cache)
+        self.assertEqual([fn for fn in os.listdir(cache) if "partial" in fn], [])
+
+
+class TestExtractArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.tmp.name, "db.tgz")
+        self.out = os.path.join(self.tmp.name, "out")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _add(self, tar, name, data=b"", type=tarfile.REGTYPE):
+        info = tarfile.TarInfo(name)
+        info.type = type
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+    def test_extract_archive(self):
+        with tarfile.open(self.archive, "w:gz") as tar:
+            tar.add(DB, arcname="db")
+
+        obs = extract_archive(
+            self.archive, self.out, n_jobs=3, strip_prefix="db", window=2
+        )
+
+        with open(self.archive, "rb") as fh:
+            self.assertEqual(obs, hashlib.sha256(fh.read()).hexdigest())
+        for rel_path in ["hmm/pfam/Pfam-A.hmm", "group/dsDNAphage/model"]:
+            self.assertTrue(
+                filecmp.cmp(
+                    os.path.join(DB, rel_path),
+                    os.path.join(self.out, rel_path),
+                    shallow=False,
+                )
+            )
+
+    def test_extract_archive_skips_links(self):
+        with tarfile.open(self.archive, "w:gz") as tar:
+            self._add(tar, "hmm", type=tarfile.DIRTYPE)
+            self._add(tar, "hmm/a.hmm", b"HMMER3/f")
+            info = tarfile.TarInfo("link")
+            info.type, info.linkname = tarfile.SYMTYPE, "/etc/passwd"
+            tar.addfile(info)
+
+        extract_archive(self.archive, self.out, algorithm="md5")
+
+        self.assertEqual(sorted(os.listdir(self.out)), ["hmm"])
+        with open(os.path.join(self.out, "hmm", "a.hmm"), "rb") as fh:
+            self.assertEqual(fh.read(), b"HMMER3/f")
+
+    def test_extract_archive_path_traversal(self):
+        with tarfile.open(self.archive, "w:gz") as tar:
+            self._add(tar, "db/../../evil", b"x")
+
+        with self.assertRaisesRegex(ValueError, "outside of the archive"):
+            extract_archive(self.archive, self.out, strip_prefix="db")
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "evil")))
+
+
+class TestOpenCompressed(unittest.TestCase):
+    def setUp(self):
+        self.fasta = os.path.join(DATA, "fasta", "contigs.fa")
+        with open(self.fasta, "rb") as fh:
+            self.exp = fh.read()
+
+    def test_is_bgzf(self):
+        self.assertTrue(is_bgzf(self.fasta + ".bgz"))
+        self.assertFalse(is_bgzf(self.fasta + ".gz"))
+        self.assertTrue(is_gzip(self.fasta + ".gz"))
+        self.assertFalse(is_gzip(self.fasta))
+
+    def test_iter_bgzf_blocks(self):
+        with open(self.fasta + ".bgz", "rb") as fh:
+            blocks = list(iter_bgzf_blocks(fh))
+
+        self.assertEqual(len(blocks), 7)
+        self.assertEqual(b"".join(map(gzip.decompress, blocks)), self.exp)
+
+    def test_iter_bgzf_blocks_not_bgzf(self):
+        with open(self.fasta + ".gz", "rb") as fh:
+            with self.assertRaisesRegex(ValueError, "Not a BGZF block"):
+                list(iter_bgzf_blocks(fh))
+
+    def test_open_compressed(self):
+        for fn, n_jobs in [("contigs.fa.gz", 4), ("contigs.fa.bgz", 1)]:
+            with open_compressed(os.path.join(DATA, "fasta", fn), n_jobs) as fh:
+                self.assertEqual(fh.read(), self.exp)
+
+    def test_open_compressed_bgzf_parallel(self):
+        with open_compressed(self.fasta + ".bgz", n_jobs=3, window=2) as fh:
+            lines = list(fh)
+
+        self.assertEqual(b"".join(lines), self.exp)
+        self.assertTrue(lines[0].startswith(b">contig_1"))
+
+
+class TestBgzf(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.fp = os.path.join(self.tmp.name, "data.bgz")
+        # Several blocks of data that is not trivially compressible
+        self.data = hashlib.sha256(b"seed").digest() * 20000
+
+    def _write(self, n_jobs, chunk_size=1000):
+        with BgzfWriter(self.fp, n_jobs=n_jobs, window=2) as writer:
+            for i in range(0, len(self.data), chunk_size):
+                writer.write(self.data[i : i + chunk_size])
+        return writer.offsets
+
+    def test_eof_block(self):
+        self.assertEqual(bgzf_block(b""), BGZF_EOF)
+        self.assertEqual(gzip.decompress(bgzf_block(b"ACGT")), b"ACGT")
+
+    def test_writer(self):
+        offsets = self._write(n_jobs=3)
+
+        self.assertTrue(is_bgzf(self.fp))
+        with open(self.fp, "rb") as fh:
+            blocks = list(iter_bgzf_blocks(fh))
+            self.assertEqual(blocks[-1], BGZF_EOF)
+        self.assertEqual(len(blocks), len(offsets) + 1)
+        self.assertEqual(
+            [u for _, u in offsets],
+            list(range(0, len(self.data), BGZF_BLOCK_SIZE)),
+        )
+        with open_compressed(self.fp, n_jobs=2) as fh:
+            self.assertEqual(fh.read(), self.data)
+
+    def test_writer_same_output_for_any_n_jobs(self):
+        self._write(n_jobs=1)
+        with open(self.fp, "rb") as fh:
+            exp = fh.read()
+
+        self._write(n_jobs=4, chunk_size=70000)
+
+        with open(self.fp, "rb") as fh:
+            self.assertEqual(fh.read(), exp)
+
+    def test_gzi_round_trip(self):
+        offsets = self._write(n_jobs=2)
+        gzi = self.fp + ".gzi"
+
+        write_gzi(offsets, gzi)
+
+        self.assertEqual(os.path.getsize(gzi), 8 + 16 * (len(offsets) - 1))
+        self.assertEqual(read_gzi(gzi), offsets)
+
+    def test_read_gzi_truncated(self):
+        write_gzi([(0, 0), (100, 65280)], self.fp + ".gzi")
+        with open(self.fp + ".gzi", "r+b") as fh:
+            fh.truncate(20)
+
+        with self.assertRaisesRegex(ValueError, "unexpected size"):
+            read_gzi(self.fp + ".gzi")
+
+    def test_reader(self):
+        write_gzi(self._write(n_jobs=2), self.fp + ".gzi")
+        reader = BgzfReader(self.fp)
+        self.addCleanup(reader.close)
+
+        # Ranges within a block, across blocks and beyond the end
+        for start, size in [(5, 10), (BGZF_BLOCK_SIZE - 3, 200000), (0, 1)]:
+            self.assertEqual(reader.read(start, size), self.data[start : start + size])
+        self.assertEqual(
+            reader[len(self.data) - 4 : len(self.data) + 4], self.data[-4:]
+        )
+        self.assertEqual(reader[len(self.data) + 1 : len(self.data) + 5], b"")
+        sub = self.data[70000:70004]
+        self.assertEqual(reader.rfind(sub, 0, 80000), self.data.rfind(sub, 0, 80000))
+        self.assertEqual(reader.rfind(b"not there", 0, 1000), -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
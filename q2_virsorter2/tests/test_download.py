@@ -0,0 +1,139 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from q2_virsorter2._download import cached_download, download
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves the payload of the server, with or without range support."""
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status, length):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, len(self.server.payload))
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.headers.get("Range"))
+            fail = self.server.failures > 0
+            self.server.failures -= fail
+        if fail:
+            self.send_error(500)
+            return
+
+        payload = self.server.payload
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range") or "")
+        if self.server.ranges and match:
+            start, end = int(match.group(1)), int(match.group(2))
+            self._headers(206, end - start + 1)
+            self.wfile.write(payload[start : end + 1])
+        else:
+            self._headers(200, len(payload))
+            self.wfile.write(payload)
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.tmp.name, "db.tgz")
+        self.payload = os.urandom(10000)
+        self.sha256 = hashlib.sha256(self.payload).hexdigest()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.payload = self.payload
+        self.server.ranges = True
+        self.server.failures = 0
+        self.server.requests = []
+        self.server.lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/db.tgz"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def _read(self, fp):
+        with open(fp, "rb") as fh:
+            return fh.read()
+
+    def test_download_chunks(self):
+        download(self.url, self.dest, n_jobs=3, chunk_size=3000)
+
+        self.assertEqual(self._read(self.dest), self.payload)
+        self.assertEqual(
+            sorted(self.server.requests),
+            ["bytes=0-2999", "bytes=3000-5999", "bytes=6000-8999", "bytes=9000-9999"],
+        )
+        self.assertEqual(os.listdir(self.tmp.name), ["db.tgz"])
+
+    def test_download_without_ranges(self):
+        self.server.ranges = False
+
+        download(self.url, self.dest, chunk_size=3000)
+
+        self.assertEqual(self._read(self.dest), self.payload)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_download_retries(self):
+        self.server.failures = 2
+
+        download(self.url, self.dest, chunk_size=3000, backoff=0)
+
+        self.assertEqual(self._read(self.dest), self.payload)
+        self.assertEqual(len(self.server.requests), 6)
+
+    def test_download_resumes(self):
+        # A previous attempt completed the second chunk only
+        with open(f"{self.dest}.part", "wb") as fh:
+            fh.write(bytes(3000) + self.payload[3000:6000] + bytes(4000))
+        with open(f"{self.dest}.part.json", "w") as fh:
+            key = {"url": self.url, "size": 10000, "etag": None, "chunk_size": 3000}
+            json.dump({"key": key, "done": [1]}, fh)
+
+        download(self.url, self.dest, chunk_size=3000, checksum=("sha256", self.sha256))
+
+        self.assertEqual(self._read(self.dest), self.payload)
+        self.assertNotIn("bytes=3000-5999", self.server.requests)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_download_checksum_mismatch(self):
+        with self.assertRaisesRegex(ValueError, "does not match"):
+            download(self.url, self.dest, checksum=("sha256", "0" * 64))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_cached_download(self):
+        cache = os.path.join(self.tmp.name, "cache")
+        checksum = ("sha256", self.sha256)
+
+        first = cached_download(self.url, cache, checksum=checksum)
+        second = cached_download(self.url, cache, checksum=checksum)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self._read(second), self.payload)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from q2_virsorter2._events import (
+    EventStream,
+    count_fasta_records,
+    process_tree_usage,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+class TestEventStream(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.events = EventStream(callback=self.received.append)
+
+    def test_emit_to_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fp = os.path.join(tmp, "progress.jsonl")
+            events = EventStream(fp)
+            events.emit("first", value=1)
+            events.emit("second")
+
+            with open(fp) as fh:
+                records = [json.loads(line) for line in fh]
+
+        self.assertEqual([r["event"] for r in records], ["first", "second"])
+        self.assertEqual(records[0]["value"], 1)
+        self.assertEqual(records[0]["source"].split(":")[-1], str(os.getpid()))
+        self.assertIn("time", records[0])
+
+    def test_inactive_stream(self):
+        events = EventStream()
+        self.assertFalse(events.active)
+        with events, events.stage("nothing"):
+            events.emit("ignored")
+        self.assertIsNone(events._thread)
+
+    def test_stage(self):
+        with self.events.stage("classify", shard="shard-0"):
+            pass
+
+        started, finished = self.received
+        self.assertEqual(started["event"], "stage_started")
+        self.assertEqual(finished["event"], "stage_finished")
+        self.assertEqual(finished["status"], "ok")
+        self.assertEqual(finished["shard"], "shard-0")
+        self.assertGreaterEqual(finished["duration_seconds"], 0)
+
+    def test_stage_failed(self):
+        with self.assertRaises(ValueError):
+            with self.events.stage("classify"):
+                raise ValueError("boom")
+
+        self.assertEqual(self.received[-1]["status"], "failed")
+        self.assertEqual(self.received[-1]["error"], "boom")
+
+    @patch("q2_virsorter2._events.time.monotonic")
+    def test_progress_eta(self, mock_monotonic):
+        mock_monotonic.side_effect = [0.0, 0.0, 10.0, 30.0]
+
+        self.events.set_total(8)
+        self.events.advance(2)
+        self.events.advance(4)
+
+        self.assertEqual(
+            [
+                (e["contigs_processed"], e["contigs_remaining"], e["eta_seconds"])
+                for e in self.received
+            ],
+            [(0, 8, None), (2, 6, 30.0), (6, 2, 10.0)],
+        )
+
+    def test_finish(self):
+        self.events.finish()
+        self.events.set_total(8)
+        self.events.advance(3)
+        self.events.finish()
+        self.events.finish()
+
+        # Progress is only reported once the total is known, and only when
+        # it increases
+        self.assertEqual([e["contigs_processed"] for e in self.received], [0, 3, 8])
+
+    def test_steps(self):
+        self.events.steps(1, 4)
+
+        (event,) = self.received
+        self.assertEqual(event["event"], "steps")
+        self.assertEqual((event["steps_done"], event["steps_total"]), (1, 4))
+
+    def test_tags(self):
+        events = EventStream(callback=self.received.append, tags={"partition": "1"})
+        events.emit("custom", partition_size=3)
+        self.assertEqual(self.received[-1]["partition"], "1")
+        self.assertEqual(self.received[-1]["partition_size"], 3)
+
+    def test_heartbeat(self):
+        self.events.probes["scratch_mb"] = lambda: 12.5
+        self.events.probes["broken"] = lambda: 1 / 0
+
+        self.events.heartbeat()
+
+        (beat,) = self.received
+        self.assertEqual(beat["event"], "heartbeat")
+        self.assertEqual(beat["scratch_mb"], 12.5)
+        self.assertIsNone(beat["broken"])
+        for field in ["n_processes", "cpu_seconds", "rss_mb", "load_1m"]:
+            self.assertIn(field, beat)
+
+    def test_heartbeat_thread(self):
+        self.events.heartbeat_interval = 0.05
+        with self.events:
+            time.sleep(0.3)
+        n_beats = len(self.received)
+
+        self.assertGreaterEqual(n_beats, 2)
+        time.sleep(0.1)
+        self.assertEqual(len(self.received), n_beats)
+
+
+class TestResourceUsage(unittest.TestCase):
+    @unittest.skipUnless(os.path.isdir("/proc"), "requires /proc")
+    def test_process_tree_usage(self):
+        obs = process_tree_usage()
+        self.assertGreaterEqual(obs["n_processes"], 1)
+        self.assertGreater(obs["rss_mb"], 0)
+
+    def test_process_tree_usage_unknown_pid(self):
+        with patch("q2_virsorter2._events.read_proc_stats", return_value={}):
+            obs = process_tree_usage(123)
+        self.assertEqual(obs, {"n_processes": 0, "cpu_seconds": 0, "rss_mb": 0})
+
+    def test_count_fasta_records(self):
+        self.assertEqual(count_fasta_records(os.path.join(DATA, "fasta/contigs.fa")), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import io
+import os
+import tempfile
+import unittest
+
+from q2_virsorter2._compression import is_bgzf, open_compressed
+from q2_virsorter2._fasta import (
+    BgzfFastaWriter,
+    FaidxRecord,
+    IndexedFasta,
+    build_fasta_index,
+    compress_fasta,
+    iter_fasta,
+    read_fasta_index,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data", "fasta")
+
+
+def _read_fasta(fp):
+    seqs, name = {}, None
+    with open(fp) as fh:
+        for line in fh:
+            if line.startswith(">"):
+                name = line[1:].split()[0]
+                seqs[name] = ""
+            else:
+                seqs[name] += line.strip()
+    return seqs
+
+
+class TestFastaIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(DATA, "contigs.fa")
+        self.seqs = _read_fasta(self.fasta)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_build_fasta_index(self):
+        index_fp = os.path.join(self.tmp.name, "contigs.fa.fai")
+        self.assertEqual(build_fasta_index(self.fasta, index_fp), 4)
+
+        with open(index_fp) as obs, open(
+            os.path.join(DATA, "indexed", "dna-sequences.fasta.fai")
+        ) as exp:
+            self.assertEqual(obs.read(), exp.read())
+
+    def test_build_fasta_index_with_copy(self):
+        index_fp = os.path.join(self.tmp.name, "copy.fa.fai")
+        copy_fp = os.path.join(self.tmp.name, "copy.fa")
+        build_fasta_index(self.fasta, index_fp, copy_to=copy_fp)
+
+        with open(copy_fp) as obs, open(self.fasta) as exp:
+            self.assertEqual(obs.read(), exp.read())
+
+    def test_build_fasta_index_inconsistent_lines(self):
+        fasta_fp = os.path.join(self.tmp.name, "bad.fa")
+        with open(fasta_fp, "w") as fh:
+            fh.write(">seq1\nACGT\nAC\nACGT\n")
+        with self.assertRaisesRegex(ValueError, "Different line length.*seq1"):
+            build_fasta_index(fasta_fp, fasta_fp + ".fai")
+
+    def test_build_fasta_index_no_header(self):
+        fasta_fp = os.path.join(self.tmp.name, "bad.fa")
+        with open(fasta_fp, "w") as fh:
+            fh.write("ACGT\n>seq1\nACGT\n")
+        with self.assertRaisesRegex(ValueError, "header"):
+            build_fasta_index(fasta_fp, fasta_fp + ".fai")
+
+    def test_iter_fasta(self):
+        with open(self.fasta, "rb") as fh:
+            obs = {name: seq.decode() for name, seq in iter_fasta(fh)}
+        self.assertEqual(obs, self.seqs)
+
+    def test_read_fasta_index(self):
+        index = read_fasta_index(
+            os.path.join(DATA, "indexed", "dna-sequences.fasta.fai")
+        )
+        self.assertEqual(list(index), ["contig_1", "contig_2", "contig_3", "contig_4"])
+        self.assertEqual(index["contig_2"], FaidxRecord("contig_2", 60, 190, 60, 61))
+
+
+class TestIndexedFasta(unittest.TestCase):
+    def setUp(self):
+        self.fasta = os.path.join(DATA, "indexed", "dna-sequences.fasta")
+        self.seqs = _read_fasta(self.fasta)
+
+    def test_fetch_full(self):
+        with IndexedFasta(self.fasta) as fasta:
+            self.assertEqual(len(fasta), 4)
+            self.assertIn("contig_3", fasta)
+            for name, seq in self.seqs.items():
+                self.assertEqual(fasta.fetch(name), seq)
+
+    def test_fetch_regions(self):
+        seq = self.seqs["contig_4"]
+        with IndexedFasta(self.fasta) as fasta:
+            for start, end in [(0, 1), (69, 71), (65, 145), (140, 205), (200, 500)]:
+                self.assertEqual(fasta.fetch("contig_4", start, end), seq[start:end])
+            self.assertEqual(fasta.fetch("contig_4", 10, 10), "")
+
+    def test_write_records(self):
+        out = io.BytesIO()
+        with IndexedFasta(self.fasta) as fasta:
+            fasta.write_records(["contig_3", "contig_1"], out)
+
+        lines = out.getvalue().decode().splitlines()
+        self.assertEqual(lines[0], ">contig_3")
+        self.assertEqual(lines[2], ">contig_1 some description")
+        self.assertEqual("".join(lines[3:]), self.seqs["contig_1"])
+
+    def test_write_records_header_with_gt(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        fasta_fp = os.path.join(tmp.name, "gt.fa")
+        with open(fasta_fp, "w") as fh:
+            fh.write(">seq1 a>b\nACGT\n>seq2 len>100 x>y\nGGCC\nTT\n")
+        build_fasta_index(fasta_fp, fasta_fp + ".fai")
+
+        out = io.BytesIO()
+        with IndexedFasta(fasta_fp) as fasta:
+            fasta.write_records(["seq2", "seq1"], out)
+
+        self.assertEqual(
+            out.getvalue(), b">seq2 len>100 x>y\nGGCC\nTT\n>seq1 a>b\nACGT\n"
+        )
+
+
+class TestCompressFasta(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.bgzf = os.path.join(self.tmp.name, "contigs.fa.gz")
+
+    def test_compress_fasta(self):
+        fasta = os.path.join(DATA, "contigs.fa")
+        with open(fasta, "rb") as fh:
+            self.assertEqual(compress_fasta(fh, self.bgzf, n_jobs=2), 4)
+
+        self.assertTrue(is_bgzf(self.bgzf))
+        with open_compressed(self.bgzf) as obs, open(fasta, "rb") as exp:
+            self.assertEqual(obs.read(), exp.read())
+        with open(self.bgzf + ".fai") as obs, open(
+            os.path.join(DATA, "indexed", "dna-sequences.fasta.fai")
+        ) as exp:
+            self.assertEqual(obs.read(), exp.read())
+
+    def test_bgzf_fasta_writer(self):
+        fasta = os.path.join(DATA, "contigs.fa")
+        with open(fasta, "rb") as fh:
+            content = fh.read()
+
+        # Writes end in the middle of lines and headers
+        with BgzfFastaWriter(self.bgzf, n_jobs=2) as out:
+            for start in range(0, len(content), 7):
+                out.write(content[start : start + 7])
+
+        self.assertEqual(out.n_records, 4)
+        with open_compressed(self.bgzf) as obs:
+            self.assertEqual(obs.read(), content)
+        with open(self.bgzf + ".fai") as obs, open(
+            os.path.join(DATA, "indexed", "dna-sequences.fasta.fai")
+        ) as exp:
+            self.assertEqual(obs.read(), exp.read())
+
+    def test_indexed_fasta_bgzf(self):
+        # Records span several blocks
+        seqs = {f"seq{i}": "ACGTTGCA"[i:] * 20000 for i in range(4)}
+        content = "".join(
+            f">{name}\n"
+            + "\n".join(seq[j : j + 60] for j in range(0, len(seq), 60))
+            + "\n"
+            for name, seq in seqs.items()
+        )
+        compress_fasta(io.BytesIO(content.encode()), self.bgzf, n_jobs=3)
+
+        with IndexedFasta(self.bgzf) as fasta:
+            self.assertEqual(fasta.fetch("seq3"), seqs["seq3"])
+            for start, end in [(0, 5), (65270, 65300), (30000, 130000)]:
+                self.assertEqual(
+                    fasta.fetch("seq1", start, end), seqs["seq1"][start:end]
+                )
+            out = io.BytesIO()
+            fasta.write_records(["seq2"], out)
+        self.assertEqual(
+            "".join(out.getvalue().decode().splitlines()[1:]), seqs["seq2"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,17 +5,30 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------sss
+import itertools
+import os
+import tempfile
+from unittest.mock import patch
+
 from qiime2.plugin import ValidationError
 from qiime2.plugin.testing import TestPluginBase
 
 from q2_virsorter2.types._format import (
+    BgzfIndexFormat,
+    FastaIndexFormat,
     GeneralBinaryFileFormat,
     GeneralTSVFormat,
+    GzippedDNAFASTAFormat,
     HallmarkGeneListFormat,
     HMMFormat,
+    IndexedDNAFASTADirFmt,
     RbsCatetoryFormat,
     RbsCatetoryNotesFormat,
+    Virsorter2CompressedDbDirFmt,
     Virsorter2DbDirFmt,
+    Virsorter2DbIndexFormat,
+    Virsorter2ResultsDirFmt,
+    Virsorter2TableFormat,
 )
 
 
@@ -196,3 +209,172 @@ class TestVirsorter2DbFormats(TestPluginBase):
         filepath = self.get_data_path("type/vs2_db/")
         format = Virsorter2DbDirFmt(filepath, mode="r")
         format.validate()
+
+
+class TestIndexedDNAFASTAFormats(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def test_FastaIndexFormat(self):
+        filepath = self.get_data_path("fasta/indexed/dna-sequences.fasta.fai")
+        format = FastaIndexFormat(filepath, mode="r")
+        format.validate()
+
+    # Test the case of a missing field
+    def test_FastaIndexFormat_neg1(self):
+        filepath = self.get_data_path("type/fai_neg/fai-neg1.fai")
+        format = FastaIndexFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "Expected 5 fields"):
+            format.validate()
+
+    # Test the case of a non-numeric field
+    def test_FastaIndexFormat_neg2(self):
+        filepath = self.get_data_path("type/fai_neg/fai-neg2.fai")
+        format = FastaIndexFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "non-negative integers"):
+            format.validate()
+
+    def test_IndexedDNAFASTADirFmt(self):
+        filepath = self.get_data_path("fasta/indexed/")
+        format = IndexedDNAFASTADirFmt(filepath, mode="r")
+        format.validate()
+
+
+class TestVirsorter2CompressedDbFormats(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.cache = tempfile.TemporaryDirectory()
+        patcher = patch.dict(os.environ, {"Q2_VIRSORTER2_CACHE_DIR": self.cache.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache.cleanup)
+
+    def test_Virsorter2DbIndexFormat(self):
+        filepath = self.get_data_path("type/vs2_db_compressed/index.tsv")
+        format = Virsorter2DbIndexFormat(filepath, mode="r")
+        format.validate()
+
+    def test_Virsorter2DbIndexFormat_neg(self):
+        filepath = self.get_data_path("type/vs2_db_neg/Pfam-A-neg1.tsv")
+        format = Virsorter2DbIndexFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "Unexpected header"):
+            format.validate()
+
+    def test_Virsorter2CompressedDbDirFmt(self):
+        filepath = self.get_data_path("type/vs2_db_compressed/")
+        format = Virsorter2CompressedDbDirFmt(filepath, mode="r")
+        format.validate(level="min")
+        # The checksums are verified without writing to the cache
+        format.validate(level="max")
+        self.assertEqual(os.listdir(self.cache.name), [])
+
+    # Test the case of a truncated compressed file
+    def test_Virsorter2CompressedDbDirFmt_neg1(self):
+        filepath = self.get_data_path("type/vs2_db_compressed_neg/truncated/")
+        format = Virsorter2CompressedDbDirFmt(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "Pfam-A.hmm is truncated"):
+            format.validate(level="min")
+
+    # Test the case of a file not matching its checksum
+    def test_Virsorter2CompressedDbDirFmt_neg2(self):
+        filepath = self.get_data_path("type/vs2_db_compressed_neg/corrupted/")
+        format = Virsorter2CompressedDbDirFmt(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "Checksum mismatch"):
+            format.validate(level="max")
+
+
+class TestGzippedDNAFASTAFormat(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def test_GzippedDNAFASTAFormat(self):
+        for fn in ["contigs.fa.gz", "contigs.fa.bgz"]:
+            filepath = self.get_data_path(f"fasta/{fn}")
+            format = GzippedDNAFASTAFormat(filepath, mode="r")
+            format.validate()
+
+    # Test the case of an uncompressed file
+    def test_GzippedDNAFASTAFormat_neg1(self):
+        filepath = self.get_data_path("fasta/contigs.fa")
+        format = GzippedDNAFASTAFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "not gzip compressed"):
+            format.validate()
+
+    # Test the case of a truncated file
+    def test_GzippedDNAFASTAFormat_neg2(self):
+        with open(self.get_data_path("fasta/contigs.fa.gz"), "rb") as fh:
+            data = fh.read()
+        filepath = os.path.join(self.temp_dir.name, "truncated.fa.gz")
+        with open(filepath, "wb") as fh:
+            fh.write(data[:-20])
+        format = GzippedDNAFASTAFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "could not be parsed"):
+            format.validate()
+
+
+class TestBgzfIndexFormat(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def _write(self, offsets, n_entries=None):
+        filepath = os.path.join(self.temp_dir.name, "contigs.fa.gz.gzi")
+        with open(filepath, "wb") as fh:
+            fh.write((n_entries or len(offsets)).to_bytes(8, "little"))
+            for offset in itertools.chain.from_iterable(offsets):
+                fh.write(offset.to_bytes(8, "little"))
+        return BgzfIndexFormat(filepath, mode="r")
+
+    def test_BgzfIndexFormat(self):
+        self._write([(1000, 65280), (2100, 130560)]).validate()
+
+    # Test the case of an index with a wrong number of entries
+    def test_BgzfIndexFormat_neg1(self):
+        format = self._write([(1000, 65280)], n_entries=2)
+        with self.assertRaisesRegex(ValidationError, "unexpected size"):
+            format.validate()
+
+    # Test the case of offsets that are not sorted
+    def test_BgzfIndexFormat_neg2(self):
+        format = self._write([(2100, 130560), (1000, 65280)])
+        with self.assertRaisesRegex(ValidationError, "ascending order"):
+            format.validate()
+
+
+class TestVirsorter2ResultsFormats(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def _write(self, content, fn="final-viral-score.tsv"):
+        filepath = os.path.join(self.temp_dir.name, fn)
+        with open(filepath, "w") as fh:
+            fh.write(content)
+        return filepath
+
+    def test_Virsorter2TableFormat(self):
+        for fn in ["final-viral-score.tsv", "final-viral-boundary.tsv"]:
+            filepath = self.get_data_path(f"type/vs2_out/{fn}")
+            Virsorter2TableFormat(filepath, mode="r").validate()
+
+    # Test the case of a table without viral calls
+    def test_Virsorter2TableFormat_header_only(self):
+        filepath = self._write("seqname\tmax_score\n")
+        Virsorter2TableFormat(filepath, mode="r").validate()
+
+    # Test the case of a table without the seqname column
+    def test_Virsorter2TableFormat_neg1(self):
+        filepath = self._write("name\tmax_score\na\t0.9\n")
+        format = Virsorter2TableFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "'seqname' column"):
+            format.validate()
+
+    # Test the case of a row with missing fields
+    def test_Virsorter2TableFormat_neg2(self):
+        filepath = self._write("seqname\tmax_score\na\n")
+        format = Virsorter2TableFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "Line 2: Expected 2 fields"):
+            format.validate()
+
+    def test_Virsorter2ResultsDirFmt(self):
+        self._write("", fn="final-viral-combined.fa")
+        self._write("seqname\tmax_score\n")
+        self._write("seqname\tmax_score\n", fn="final-viral-boundary.tsv")
+        format = Virsorter2ResultsDirFmt(self.temp_dir.name, mode="r")
+        format.validate()
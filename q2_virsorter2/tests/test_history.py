@@ -0,0 +1,246 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from q2_virsorter2 import _history
+from q2_virsorter2._events import EventStream
+from q2_virsorter2._history import (
+    HISTORY_ENV,
+    RunHistory,
+    RunRecorder,
+    database_checksum,
+    database_manifest,
+    main,
+    report,
+    score_runs,
+)
+
+DB = os.path.join(os.path.dirname(__file__), "data", "type", "vs2_db")
+
+
+def _run(duration, input_mb=10, status="ok", n_jobs=4, database="abc"):
+    return {
+        "started": "2024-05-01T10:00:00+00:00",
+        "action": "classify",
+        "status": status,
+        "input_bytes": input_mb * 2**20,
+        "database_checksum": database,
+        "parameters": {"n_jobs": n_jobs, "progress_file": None},
+        "plugin_version": "1.0",
+        "virsorter2_version": "2.2.4",
+        "duration_seconds": duration,
+        "peak_memory_mb": 500.0,
+    }
+
+
+class TestRunHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.history_fp = os.path.join(self.tmp, "history.sqlite")
+        patcher = patch.dict(os.environ, {"Q2_VIRSORTER2_CACHE_DIR": self.tmp})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_add_and_runs(self):
+        with RunHistory(self.history_fp) as history:
+            run_id = history.add(_run(100), {"classify": (1, 99.5)})
+            history.add({**_run(5), "action": "fetch_db"})
+
+        with RunHistory(self.history_fp) as history:
+            runs = history.runs("classify")
+            self.assertEqual(len(history.runs()), 2)
+
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0]["id"], run_id)
+        self.assertEqual(runs[0]["parameters"], {"n_jobs": 4, "progress_file": None})
+        self.assertEqual(runs[0]["stages"], {"classify": 99.5})
+
+    def test_recorder_inactive(self):
+        with patch.dict(os.environ, {HISTORY_ENV: ""}):
+            with RunRecorder("classify") as recorder:
+                pass
+
+        self.assertFalse(recorder.active)
+        self.assertFalse(os.path.exists(self.history_fp))
+
+    def test_recorder(self):
+        input_fp = os.path.join(self.tmp, "input.fa")
+        with open(input_fp, "wb") as fh:
+            fh.truncate(2048)
+
+        with patch.dict(os.environ, {HISTORY_ENV: self.history_fp}):
+            recorder = RunRecorder(
+                "classify", {"n_jobs": 2}, input_fp=input_fp, database=DB
+            )
+        events = EventStream(callback=recorder.on_event, heartbeat_interval=None)
+        with recorder:
+            for _ in range(2):
+                with events.stage("shard"):
+                    pass
+            events.emit("memory_usage", peak_mb=123456.0)
+
+        with RunHistory(self.history_fp) as history:
+            (run,) = history.runs()
+        self.assertEqual(run["status"], "ok")
+        self.assertEqual(run["input_bytes"], 2048)
+        self.assertEqual(run["database_checksum"], database_checksum(DB))
+        self.assertEqual(run["parameters"], {"n_jobs": 2})
+        self.assertEqual(run["peak_memory_mb"], 123456.0)
+        self.assertEqual(list(run["stages"]), ["shard"])
+        self.assertEqual(recorder.stages["shard"][0], 2)
+
+    def test_recorder_failed_run(self):
+        recorder = RunRecorder("fetch_db", path=self.history_fp)
+        with self.assertRaises(KeyError):
+            with recorder:
+                raise KeyError("boom")
+
+        with RunHistory(self.history_fp) as history:
+            self.assertEqual(history.runs()[0]["status"], "failed")
+
+    def test_recorder_unwritable_history(self):
+        recorder = RunRecorder("fetch_db", path=os.path.join(self.tmp, "no", "h.db"))
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            with recorder:
+                pass
+
+        self.assertIn("could not be recorded", stdout.getvalue())
+
+    def test_recorder_checksum_error(self):
+        recorder = RunRecorder(
+            "classify", path=self.history_fp, database=os.path.join(self.tmp, "db")
+        )
+        with patch(
+            "q2_virsorter2._history.database_checksum", side_effect=OSError("boom")
+        ), patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            with recorder:
+                pass
+
+        # The run itself does not fail
+        self.assertIn("could not be recorded", stdout.getvalue())
+
+    def test_database_checksum(self):
+        db = os.path.join(self.tmp, "db")
+        shutil.copytree(DB, db)
+        checksum = database_checksum(db)
+
+        # Databases with different files get different fingerprints
+        with open(os.path.join(db, "rbs", "rbs-catetory.tsv"), "ab") as fh:
+            fh.write(b"X")
+        self.assertNotEqual(database_checksum(db), checksum)
+
+    def test_database_checksum_cached(self):
+        db = os.path.join(self.tmp, "db")
+        shutil.copytree(DB, db)
+        checksum = database_checksum(db)
+
+        # Copies of the database at other paths are not read again
+        copy = os.path.join(self.tmp, "copy")
+        shutil.copytree(DB, copy)
+        with patch(
+            "q2_virsorter2._history._file_digest", wraps=_history._file_digest
+        ) as digest:
+            self.assertEqual(database_checksum(copy), checksum)
+            digest.assert_not_called()
+
+        # Copies with the same contents have the same fingerprint
+        self.assertEqual(database_checksum(DB, cache_dir=self.tmp), checksum)
+        self.assertEqual(
+            database_checksum(DB, cache_dir=os.path.join(self.tmp, "other")),
+            checksum,
+        )
+
+    def test_database_checksum_pruned(self):
+        dbs = []
+        for i in range(3):
+            db = os.path.join(self.tmp, f"db{i}")
+            os.makedirs(db)
+            with open(os.path.join(db, "file"), "w") as fh:
+                fh.write("x" * i)
+            dbs.append(db)
+
+        with patch("q2_virsorter2._history.MAX_DIGESTS", 2):
+            for db in dbs:
+                database_checksum(db)
+
+        # Only the fingerprints of the most recently used databases are kept
+        with open(os.path.join(self.tmp, _history.DIGESTS_FILE)) as fh:
+            digests = json.load(fh)
+        self.assertEqual(set(digests), {database_manifest(db) for db in dbs[1:]})
+
+
+class TestScoreRuns(unittest.TestCase):
+    def _runs(self, *runs):
+        return [{**r, "id": i} for i, r in enumerate(runs, start=1)]
+
+    def test_score_runs(self):
+        runs = self._runs(
+            _run(100), _run(110), _run(90), _run(105), _run(300), _run(98)
+        )
+
+        scores = score_runs(runs)
+
+        self.assertEqual(scores[:3], [None, None, None])
+        self.assertLess(abs(scores[3]), 1)
+        self.assertGreater(scores[4], 10)
+        self.assertLess(scores[5], 2)
+
+    def test_score_runs_comparable(self):
+        runs = self._runs(
+            _run(100),
+            _run(110),
+            _run(90),
+            # Other parameters, database or input size, and failed runs
+            _run(300, n_jobs=1),
+            _run(300, database="def"),
+            _run(300, input_mb=100),
+            _run(300, status="failed"),
+            # Runtimes are compared per MB of input
+            _run(150, input_mb=15),
+        )
+
+        scores = score_runs(runs)
+
+        self.assertEqual(scores[3:7], [None] * 4)
+        self.assertLess(abs(scores[7]), 1)
+
+    def test_report(self):
+        runs = self._runs(_run(100), _run(110), _run(90), _run(300))
+        out = io.StringIO()
+
+        n_slow = report(runs, out=out)
+
+        self.assertEqual(n_slow, 1)
+        lines = out.getvalue().splitlines()
+        self.assertIn("classify\t1.0\t2.2.4\t4\t10.50\t500", lines)
+        self.assertTrue(lines[-3].endswith("SLOWER"))
+        self.assertTrue(lines[-3].startswith("4\t2024-05-01T10:00:00\tclassify"))
+
+    def test_main(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        history_fp = os.path.join(tmp, "history.sqlite")
+        with RunHistory(history_fp) as history:
+            for duration in [100, 110, 90, 300]:
+                history.add(_run(duration))
+
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            main(["report", "--history", history_fp, "--threshold", "100"])
+
+        self.assertIn("0 run(s) slower than their baseline", stdout.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
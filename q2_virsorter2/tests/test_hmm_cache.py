@@ -0,0 +1,95 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pyhmmer.plan7 import HMM, OptimizedProfile
+
+from q2_virsorter2 import _hmm_cache
+from q2_virsorter2._hmm_cache import HMMCache, get_cache, load_hmms
+
+HMM_FP = os.path.join(
+    os.path.dirname(__file__), "data", "type", "vs2_db", "hmm", "pfam", "Pfam-A.hmm"
+)
+
+
+class TestHMMCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _copy(self, name):
+        fp = os.path.join(self.tmp, name)
+        shutil.copy(HMM_FP, fp)
+        return fp
+
+    def test_get(self):
+        cache = HMMCache()
+        hmms = cache.get(HMM_FP)
+
+        self.assertEqual([hmm.name for hmm in hmms], ["AF2331-like"])
+        self.assertIsInstance(hmms[0], HMM)
+        self.assertIs(cache.get(HMM_FP), hmms)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIn(HMM_FP, cache)
+
+    def test_get_optimized(self):
+        cache = HMMCache()
+        first = cache.get(HMM_FP, optimized=True)
+        second = cache.get(HMM_FP, optimized=True)
+
+        self.assertIsInstance(first[0], OptimizedProfile)
+        self.assertEqual(first[0].name, "AF2331-like")
+        # Every caller gets its own copy to search
+        self.assertIsNot(first[0], second[0])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_changed_file_is_parsed_again(self):
+        fp = self._copy("a.hmm")
+        cache = HMMCache()
+        cache.get(fp)
+        os.utime(fp, ns=(0, 0))
+
+        self.assertNotIn(fp, cache)
+        cache.get(fp)
+        self.assertEqual(cache.misses, 2)
+
+    def test_lru_eviction(self):
+        size_mb = os.path.getsize(HMM_FP) / 2**20
+        a, b, c = self._copy("a.hmm"), self._copy("b.hmm"), self._copy("c.hmm")
+        cache = HMMCache(budget_mb=2.5 * size_mb)
+        cache.get(a)
+        cache.get(b)
+        cache.get(a)
+        cache.get(c)
+
+        # b was the least recently used file
+        self.assertEqual(len(cache), 2)
+        self.assertIn(a, cache)
+        self.assertNotIn(b, cache)
+        self.assertIn(c, cache)
+        self.assertEqual(cache.size, 2 * os.path.getsize(HMM_FP))
+
+    def test_entry_larger_than_budget_is_kept(self):
+        cache = HMMCache(budget_mb=0)
+        cache.get(HMM_FP)
+        self.assertEqual(len(cache), 1)
+
+    @patch.dict(os.environ, {"Q2_VIRSORTER2_HMM_CACHE_MB": "10"})
+    def test_process_wide_cache(self):
+        with patch.object(_hmm_cache, "_CACHE", None):
+            self.assertIs(get_cache(), get_cache())
+            self.assertEqual(get_cache().budget, 10 * 2**20)
+            self.assertIs(load_hmms(HMM_FP), load_hmms(HMM_FP))
+
+
+if __name__ == "__main__":
+    unittest.main()
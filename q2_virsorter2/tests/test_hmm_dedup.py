@@ -0,0 +1,200 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import filecmp
+import os
+import shutil
+import tempfile
+import unittest
+
+from q2_virsorter2._hmm_dedup import (
+    SHARED_HMM,
+    deduplicate_database,
+    expand_database,
+    is_deduplicated,
+    iter_hmm_records,
+    merge_positions,
+    profile_digest,
+    profile_name,
+    read_membership,
+    rename_profile,
+)
+from q2_virsorter2._worker import _hmmsearch_job, load_database
+
+DB = os.path.join(os.path.dirname(__file__), "data", "type", "vs2_db")
+PFAM = os.path.join("hmm", "pfam", "Pfam-A.hmm")
+VIRAL = os.path.join("hmm", "viral", "combined.hmm")
+
+
+def _variant(record, name, desc):
+    # Profiles with another description are distinct, but still hit the
+    # same proteins
+    record = rename_profile(record, name)
+    return record.replace(b"DESC  AF2331-like", f"DESC  {desc}".encode())
+
+
+def make_database(path):
+    """Copies the test database with profiles shared by two files."""
+    shutil.copytree(DB, path)
+    (profile,) = list(iter_hmm_records(os.path.join(DB, PFAM)))[:1]
+    os.makedirs(os.path.join(path, "hmm", "viral"))
+    with open(os.path.join(path, PFAM), "wb") as fh:
+        fh.write(profile + _variant(profile, "pfam_only", "only in Pfam"))
+    with open(os.path.join(path, VIRAL), "wb") as fh:
+        fh.write(
+            _variant(profile, "viral_only", "only in viral")
+            + rename_profile(profile, "viral_copy")
+        )
+    return profile
+
+
+class TestHMMRecords(unittest.TestCase):
+    def test_iter_hmm_records(self):
+        records = list(iter_hmm_records(os.path.join(DB, PFAM)))
+
+        self.assertEqual(len(records), 2)
+        self.assertTrue(records[0].endswith(b"//\n"))
+        # The last profile of the test file has no terminator
+        self.assertFalse(records[1].endswith(b"//\n"))
+        self.assertEqual([profile_name(r) for r in records], ["AF2331-like", "AglB_L1"])
+
+    def test_profile_digest_ignores_name(self):
+        record = next(iter_hmm_records(os.path.join(DB, PFAM)))
+        renamed = rename_profile(record, "other")
+
+        self.assertEqual(profile_name(renamed), "other")
+        self.assertEqual(profile_digest(renamed), profile_digest(record))
+        self.assertNotEqual(
+            profile_digest(_variant(record, "other", "changed")),
+            profile_digest(record),
+        )
+
+    def test_rename_profile_keeps_name_line(self):
+        record = next(iter_hmm_records(os.path.join(DB, PFAM)))
+        spaced = record.replace(b"NAME  AF2331-like\n", b"NAME   AF2331-like \r\n")
+        renamed = rename_profile(spaced, "other")
+
+        self.assertIn(b"NAME   other \r\n", renamed)
+        self.assertEqual(rename_profile(renamed, "AF2331-like"), spaced)
+        # Copies with another NAME line layout could not be restored byte
+        # for byte from a single shared copy, so they are distinct
+        self.assertNotEqual(profile_digest(spaced), profile_digest(record))
+
+    def test_merge_positions(self):
+        obs = list(merge_positions(["a", "b"], {0: "x", 2: "y", 4: "z"}))
+
+        self.assertEqual(obs, [(0, "x"), (1, "a"), (2, "y"), (3, "b"), (4, "z")])
+        self.assertEqual(list(merge_positions([], {1: "x"})), [(1, "x")])
+
+
+class TestDeduplicateDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.src = os.path.join(self.tmp, "db")
+        self.profile = make_database(self.src)
+        self.dst = os.path.join(self.tmp, "optimized")
+        os.makedirs(self.dst)
+
+    def test_deduplicate_database(self):
+        stats = deduplicate_database(self.src, self.dst)
+
+        self.assertEqual(stats, {"profiles": 4, "unique": 3, "shared": 1})
+        self.assertTrue(is_deduplicated(self.dst))
+        shared = list(iter_hmm_records(os.path.join(self.dst, SHARED_HMM)))
+        digest = profile_digest(self.profile)
+        self.assertEqual(shared, [rename_profile(self.profile, digest)])
+        for hmm_file, name in [(PFAM, "pfam_only"), (VIRAL, "viral_only")]:
+            records = list(iter_hmm_records(os.path.join(self.dst, hmm_file)))
+            self.assertEqual([profile_name(r) for r in records], [name])
+        self.assertEqual(
+            read_membership(self.dst),
+            {
+                PFAM: {0: ("AF2331-like", digest)},
+                VIRAL: {1: ("viral_copy", digest)},
+            },
+        )
+        # Other files are taken over unchanged
+        self.assertTrue(
+            filecmp.cmp(
+                os.path.join(self.src, "rbs", "rbs-catetory.tsv"),
+                os.path.join(self.dst, "rbs", "rbs-catetory.tsv"),
+            )
+        )
+        self.assertTrue(
+            filecmp.cmp(
+                os.path.join(self.src, "hmm", "pfam", "Pfam-A.tsv"),
+                os.path.join(self.dst, "hmm", "pfam", "Pfam-A.tsv"),
+            )
+        )
+
+    def test_deduplicate_database_twice(self):
+        deduplicate_database(self.src, self.dst)
+        with self.assertRaisesRegex(ValueError, "already been deduplicated"):
+            deduplicate_database(self.dst, os.path.join(self.tmp, "again"))
+
+    def test_deduplicate_database_nothing_shared(self):
+        stats = deduplicate_database(DB, self.dst)
+
+        self.assertEqual(stats, {"profiles": 2, "unique": 2, "shared": 0})
+        self.assertFalse(is_deduplicated(self.dst))
+        self.assertTrue(
+            filecmp.cmp(os.path.join(DB, PFAM), os.path.join(self.dst, PFAM))
+        )
+
+    def test_expand_database(self):
+        deduplicate_database(self.src, self.dst)
+        cache = os.path.join(self.tmp, "cache")
+
+        expanded = expand_database(self.dst, cache_dir=cache)
+
+        self.assertEqual(expand_database(self.dst, cache_dir=cache), expanded)
+        self.assertFalse(os.path.exists(os.path.join(expanded, "hmm", "shared")))
+        for hmm_file in [PFAM, VIRAL]:
+            self.assertTrue(
+                filecmp.cmp(
+                    os.path.join(self.src, hmm_file),
+                    os.path.join(expanded, hmm_file),
+                    shallow=False,
+                )
+            )
+        self.assertEqual(
+            [e.name for e in os.scandir(cache) if e.is_dir()],
+            [os.path.basename(expanded)],
+        )
+
+    def test_expand_database_changed_contents(self):
+        deduplicate_database(self.src, self.dst)
+        cache = os.path.join(self.tmp, "cache")
+        expanded = expand_database(self.dst, cache_dir=cache)
+
+        # A database with other files is a new version
+        with open(os.path.join(self.dst, "rbs", "rbs-catetory.tsv"), "ab") as fh:
+            fh.write(b"X")
+
+        self.assertNotEqual(expand_database(self.dst, cache_dir=cache), expanded)
+
+    def test_hmmsearch_identical_results(self):
+        deduplicate_database(self.src, self.dst)
+        consensus = load_database(self.src)["hmms"][PFAM][0].consensus
+        proteins = os.path.join(self.tmp, "proteins.faa")
+        with open(proteins, "w") as fh:
+            fh.write(f">prot_1\n{consensus.upper()}\n>prot_2\nMKKKKKKK\n")
+
+        outputs = []
+        for db in [self.src, self.dst]:
+            output = os.path.join(self.tmp, f"{os.path.basename(db)}.tsv")
+            outputs.append(_hmmsearch_job(load_database(db), proteins, output))
+
+        self.assertEqual(outputs[0]["n_hits"], 4)
+        self.assertEqual(outputs[1]["n_hits"], 4)
+        with open(outputs[0]["output"]) as exp, open(outputs[1]["output"]) as obs:
+            self.assertEqual(obs.read(), exp.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from q2_virsorter2._hmmsearch import (
+    PATH_ENV,
+    SOCKET_ENV,
+    main,
+    parse_args,
+    write_script,
+)
+from q2_virsorter2._worker import WorkerServer
+
+
+class TestParseArgs(unittest.TestCase):
+    def test_parse_args(self):
+        obs = parse_args(
+            ["-T", "50", "--tblout", "/out.tbl", "--cpu", "2", "--noali"]
+            + ["-o", os.devnull, "/db/a.hmm", "/split.faa"]
+        )
+
+        self.assertEqual(
+            obs,
+            {
+                "hmm_file": "/db/a.hmm",
+                "sequences": "/split.faa",
+                "output": "/out.tbl",
+                "T": 50.0,
+                "cpu": 2,
+            },
+        )
+
+    def test_parse_args_unsupported(self):
+        for argv in [
+            # Without a table of hits
+            ["/db/a.hmm", "/split.faa"],
+            # With a main output that is kept
+            ["--tblout", "/out.tbl", "-o", "/out.txt", "/db/a.hmm", "/split.faa"],
+            # With other outputs or options
+            ["--tblout", "/out.tbl", "--domtblout", "/d.tbl", "/a.hmm", "/s.faa"],
+            ["--tblout", "/out.tbl", "-Z", "1000", "/a.hmm", "/s.faa"],
+            # Reading from stdin or with invalid values
+            ["--tblout", "/out.tbl", "/a.hmm", "-"],
+            ["--tblout", "/out.tbl", "-T", "high", "/a.hmm", "/s.faa"],
+            ["--tblout"],
+        ]:
+            with self.subTest(argv=argv):
+                self.assertIsNone(parse_args(argv))
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.argv = ["--tblout", "/out.tbl", "/db/a.hmm", "/split.faa"]
+
+    def _serve(self, handler):
+        socket_path = os.path.join(self.tmp.name, "search.sock")
+        server = WorkerServer(socket_path, {}, {"tblout": handler})
+        thread = threading.Thread(target=server.serve, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return socket_path
+
+    def test_main_served(self):
+        searches = []
+        socket_path = self._serve(lambda resources, **args: searches.append(args))
+
+        with patch.dict(os.environ, {SOCKET_ENV: socket_path}), patch(
+            "os.execv"
+        ) as execv:
+            self.assertEqual(main(self.argv), 0)
+
+        execv.assert_not_called()
+        self.assertEqual(
+            searches,
+            [
+                {
+                    "hmm_file": "/db/a.hmm",
+                    "sequences": "/split.faa",
+                    "output": "/out.tbl",
+                }
+            ],
+        )
+
+    def test_main_fallback(self):
+        # A fake hmmsearch that is found on the original PATH
+        fake = os.path.join(self.tmp.name, "original", "hmmsearch")
+        os.makedirs(os.path.dirname(fake))
+        with open(fake, "w") as fh:
+            fh.write("#!/bin/sh\n")
+        os.chmod(fake, 0o755)
+
+        def fail(resources, **args):
+            raise ValueError("not loaded")
+
+        socket_path = self._serve(fail)
+        env = {SOCKET_ENV: socket_path, PATH_ENV: os.path.dirname(fake)}
+        for argv in [self.argv, ["--domtblout", "/d.tbl", "/a.hmm", "/s.faa"]]:
+            with self.subTest(argv=argv):
+                with patch.dict(os.environ, env), patch("os.execv") as execv:
+                    main(argv)
+
+                execv.assert_called_once_with(fake, [fake, *argv])
+
+    def test_main_not_found(self):
+        with patch.dict(os.environ, {PATH_ENV: self.tmp.name}):
+            self.assertEqual(main(self.argv), 127)
+
+    def test_write_script(self):
+        script_fp = write_script(os.path.join(self.tmp.name, "bin"))
+
+        self.assertEqual(os.path.basename(script_fp), "hmmsearch")
+        self.assertTrue(os.access(script_fp, os.X_OK))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from q2_virsorter2._memory import (
+    MemoryMonitor,
+    _process_label,
+    database_memory,
+    memory_estimate,
+)
+
+
+class TestMemory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _model(self, group, size):
+        os.makedirs(os.path.join(self.tmp, "group", group))
+        with open(os.path.join(self.tmp, "group", group, "model"), "wb") as fh:
+            fh.truncate(size)
+
+    def test_database_memory(self):
+        self._model("dsDNAphage", 10 * 2**20)
+        self._model("NCLDV", 2**20)
+        self.assertEqual(database_memory(self.tmp), 30)
+
+    def test_database_memory_without_models(self):
+        self.assertEqual(database_memory(self.tmp), 0)
+
+    def test_memory_estimate(self):
+        self._model("dsDNAphage", 2**20)
+        self.assertEqual(
+            memory_estimate(self.tmp, 8000), "min(max(2*input.size_mb+3,1000),8000)"
+        )
+
+    def test_memory_estimate_is_evaluated_per_job(self):
+        self._model("dsDNAphage", 100 * 2**20)
+        expression = memory_estimate(self.tmp, 2000)
+        # Snakemake evaluates the expression with the input of every job
+        for size_mb, expected in [(1, 1000), (400, 1100), (5000, 2000)]:
+            self.assertEqual(
+                eval(expression, {"input": MagicMock(size_mb=size_mb)}), expected
+            )
+
+    def _start_job(self):
+        script = os.path.join(self.tmp, "job.py")
+        with open(script, "w") as fh:
+            fh.write("import time\nprint('started', flush=True)\ntime.sleep(30)\n")
+        proc = subprocess.Popen([sys.executable, script], stdout=subprocess.PIPE)
+        self.addCleanup(proc.stdout.close)
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.kill)
+        # The script only runs once the process was replaced by the interpreter
+        proc.stdout.readline()
+        return proc
+
+    @unittest.skipUnless(os.path.exists("/proc/self/cmdline"), "requires /proc")
+    def test_process_label(self):
+        proc = self._start_job()
+
+        self.assertEqual(_process_label(proc.pid), "job.py")
+        self.assertIsNone(_process_label(2**30))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/stat"), "requires /proc")
+    def test_memory_monitor(self):
+        self._start_job()
+        events = MagicMock()
+
+        monitor = MemoryMonitor(cap_mb=1000, events=events)
+        monitor.poll()
+        monitor.report()
+
+        self.assertIn("job.py", monitor.peak_by_process)
+        self.assertGreater(monitor.peak_mb, 0)
+        events.emit.assert_called_once()
+        self.assertEqual(events.emit.call_args.args, ("memory_usage",))
+        self.assertEqual(events.emit.call_args.kwargs["cap_mb"], 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from q2_virsorter2._merge import (
+    FastaPool,
+    group_by_key,
+    merge_runs,
+    read_header,
+    read_records,
+    sort_records,
+)
+
+
+class TestMerge(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _write(self, name, content):
+        fp = os.path.join(self.tmp, name)
+        with open(fp, "w") as fh:
+            fh.write(content)
+        return fp
+
+    def _runs(self, tables, max_rows=100):
+        run_fps = []
+        for i, rows in enumerate(tables):
+            table_fp = self._write(f"table-{i}.tsv", "id\tv\n#q2:types\tn\n" + rows)
+            records = read_records(table_fp, i)
+            run_fps.extend(sort_records(records, self.tmp, f"t{i}", max_rows))
+        return run_fps
+
+    def test_read_header_skips_types(self):
+        fp = self._write("t.tsv", "id\tv\n#q2:types\tnumeric\nx\t1\n")
+        self.assertEqual(read_header(fp), ["id", "v"])
+
+    def test_sort_records(self):
+        (run_fp,) = self._runs(["c\t3\na\t1\nb\t2\n"])
+        with open(run_fp) as fh:
+            self.assertEqual(fh.read(), "a\t0\ta\t1\nb\t0\tb\t2\nc\t0\tc\t3\n")
+
+    def test_sort_records_spills_chunks(self):
+        run_fps = self._runs(["c\t1\na\t2\nc\t3\nb\t4\nc\t5\n"], max_rows=2)
+
+        # Every chunk is sorted on its own, equal keys keep the table order
+        self.assertEqual(len(run_fps), 3)
+        self.assertEqual(
+            [row for _, _, row in merge_runs(run_fps, self.tmp)],
+            ["a\t2", "b\t4", "c\t1", "c\t3", "c\t5"],
+        )
+        self.assertEqual(sort_records(iter([]), self.tmp, "empty"), [])
+
+    def test_merge_runs(self):
+        run_fps = self._runs(["b\t1\nd\t1\n", "a\t2\nb\t2\n", "c\t3\n"])
+        self.assertEqual(
+            [(key, source) for key, source, _ in merge_runs(run_fps, self.tmp)],
+            [("a", 1), ("b", 0), ("b", 1), ("c", 2), ("d", 0)],
+        )
+
+    def test_merge_runs_multi_pass(self):
+        tables = [f"k{i % 3}\t{i}\n" for i in range(10)]
+        run_fps = self._runs(tables)
+        merged = list(merge_runs(run_fps, self.tmp, max_open=2))
+
+        self.assertEqual(merged, list(merge_runs(run_fps, self.tmp)))
+        # Multi-pass merges in the same directory do not interfere
+        first = merge_runs(run_fps, self.tmp, max_open=2)
+        second = merge_runs(run_fps, self.tmp, max_open=2)
+        self.assertEqual(list(zip(first, second)), list(zip(merged, merged)))
+        # Equal keys stay in input order across passes
+        self.assertEqual([s for k, s, _ in merged if k == "k0"], [0, 3, 6, 9])
+
+    def test_group_by_key(self):
+        records = [("a", 0, "a\t1"), ("a", 1, "a\t2"), ("b", 0, "b\t3")]
+        self.assertEqual(
+            [(key, len(group)) for key, group in group_by_key(records)],
+            [("a", 2), ("b", 1)],
+        )
+
+    def test_fasta_pool(self):
+        fasta_fps = [
+            self._write(f"{i}.fa", f">s{i}\nACGT{i}\n>x\nTT\n") for i in range(3)
+        ]
+        out = io.BytesIO()
+        with FastaPool(fasta_fps, self.tmp, max_open=1) as pool:
+            self.assertEqual(pool.fetch(2, "s2"), "ACGT2")
+            self.assertEqual(pool.fetch(0, "s0"), "ACGT0")
+            self.assertIsNone(pool.fetch(0, "s1"))
+            pool.write_record(1, "x", out)
+            pool.write_record(1, "missing", out)
+            self.assertEqual(len(pool._open), 1)
+        self.assertEqual(out.getvalue(), b">x\nTT\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+from q2_virsorter2 import ViralCall, iter_viral_calls
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+SCORE = os.path.join(DATA, "type", "vs2_out", "final-viral-score.tsv")
+BOUNDARY = os.path.join(DATA, "type", "vs2_out", "final-viral-boundary.tsv")
+
+
+class TestIterViralCalls(unittest.TestCase):
+    def test_all_calls(self):
+        calls = list(iter_viral_calls(SCORE))
+
+        self.assertEqual(len(calls), 8)
+        first = calls[0]
+        self.assertEqual(first.seqname, "Caudo-circular||full")
+        self.assertEqual(first.contig, "Caudo-circular")
+        self.assertEqual(first.groups, ("dsDNAphage", "ssDNA"))
+        self.assertEqual(first.score("ssDNA"), 0.467)
+        self.assertEqual(first.max_score, 0.993)
+        self.assertEqual(first.length, 31746)
+        self.assertEqual(first.hallmark, 4)
+        self.assertIsNone(first.trim_bp_start)
+        # Calls with too few genes have no scores
+        self.assertIsNone(calls[-1].max_score)
+        self.assertEqual(calls[-1].group_scores, (None, None))
+
+    def test_records_are_compact(self):
+        call = next(iter_viral_calls(SCORE))
+        self.assertIsInstance(call, ViralCall)
+        self.assertFalse(hasattr(call, "__dict__"))
+
+    def test_filters(self):
+        calls = iter_viral_calls(
+            SCORE, min_score=0.9, groups=["dsDNAphage"], min_length=10000
+        )
+        self.assertEqual(
+            [c.seqname for c in calls],
+            ["Caudo-circular||full", "Caudo-linear||full"],
+        )
+
+        calls = iter_viral_calls(SCORE, max_length=5000)
+        self.assertEqual(
+            [c.seqname for c in calls],
+            ["ssDNA-linear||full", "Caudo-1hallmarkgene||lt2gene"],
+        )
+
+    def test_boundaries(self):
+        calls = {c.seqname: c for c in iter_viral_calls(SCORE, BOUNDARY)}
+
+        provirus = calls["Caudo-provirus||0_partial"]
+        self.assertEqual(
+            (provirus.trim_bp_start, provirus.trim_bp_end), (95069, 133274)
+        )
+        self.assertEqual(calls["Caudo-circular||full"].shape, "circular")
+        self.assertIsNone(calls["Caudo-1hallmarkgene||lt2gene"].trim_bp_start)
+
+    def test_metadata_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(SCORE) as fh:
+                header, *lines = fh.readlines()
+            with open(os.path.join(tmp, "metadata.tsv"), "w") as fh:
+                fh.write(header.replace("seqname", "sample_name", 1))
+                fh.write("#q2:types\tnumeric\tnumeric\tnumeric\tcategorical\n")
+                fh.writelines(lines)
+
+            self.assertEqual(len(list(iter_viral_calls(tmp))), 8)
+
+    def test_sequence_offsets(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fasta = os.path.join(tmp, "final-viral-combined.fa")
+            with open(fasta, "w") as fh:
+                fh.write(">Caudo-circular||full\nACGTACGT\nAC\n")
+                fh.write(">Caudo-linear||full\nACG\n")
+
+            calls = list(iter_viral_calls(SCORE, sequences_fp=fasta))
+
+        self.assertEqual((calls[0].sequence_offset, calls[0].sequence_length), (22, 10))
+        self.assertEqual((calls[1].sequence_offset, calls[1].sequence_length), (54, 3))
+        self.assertIsNone(calls[2].sequence_offset)
+
+
+if __name__ == "__main__":
+    unittest.main()
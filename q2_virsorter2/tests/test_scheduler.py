@@ -0,0 +1,143 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import threading
+import unittest
+from collections import Counter
+
+from q2_virsorter2._scheduler import run_shards
+
+
+class TestRunShards(unittest.TestCase):
+    def setUp(self):
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def _count(self, shard):
+        with self.lock:
+            self.calls[shard] += 1
+
+    def test_all_succeed(self):
+        def attempt(shard, number, cancel):
+            self._count(shard)
+            return shard * 2
+
+        obs = run_shards([1, 2, 3], attempt, n_workers=2, poll_interval=0.01)
+
+        self.assertEqual(obs, [2, 4, 6])
+        self.assertEqual(self.calls, Counter({1: 1, 2: 1, 3: 1}))
+
+    def test_retry_only_failed_shard(self):
+        def attempt(shard, number, cancel):
+            self._count(shard)
+            if shard == "b" and number < 3:
+                raise RuntimeError("node hiccup")
+            return shard
+
+        obs = run_shards(
+            ["a", "b", "c"],
+            attempt,
+            n_workers=3,
+            max_retries=2,
+            backoff=0.01,
+            poll_interval=0.01,
+        )
+
+        self.assertEqual(obs, ["a", "b", "c"])
+        self.assertEqual(self.calls, Counter({"a": 1, "b": 3, "c": 1}))
+
+    def test_retries_exhausted(self):
+        def attempt(shard, number, cancel):
+            raise RuntimeError("broken")
+
+        with self.assertRaisesRegex(Exception, "Shard 0 failed after 2 attempt"):
+            run_shards(
+                ["a"],
+                attempt,
+                n_workers=1,
+                max_retries=1,
+                backoff=0.01,
+                poll_interval=0.01,
+            )
+
+    def test_timeout_then_retry(self):
+        def attempt(shard, number, cancel):
+            if number == 1:
+                # Hang until the scheduler abandons the attempt
+                cancel.wait(5)
+                return None
+            return shard
+
+        obs = run_shards(
+            ["a"],
+            attempt,
+            n_workers=1,
+            timeout=0.05,
+            max_retries=1,
+            backoff=0.01,
+            poll_interval=0.01,
+        )
+        self.assertEqual(obs, ["a"])
+
+    def test_timeout_without_retries(self):
+        def attempt(shard, number, cancel):
+            cancel.wait(5)
+
+        with self.assertRaisesRegex(Exception, "Timed out"):
+            run_shards(["a"], attempt, n_workers=1, timeout=0.05, poll_interval=0.01)
+
+    def test_speculative_copy_wins(self):
+        cancelled = threading.Event()
+
+        def attempt(shard, number, cancel):
+            self._count(shard)
+            if shard == "slow" and number == 1:
+                # The straggler only stops when it is cancelled
+                cancel.wait(5)
+                cancelled.set()
+                return "straggler"
+            return shard
+
+        obs = run_shards(
+            ["fast", "slow"],
+            attempt,
+            n_workers=2,
+            speculative=True,
+            speculative_factor=1.0,
+            poll_interval=0.01,
+        )
+
+        self.assertEqual(obs, ["fast", "slow"])
+        self.assertEqual(self.calls["slow"], 2)
+        self.assertTrue(cancelled.is_set())
+
+    def test_superseded_results_discarded(self):
+        discarded = []
+
+        def attempt(shard, number, cancel):
+            if shard == "slow" and number == 1:
+                cancel.wait(5)
+                return "straggler"
+            return shard
+
+        obs = run_shards(
+            ["fast", "slow"],
+            attempt,
+            n_workers=2,
+            speculative=True,
+            speculative_factor=1.0,
+            poll_interval=0.01,
+            discard=discarded.append,
+        )
+
+        self.assertEqual(obs, ["fast", "slow"])
+        # The losing copy finished after it was cancelled
+        self.assertEqual(discarded, ["straggler"])
+
+
+if __name__ == "__main__":
+    unittest.main()
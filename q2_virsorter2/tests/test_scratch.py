@@ -0,0 +1,98 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+from q2_virsorter2._scratch import (
+    PruneRule,
+    ScratchMonitor,
+    get_directory_size,
+    prune_intermediates,
+)
+
+
+def _write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(b"x" * size)
+
+
+class TestScratch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work_dir = self.tmp.name
+        self.rules = (PruneRule("iter-0/splits", ("iter-0/all.faa",)),)
+        _write(os.path.join(self.work_dir, "iter-0/splits/1.fa"), 100)
+        _write(os.path.join(self.work_dir, "iter-0/splits/2.fa"), 50)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_directory_size(self):
+        self.assertEqual(get_directory_size(self.work_dir), 150)
+
+    def test_get_directory_size_missing(self):
+        self.assertEqual(get_directory_size(os.path.join(self.work_dir, "nope")), 0)
+
+    def test_prune_intermediates_not_done(self):
+        freed = prune_intermediates(self.work_dir, self.rules)
+        self.assertEqual(freed, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.work_dir, "iter-0/splits")))
+
+    def test_prune_intermediates_empty_marker(self):
+        # Markers that were created but not written yet do not count
+        _write(os.path.join(self.work_dir, "iter-0/all.faa"), 0)
+        self.assertEqual(prune_intermediates(self.work_dir, self.rules), 0)
+
+    def test_prune_intermediates_done(self):
+        _write(os.path.join(self.work_dir, "iter-0/all.faa"), 10)
+        freed = prune_intermediates(self.work_dir, self.rules)
+        self.assertEqual(freed, 150)
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, "iter-0/splits")))
+        self.assertTrue(os.path.exists(os.path.join(self.work_dir, "iter-0/all.faa")))
+
+    def test_prune_intermediates_nested_work_dirs(self):
+        shard_dir = os.path.join(self.work_dir, "shards", "shard-0-attempt-1")
+        _write(os.path.join(shard_dir, "iter-0/splits/1.fa"), 20)
+        _write(os.path.join(shard_dir, "iter-0/all.faa"), 10)
+
+        freed = prune_intermediates(self.work_dir, self.rules)
+
+        # Only the work directory that finished the merge is pruned
+        self.assertEqual(freed, 20)
+        self.assertFalse(os.path.exists(os.path.join(shard_dir, "iter-0/splits")))
+        self.assertTrue(os.path.exists(os.path.join(self.work_dir, "iter-0/splits")))
+
+    def test_prune_intermediates_recently_modified(self):
+        _write(os.path.join(self.work_dir, "iter-0/all.faa"), 10)
+        freed = prune_intermediates(self.work_dir, self.rules, min_age=3600)
+        self.assertEqual(freed, 0)
+
+    def test_monitor_peak_and_prune(self):
+        monitor = ScratchMonitor(
+            self.work_dir, prune=True, rules=self.rules, interval=0.01, min_age=0
+        )
+        monitor.poll()
+        self.assertEqual(monitor.peak_bytes, 150)
+
+        _write(os.path.join(self.work_dir, "iter-0/all.faa"), 10)
+        monitor.poll()
+        self.assertEqual(monitor.peak_bytes, 160)
+        self.assertEqual(monitor.pruned_bytes, 150)
+        self.assertEqual(get_directory_size(self.work_dir), 10)
+
+    def test_monitor_context(self):
+        with ScratchMonitor(self.work_dir, cap_mb=1, interval=0.01) as monitor:
+            pass
+        self.assertEqual(monitor.peak_bytes, 150)
+        self.assertEqual(monitor.pruned_bytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import unittest
+
+from q2_virsorter2._fasta import SequenceFile
+from q2_virsorter2._sharding import (
+    balance_shards,
+    collate_run_outputs,
+    partition_fasta,
+    partition_sequence_file,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+def _read_ids(fp):
+    with open(fp) as fh:
+        return [line[1:].split()[0] for line in fh if line.startswith(">")]
+
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_balance_shards(self):
+        lengths = {"a": 100, "b": 60, "c": 50, "d": 10}
+        self.assertEqual(balance_shards(lengths, 2), [["a", "d"], ["b", "c"]])
+
+    def test_balance_shards_more_shards_than_sequences(self):
+        self.assertEqual(balance_shards({"a": 1, "b": 2}, 5), [["b"], ["a"]])
+
+    def test_partition_fasta(self):
+        fasta = os.path.join(DATA, "fasta", "contigs.fa")
+        shards = partition_fasta(fasta, self.tmp.name, 2)
+
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(_read_ids(shards[0]), ["contig_3", "contig_4"])
+        self.assertEqual(_read_ids(shards[1]), ["contig_1", "contig_2"])
+
+        # The shards jointly contain the input, byte for byte
+        with open(fasta) as fh:
+            exp = fh.read()
+        with open(shards[1]) as fh:
+            self.assertTrue(exp.startswith(fh.read()))
+
+    def test_partition_fasta_existing_index(self):
+        indexed = os.path.join(DATA, "fasta", "indexed")
+        shards = partition_fasta(
+            os.path.join(indexed, "dna-sequences.fasta"),
+            self.tmp.name,
+            2,
+            index_path=os.path.join(indexed, "dna-sequences.fasta.fai"),
+        )
+
+        self.assertEqual(_read_ids(shards[0]), ["contig_3", "contig_4"])
+        self.assertNotIn("input.fasta.fai", os.listdir(self.tmp.name))
+
+    def test_partition_sequence_file_compressed(self):
+        exp = partition_fasta(
+            os.path.join(DATA, "fasta", "contigs.fa"),
+            os.path.join(self.tmp.name, "exp"),
+            2,
+        )
+
+        for fn, n_jobs in [("contigs.fa.gz", 1), ("contigs.fa.bgz", 3)]:
+            sequences = SequenceFile(os.path.join(DATA, "fasta", fn))
+            out_dir = os.path.join(self.tmp.name, fn)
+            obs = partition_sequence_file(sequences, out_dir, 2, n_jobs=n_jobs)
+
+            # No uncompressed copy of the input is written
+            self.assertEqual(
+                sorted(os.listdir(out_dir)), ["shard-0.fasta", "shard-1.fasta"]
+            )
+            for obs_fp, exp_fp in zip(obs, exp):
+                with open(obs_fp) as obs_fh, open(exp_fp) as exp_fh:
+                    self.assertEqual(obs_fh.read(), exp_fh.read())
+
+    def test_collate_run_outputs(self):
+        work_dirs = []
+        for i in range(2):
+            work_dir = os.path.join(self.tmp.name, f"shard-{i}")
+            shutil.copytree(os.path.join(DATA, "type", "vs2_out"), work_dir)
+            with open(os.path.join(work_dir, "final-viral-combined.fa"), "w") as fh:
+                fh.write(f">seq{i}||full\nACGT\n")
+            work_dirs.append(work_dir)
+
+        collate_run_outputs(work_dirs, self.tmp.name)
+
+        self.assertEqual(
+            _read_ids(os.path.join(self.tmp.name, "final-viral-combined.fa")),
+            ["seq0||full", "seq1||full"],
+        )
+        with open(os.path.join(DATA, "type", "vs2_out", "final-viral-score.tsv")) as fh:
+            exp = fh.read().splitlines()
+        with open(os.path.join(self.tmp.name, "final-viral-score.tsv")) as fh:
+            obs = fh.read().splitlines()
+        self.assertEqual(obs, exp + exp[1:])
+
+    def test_collate_run_outputs_header_mismatch(self):
+        work_dirs = []
+        for i, header in enumerate(["seqname\ta\n", "seqname\tb\n"]):
+            work_dir = os.path.join(self.tmp.name, f"shard-{i}")
+            os.makedirs(work_dir)
+            for name in ["final-viral-combined.fa", "final-viral-boundary.tsv"]:
+                open(os.path.join(work_dir, name), "w").close()
+            with open(os.path.join(work_dir, "final-viral-score.tsv"), "w") as fh:
+                fh.write(header)
+            work_dirs.append(work_dir)
+
+        with self.assertRaisesRegex(ValueError, "Unexpected header"):
+            collate_run_outputs(work_dirs, self.tmp.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import filecmp
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from q2_types.feature_data import DNAFASTAFormat, DNASequencesDirectoryFormat
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_virsorter2._compression import is_bgzf, open_compressed
+from q2_virsorter2._fasta import IndexedFasta, SequenceFile
+from q2_virsorter2.types._format import (
+    GzippedDNAFASTAFormat,
+    GzippedDNASequencesDirFmt,
+    IndexedDNAFASTADirFmt,
+    Virsorter2CompressedDbDirFmt,
+    Virsorter2DbDirFmt,
+)
+
+
+class TestIndexedDNAFASTATransformers(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def _read(self, fp):
+        with open(fp) as fh:
+            return fh.read()
+
+    def test_dnafasta_to_indexed(self):
+        transformer = self.get_transformer(DNAFASTAFormat, IndexedDNAFASTADirFmt)
+        fasta = DNAFASTAFormat(self.get_data_path("fasta/contigs.fa"), mode="r")
+
+        obs = transformer(fasta)
+
+        obs.validate()
+        self.assertEqual(
+            self._read(obs.path / "dna-sequences.fasta"),
+            self._read(self.get_data_path("fasta/contigs.fa")),
+        )
+        self.assertEqual(
+            self._read(obs.path / "dna-sequences.fasta.fai"),
+            self._read(self.get_data_path("fasta/indexed/dna-sequences.fasta.fai")),
+        )
+
+    def test_dnasequences_dir_to_indexed(self):
+        transformer = self.get_transformer(
+            DNASequencesDirectoryFormat, IndexedDNAFASTADirFmt
+        )
+        input_dir = DNASequencesDirectoryFormat(
+            self.get_data_path("fasta/indexed"), mode="r"
+        )
+
+        obs = transformer(input_dir)
+
+        self.assertEqual(
+            self._read(obs.path / "dna-sequences.fasta.fai"),
+            self._read(self.get_data_path("fasta/indexed/dna-sequences.fasta.fai")),
+        )
+
+    def test_indexed_to_dnafasta(self):
+        transformer = self.get_transformer(IndexedDNAFASTADirFmt, DNAFASTAFormat)
+        indexed = IndexedDNAFASTADirFmt(self.get_data_path("fasta/indexed"), mode="r")
+
+        obs = transformer(indexed)
+
+        self.assertEqual(
+            self._read(str(obs)),
+            self._read(self.get_data_path("fasta/indexed/dna-sequences.fasta")),
+        )
+
+
+class TestSequenceFileTransformers(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.sequences = GzippedDNASequencesDirFmt(self.temp_dir.name, mode="w")
+        shutil.copyfile(
+            self.get_data_path("fasta/contigs.fa.bgz"),
+            str(self.sequences.path / "dna-sequences.fasta.gz"),
+        )
+        with open(self.get_data_path("fasta/contigs.fa")) as fh:
+            self.exp = fh.read()
+
+    def test_dnasequences_dir_to_sequence_file(self):
+        transformer = self.get_transformer(DNASequencesDirectoryFormat, SequenceFile)
+        input_dir = DNASequencesDirectoryFormat(
+            self.get_data_path("fasta/indexed"), mode="r"
+        )
+
+        obs = transformer(input_dir)
+
+        self.assertFalse(obs.compressed)
+        self.assertEqual(obs.path, str(input_dir.path / "dna-sequences.fasta"))
+
+    def test_indexed_to_sequence_file(self):
+        transformer = self.get_transformer(IndexedDNAFASTADirFmt, SequenceFile)
+        indexed = IndexedDNAFASTADirFmt(self.get_data_path("fasta/indexed"), mode="r")
+
+        obs = transformer(indexed)
+
+        self.assertFalse(obs.compressed)
+        self.assertEqual(obs.index_path, str(indexed.path / "dna-sequences.fasta.fai"))
+
+    def test_gzipped_dir_to_sequence_file(self):
+        transformer = self.get_transformer(GzippedDNASequencesDirFmt, SequenceFile)
+
+        obs = transformer(self.sequences)
+
+        self.assertTrue(obs.compressed)
+        with obs.open(n_jobs=2) as fh:
+            self.assertEqual(fh.read().decode(), self.exp)
+
+    def test_gzipped_dir_to_dnafasta(self):
+        transformer = self.get_transformer(GzippedDNASequencesDirFmt, DNAFASTAFormat)
+
+        obs = transformer(self.sequences)
+
+        with open(str(obs)) as fh:
+            self.assertEqual(fh.read(), self.exp)
+
+    def test_gzipped_fasta_to_dir(self):
+        transformer = self.get_transformer(
+            GzippedDNAFASTAFormat, GzippedDNASequencesDirFmt
+        )
+        input_fp = self.get_data_path("fasta/contigs.fa.gz")
+
+        obs = transformer(GzippedDNAFASTAFormat(input_fp, mode="r"))
+
+        self.assertTrue(filecmp.cmp(input_fp, str(obs.path / "dna-sequences.fasta.gz")))
+
+    def test_sequence_file_to_gzipped_dir(self):
+        transformer = self.get_transformer(SequenceFile, GzippedDNASequencesDirFmt)
+
+        obs = transformer(SequenceFile(self.get_data_path("fasta/contigs.fa")))
+
+        obs_fp = str(obs.path / "dna-sequences.fasta.gz")
+        self.assertTrue(is_bgzf(obs_fp))
+        with open_compressed(obs_fp) as fh:
+            self.assertEqual(fh.read().decode(), self.exp)
+        self.assertTrue(
+            filecmp.cmp(
+                obs_fp + ".fai",
+                self.get_data_path("fasta/indexed/dna-sequences.fasta.fai"),
+            )
+        )
+        with IndexedFasta(obs_fp) as fasta, IndexedFasta(
+            self.get_data_path("fasta/indexed/dna-sequences.fasta")
+        ) as exp:
+            self.assertEqual(
+                fasta.fetch("contig_2", 5, 70), exp.fetch("contig_2", 5, 70)
+            )
+
+    def test_sequence_file_output_taken_over(self):
+        compressed = GzippedDNASequencesDirFmt()
+        plain = DNASequencesDirectoryFormat()
+        for owner, output_format in [
+            (compressed, GzippedDNASequencesDirFmt),
+            (plain, DNASequencesDirectoryFormat),
+        ]:
+            transformer = self.get_transformer(SequenceFile, output_format)
+            view = SequenceFile(owner.path / "dna-sequences.fasta", owner=owner)
+            self.assertIs(transformer(view), owner)
+
+    def test_sequence_file_to_dnasequences_dir(self):
+        transformer = self.get_transformer(SequenceFile, DNASequencesDirectoryFormat)
+
+        obs = transformer(SequenceFile(self.get_data_path("fasta/contigs.fa.gz")))
+
+        with open(str(obs.path / "dna-sequences.fasta")) as fh:
+            self.assertEqual(fh.read(), self.exp)
+
+
+class TestVirsorter2DbTransformers(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.cache = tempfile.TemporaryDirectory()
+        patcher = patch.dict(os.environ, {"Q2_VIRSORTER2_CACHE_DIR": self.cache.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache.cleanup)
+
+    def test_db_to_compressed_db(self):
+        transformer = self.get_transformer(
+            Virsorter2DbDirFmt, Virsorter2CompressedDbDirFmt
+        )
+        db = Virsorter2DbDirFmt(self.get_data_path("type/vs2_db"), mode="r")
+
+        obs = transformer(db)
+
+        obs.validate(level="min")
+        # Compression is deterministic
+        self.assertTrue(
+            filecmp.cmp(
+                obs.path / "index.tsv",
+                self.get_data_path("type/vs2_db_compressed/index.tsv"),
+                shallow=False,
+            )
+        )
+
+    def test_compressed_db_to_db(self):
+        transformer = self.get_transformer(
+            Virsorter2CompressedDbDirFmt, Virsorter2DbDirFmt
+        )
+        compressed = Virsorter2CompressedDbDirFmt(
+            self.get_data_path("type/vs2_db_compressed"), mode="r"
+        )
+
+        obs = transformer(compressed)
+
+        obs.validate()
+        self.assertTrue(str(obs.path).startswith(self.cache.name))
+        self.assertTrue(
+            filecmp.cmp(
+                obs.path / "hmm/pfam/Pfam-A.hmm",
+                self.get_data_path("type/vs2_db/hmm/pfam/Pfam-A.hmm"),
+                shallow=False,
+            )
+        )
+        # The second transformation reuses the cache
+        self.assertEqual(transformer(compressed).path, obs.path)
@@ -7,7 +7,12 @@
 # ----------------------------------------------------------------------------
 from qiime2.plugin.testing import TestPluginBase
 
-from q2_virsorter2.types._type import Virsorter2Db
+from q2_virsorter2.types._type import (
+    CompressedSequence,
+    IndexedSequence,
+    Virsorter2CompressedDb,
+    Virsorter2Db,
+)
 
 
 class TestVirsorter2DbType(TestPluginBase):
@@ -15,3 +20,12 @@ class TestVirsorter2DbType(TestPluginBase):
 
     def test_Virsorter2Db_registration(self):
         self.assertRegisteredSemanticType(Virsorter2Db)
+
+    def test_Virsorter2CompressedDb_registration(self):
+        self.assertRegisteredSemanticType(Virsorter2CompressedDb)
+
+    def test_CompressedSequence_registration(self):
+        self.assertRegisteredSemanticType(CompressedSequence)
+
+    def test_IndexedSequence_registration(self):
+        self.assertRegisteredSemanticType(IndexedSequence)
@@ -5,17 +5,23 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import io
 import os
+import subprocess
 import tempfile
+import threading
 import unittest
 from unittest.mock import patch
 
+from q2_virsorter2._events import EventStream
 from q2_virsorter2._utils import (
     _construct_param,
+    _construct_snakemake_resources,
     _get_sample_from_path,
     _process_common_input_params,
     create_directory,
     get_full_path,
+    run_cancellable_command,
     run_command,
     run_commands_with_pipe,
 )
@@ -81,13 +87,80 @@ class TestRunCommand(unittest.TestCase):
     def test_run_command_with_verbose(self, mock_run):
         cmd = ["echo", "hello"]
         run_command(cmd, verbose=True)
-        mock_run.assert_called_once_with(cmd, check=True)
+        mock_run.assert_called_once_with(cmd, check=True, env=None)
 
     @patch("subprocess.run")
     def test_run_command_no_verbose(self, mock_run):
         cmd = ["echo", "hello"]
         run_command(cmd, verbose=False)
-        mock_run.assert_called_once_with(cmd, check=True)
+        mock_run.assert_called_once_with(cmd, check=True, env=None)
+
+    def test_run_command_events(self):
+        received = []
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_command(
+                ["false"], verbose=False, events=EventStream(callback=received.append)
+            )
+
+        self.assertEqual(
+            [(e["event"], e["command"]) for e in received],
+            [("stage_started", "false"), ("stage_finished", "false")],
+        )
+        self.assertEqual(received[-1]["status"], "failed")
+
+    def test_run_command_snakemake_progress(self):
+        received = []
+        events = EventStream(callback=received.append)
+        events.set_total(8)
+        log = "Building DAG\n1 of 4 steps (25%) done\nx\n4 of 4 steps (100%) done\n"
+
+        with patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            run_command(["sh", "-c", 'printf "%s" "$1" >&2', "sh", log], False, events)
+
+        # The log is passed through
+        self.assertEqual(stderr.getvalue(), log)
+        # Steps are reported as steps, as they do not map onto contigs
+        steps = [e for e in received if e["event"] == "steps"]
+        self.assertEqual(
+            [(e["steps_done"], e["steps_total"]) for e in steps], [(1, 4), (4, 4)]
+        )
+        progress = [e for e in received if e["event"] == "progress"]
+        self.assertEqual([e["contigs_processed"] for e in progress], [0])
+
+
+class TestRunCancellableCommand(unittest.TestCase):
+    def test_finished(self):
+        self.assertTrue(run_cancellable_command(["true"], threading.Event()))
+
+    def test_failed(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_cancellable_command(["false"], threading.Event(), verbose=False)
+
+    def test_cancelled(self):
+        cancel = threading.Event()
+        timer = threading.Timer(0.1, cancel.set)
+        timer.start()
+        self.assertFalse(
+            run_cancellable_command(
+                ["sleep", "30"], cancel, verbose=False, poll_interval=0.01
+            )
+        )
+
+    def test_cancelled_events(self):
+        received = []
+        cancel = threading.Event()
+        cancel.set()
+        run_cancellable_command(
+            ["sleep", "30"],
+            cancel,
+            verbose=False,
+            poll_interval=0.01,
+            events=EventStream(callback=received.append),
+        )
+        self.assertEqual(
+            [e["event"] for e in received],
+            ["stage_started", "command_cancelled", "stage_finished"],
+        )
 
 
 class TestParameterConstruction(unittest.TestCase):
@@ -157,3 +230,29 @@ class TestGetSampleFromPath(unittest.TestCase):
         expected = "sample4_contigs.fa"
         result = _get_sample_from_path(path)
         self.assertEqual(result, expected)
+
+
+class TestConstructSnakemakeResources(unittest.TestCase):
+    def test_with_limits(self):
+        self.assertEqual(
+            _construct_snakemake_resources({"disk_mb": 1000, "mem_mb": None}),
+            ["--default-resources", "--resources", "disk_mb=1000"],
+        )
+
+    def test_without_limits(self):
+        self.assertEqual(_construct_snakemake_resources({"disk_mb": None}), [])
+
+    def test_with_estimates(self):
+        self.assertEqual(
+            _construct_snakemake_resources(
+                {"disk_mb": 1000, "mem_mb": 4000},
+                {"mem_mb": "max(input.size_mb,1000)", "runtime": "60"},
+            ),
+            [
+                "--default-resources",
+                "mem_mb=max(input.size_mb,1000)",
+                "--resources",
+                "disk_mb=1000",
+                "mem_mb=4000",
+            ],
+        )
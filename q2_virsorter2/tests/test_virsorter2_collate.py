@@ -0,0 +1,91 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import pandas as pd
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_virsorter2._compression import is_bgzf
+from q2_virsorter2._fasta import IndexedFasta
+from q2_virsorter2.types._format import (
+    GzippedDNASequencesDirFmt,
+    Virsorter2ResultsDirFmt,
+)
+from q2_virsorter2.virsorter2_collate import collate_results
+
+
+class TestCollateResults(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def _results(self, sequences, calls):
+        results = Virsorter2ResultsDirFmt()
+        with open(results.path / "final-viral-combined.fa", "w") as fh:
+            fh.write(sequences)
+        with open(results.path / "final-viral-score.tsv", "w") as fh:
+            fh.write("seqname\tmax_score\n")
+            fh.writelines(f"{seqname}||full\t{score}\n" for seqname, score in calls)
+        with open(results.path / "final-viral-boundary.tsv", "w") as fh:
+            fh.write("seqname\tmax_score\n")
+            fh.writelines(f"{seqname}\t{score}\n" for seqname, score in calls)
+        return results
+
+    def _metadata(self, ids, scores):
+        df = pd.DataFrame(
+            {"max_score": scores}, index=pd.Index(ids, name="sample_name")
+        )
+        return qiime2.Metadata(df)
+
+    def test_collate_results(self):
+        seqs, score, boundary = collate_results(
+            [
+                self._results(">a||full\nACGT\n", [("a", 0.9)]),
+                self._results(">b||full\nTT\n", [("b", 0.7)]),
+            ]
+        )
+
+        with open(str(seqs.path)) as fh:
+            self.assertEqual(fh.read(), ">a||full\nACGT\n>b||full\nTT\n")
+        self.assertEqual(score, self._metadata(["a||full", "b||full"], [0.9, 0.7]))
+        self.assertEqual(boundary, self._metadata(["a", "b"], [0.9, 0.7]))
+
+    def test_collate_results_compressed(self):
+        seqs, _, _ = collate_results(
+            [
+                self._results(">a||full\nACGT\nAC\n", [("a", 0.9)]),
+                self._results(">b||full\nTT\n", [("b", 0.7)]),
+            ],
+            compress_sequences=True,
+        )
+
+        # The sequences are written as indexed BGZF into the output format
+        self.assertIsInstance(seqs.owner, GzippedDNASequencesDirFmt)
+        self.assertTrue(is_bgzf(seqs.path))
+        with IndexedFasta(seqs.path) as fasta:
+            self.assertEqual(fasta.fetch("a||full"), "ACGTAC")
+            self.assertEqual(fasta.fetch("b||full"), "TT")
+
+    def test_collate_results_empty_partition(self):
+        seqs, score, boundary = collate_results(
+            [
+                self._results("", []),
+                self._results(">b||full\nTT\n", [("b", 0.7)]),
+            ]
+        )
+
+        # Partitions without viral calls are skipped
+        with open(str(seqs.path)) as fh:
+            self.assertEqual(fh.read(), ">b||full\nTT\n")
+        self.assertEqual(score, self._metadata(["b||full"], [0.7]))
+        self.assertEqual(boundary, self._metadata(["b"], [0.7]))
+
+    def test_collate_results_no_viral_calls(self):
+        with self.assertRaisesRegex(ValueError, "any partition"):
+            collate_results([self._results("", []), self._results("", [])])
+
+    def test_collate_results_no_results(self):
+        with self.assertRaisesRegex(ValueError, "No results"):
+            collate_results([])
@@ -0,0 +1,35 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import filecmp
+
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_virsorter2.types._format import Virsorter2DbDirFmt
+from q2_virsorter2.virsorter2_compress_db import compress_db
+
+
+class TestVirsorter2CompressDb(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def test_compress_db(self):
+        db = Virsorter2DbDirFmt(self.get_data_path("type/vs2_db"), mode="r")
+
+        obs = compress_db(db, n_jobs=2)
+
+        obs.validate(level="min")
+        self.assertTrue(
+            filecmp.cmp(
+                obs.path / "index.tsv",
+                self.get_data_path("type/vs2_db_compressed/index.tsv"),
+                shallow=False,
+            )
+        )
+        self.assertLess(
+            sum(f.stat().st_size for f in obs.path.rglob("*.gz")),
+            sum(f.stat().st_size for f in db.path.rglob("*") if f.is_file()) / 4,
+        )
@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_virsorter2._fasta import IndexedFasta, read_fasta_index
+from q2_virsorter2.types._format import IndexedDNAFASTADirFmt
+from q2_virsorter2.virsorter2_extract_regions import (
+    _compute_trim_coordinates,
+    extract_regions,
+)
+
+
+class TestExtractRegions(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.index = read_fasta_index(
+            self.get_data_path("fasta/indexed/dna-sequences.fasta.fai")
+        )
+        self.boundary_df = pd.DataFrame(
+            {
+                "trim_bp_start": [11.0, 1.0, 100.0],
+                "trim_bp_end": [80.0, 35.0, 400.0],
+                "seqname_new": ["contig_4||0_partial", "contig_3||full", np.nan],
+            },
+            index=pd.Index(["contig_4", "contig_3", "contig_1"], name="sample_name"),
+        )
+
+    def test_compute_trim_coordinates(self):
+        names, new_ids, starts, ends = _compute_trim_coordinates(
+            self.boundary_df, self.index
+        )
+
+        # Regions are ordered by their position in the file and clipped
+        np.testing.assert_array_equal(names, ["contig_1", "contig_3", "contig_4"])
+        np.testing.assert_array_equal(
+            new_ids, ["contig_1", "contig_3||full", "contig_4||0_partial"]
+        )
+        np.testing.assert_array_equal(starts, [99, 0, 10])
+        np.testing.assert_array_equal(ends, [150, 35, 80])
+
+    def test_compute_trim_coordinates_missing_column(self):
+        with self.assertRaisesRegex(ValueError, "trim_bp_end"):
+            _compute_trim_coordinates(
+                self.boundary_df.drop(columns="trim_bp_end"), self.index
+            )
+
+    def test_compute_trim_coordinates_unknown_sequence(self):
+        df = self.boundary_df.rename(index={"contig_1": "contig_x"})
+        with self.assertRaisesRegex(ValueError, "contig_x"):
+            _compute_trim_coordinates(df, self.index)
+
+    def test_extract_regions(self):
+        sequences = IndexedDNAFASTADirFmt(self.get_data_path("fasta/indexed"), "r")
+
+        obs = extract_regions(sequences, qiime2.Metadata(self.boundary_df))
+
+        with open(str(obs)) as fh:
+            lines = fh.read().splitlines()
+        with IndexedFasta(self.get_data_path("fasta/indexed/dna-sequences.fasta")) as f:
+            exp = [
+                ">contig_1",
+                f.fetch("contig_1", 99),
+                ">contig_3||full",
+                f.fetch("contig_3"),
+                ">contig_4||0_partial",
+                f.fetch("contig_4", 10, 80),
+            ]
+        self.assertEqual(lines, exp)
@@ -6,13 +6,17 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import hashlib
 import os
 import subprocess
+import tarfile
 import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
-from q2_virsorter2.virsorter2_fetch_db import fetch_db, vs2_setup
+from q2_virsorter2.virsorter2_fetch_db import fetch_db, import_db, vs2_setup
+
+DB = os.path.join(os.path.dirname(__file__), "data", "type", "vs2_db")
 
 
 class TestVirsorter2FetchDb(unittest.TestCase):
@@ -137,6 +141,76 @@ class TestVirsorter2FetchDb(unittest.TestCase):
             # Check the return value
             self.assertEqual(result, mock_database)
 
+    @patch("q2_virsorter2.virsorter2_fetch_db.get_cache_dir", return_value="/cache")
+    @patch("q2_virsorter2.virsorter2_fetch_db.import_db")
+    @patch("q2_virsorter2.virsorter2_fetch_db.cached_download")
+    @patch("q2_virsorter2.virsorter2_fetch_db.run_command")
+    def test_virsorter2_fetch_db_url(
+        self, mock_run_command, mock_download, mock_import_db, mock_cache
+    ):
+        mock_download.return_value = "/cache/downloads/abc"
+
+        result = fetch_db(n_jobs=5, url="https://example.org/db.tgz", checksum="MD5:AB")
+
+        mock_run_command.assert_not_called()
+        mock_download.assert_called_once_with(
+            "https://example.org/db.tgz",
+            "/cache/downloads",
+            checksum=("md5", "ab"),
+            n_jobs=5,
+        )
+        mock_import_db.assert_called_once_with("/cache/downloads/abc", n_jobs=5)
+        self.assertEqual(result, mock_import_db.return_value)
+
+    @patch(
+        "q2_virsorter2.virsorter2_fetch_db.cached_download",
+        side_effect=ConnectionResetError("reset"),
+    )
+    def test_virsorter2_fetch_db_url_failure(self, mock_download):
+        with self.assertRaisesRegex(Exception, "resume the download"):
+            fetch_db(url="https://example.org/db.tgz")
+
+
+class TestVirsorter2ImportDb(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.tmp.name, "db.tgz")
+
+        # Mimic the archive downloaded by "virsorter setup"
+        with tarfile.open(self.archive, "w:gz") as tar:
+            for name in os.listdir(DB):
+                if name != "Done_all_setup":
+                    tar.add(os.path.join(DB, name), arcname=f"db/{name}")
+            tar.add(self.tmp.name, arcname="db/conda_envs", recursive=False)
+        with open(self.archive, "rb") as fh:
+            self.md5 = hashlib.md5(fh.read()).hexdigest()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_import_db(self):
+        database = import_db(self.archive, checksum=f"md5:{self.md5}", n_jobs=2)
+
+        database.validate()
+        self.assertTrue(os.path.isfile(database.path / "Done_all_setup"))
+        self.assertFalse(os.path.exists(database.path / "conda_envs"))
+        self.assertFalse(os.path.exists(database.path / "db"))
+
+    def test_import_db_checksum_mismatch(self):
+        with self.assertRaisesRegex(ValueError, "does not match"):
+            import_db(self.archive, checksum=f"md5:{'0' * 32}")
+
+    def test_import_db_invalid_checksum(self):
+        with self.assertRaisesRegex(ValueError, "Invalid checksum"):
+            import_db(self.archive, checksum=self.md5)
+
+    def test_import_db_corrupted_archive(self):
+        with open(self.archive, "r+b") as fh:
+            fh.truncate(100)
+
+        with self.assertRaisesRegex(Exception, "while extracting the database"):
+            import_db(self.archive)
+
 
 if __name__ == "__main__":
     unittest.main()
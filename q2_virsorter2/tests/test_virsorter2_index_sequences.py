@@ -0,0 +1,28 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from q2_types.feature_data import DNAFASTAFormat
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_virsorter2.types._format import IndexedDNAFASTADirFmt
+from q2_virsorter2.virsorter2_index_sequences import index_sequences
+
+
+class TestIndexSequences(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def test_index_sequences(self):
+        transformer = self.get_transformer(DNAFASTAFormat, IndexedDNAFASTADirFmt)
+        fasta = DNAFASTAFormat(self.get_data_path("fasta/contigs.fa"), mode="r")
+
+        obs = index_sequences(transformer(fasta))
+
+        obs.validate()
+        with open(obs.path / "dna-sequences.fasta.fai") as fh, open(
+            self.get_data_path("fasta/indexed/dna-sequences.fasta.fai")
+        ) as exp:
+            self.assertEqual(fh.read(), exp.read())
@@ -0,0 +1,122 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import unittest
+
+from q2_types.feature_data import DNAFASTAFormat
+from q2_types.metadata import ImmutableMetadataDirectoryFormat
+
+from q2_virsorter2.virsorter2_merge import merge_results
+
+SCORE_HEADER = "sample_name\tdsDNAphage\tmax_score\tmax_score_group\n"
+BOUNDARY_HEADER = "sample_name\tseqname_new\tshape\n"
+
+
+class TestMergeResults(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.n = 0
+
+    def _sequences(self, content):
+        fmt = DNAFASTAFormat()
+        with open(str(fmt), "w") as fh:
+            fh.write(content)
+        return fmt
+
+    def _metadata(self, header, rows):
+        self.n += 1
+        path = os.path.join(self.tmp, str(self.n))
+        os.makedirs(path)
+        with open(os.path.join(path, "metadata.tsv"), "w") as fh:
+            fh.write(header + "#q2:types\tnumeric\tnumeric\tcategorical\n")
+            fh.write("".join("\t".join(map(str, row)) + "\n" for row in rows))
+        return ImmutableMetadataDirectoryFormat(path, mode="r")
+
+    def _run(self, calls):
+        """Builds the outputs of a run from (ID, sequence, score) tuples."""
+        return (
+            self._sequences("".join(f">{i}||full\n{s}\n" for i, s, _ in calls)),
+            self._metadata(
+                SCORE_HEADER,
+                [(f"{i}||full", score, score, "dsDNAphage") for i, _, score in calls],
+            ),
+            self._metadata(
+                BOUNDARY_HEADER,
+                [(i, f"{i}||full", "linear") for i, _, _ in calls],
+            ),
+        )
+
+    def _read(self, metadata):
+        with open(str(metadata.path / "metadata.tsv")) as fh:
+            return [line.split("\t")[0] for line in fh.read().splitlines()[1:]]
+
+    def _merge(self, *runs):
+        return merge_results(*(list(outputs) for outputs in zip(*runs)))
+
+    def test_merge_results(self):
+        seqs, score, boundary = self._merge(
+            self._run([("c", "AAAA", 0.9), ("a", "CCCC", 0.8)]),
+            self._run([("b", "GGGG", 0.7)]),
+        )
+
+        with open(str(seqs)) as fh:
+            self.assertEqual(
+                fh.read(), ">a||full\nCCCC\n>b||full\nGGGG\n>c||full\nAAAA\n"
+            )
+        self.assertEqual(self._read(score), ["a||full", "b||full", "c||full"])
+        self.assertEqual(self._read(boundary), ["a", "b", "c"])
+        with open(str(score.path / "metadata.tsv")) as fh:
+            self.assertEqual(fh.readline(), SCORE_HEADER)
+
+    def test_merge_results_keeps_best_record_per_id(self):
+        seqs, score, boundary = self._merge(
+            self._run([("a", "CCCC", 0.6)]),
+            self._run([("a", "CCCCTT", 0.9)]),
+            self._run([("a", "CCCCGG", 0.9)]),
+        )
+
+        with open(str(seqs)) as fh:
+            # Ties are won by the first input
+            self.assertEqual(fh.read(), ">a||full\nCCCCTT\n")
+        with open(str(score.path / "metadata.tsv")) as fh:
+            self.assertEqual(
+                fh.read().splitlines()[1:], ["a||full\t0.9\t0.9\tdsDNAphage"]
+            )
+        self.assertEqual(self._read(boundary), ["a"])
+
+    def test_merge_results_deduplicates_sequences(self):
+        seqs, score, boundary = self._merge(
+            self._run([("a", "ACGT", 0.6), ("b", "TTTT", 0.5)]),
+            self._run([("c", "acgt", 0.8)]),
+        )
+
+        with open(str(seqs)) as fh:
+            self.assertEqual(fh.read(), ">b||full\nTTTT\n>c||full\nacgt\n")
+        self.assertEqual(self._read(score), ["b||full", "c||full"])
+        self.assertEqual(self._read(boundary), ["b", "c"])
+
+    def test_merge_results_unscored_calls_rank_last(self):
+        seqs, score, _ = self._merge(
+            self._run([("a", "ACGT", "")]),
+            self._run([("a", "ACGG", 0.1)]),
+        )
+        with open(str(seqs)) as fh:
+            self.assertEqual(fh.read(), ">a||full\nACGG\n")
+
+    def test_merge_results_different_columns(self):
+        sequences, score, boundary = self._run([("a", "ACGT", 0.5)])
+        other = self._metadata("sample_name\tother\tmax_score\tmax_score_group\n", [])
+        with self.assertRaisesRegex(ValueError, "Unexpected header"):
+            merge_results([sequences] * 2, [score, other], [boundary] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
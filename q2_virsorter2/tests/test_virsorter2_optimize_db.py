@@ -0,0 +1,32 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import tempfile
+
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_virsorter2._hmm_dedup import SHARED_HMM, is_deduplicated
+from q2_virsorter2.tests.test_hmm_dedup import make_database
+from q2_virsorter2.types._format import Virsorter2DbDirFmt
+from q2_virsorter2.virsorter2_optimize_db import optimize_db
+
+
+class TestVirsorter2OptimizeDb(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def test_optimize_db(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "db")
+        make_database(path)
+
+        obs = optimize_db(Virsorter2DbDirFmt(path, mode="r"))
+
+        obs.validate(level="min")
+        self.assertTrue(is_deduplicated(obs.path))
+        self.assertTrue((obs.path / SHARED_HMM).is_file())
@@ -0,0 +1,46 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_virsorter2._fasta import SequenceFile
+from q2_virsorter2.virsorter2_partition import partition_sequences
+
+
+class TestPartitionSequences(TestPluginBase):
+    package = "q2_virsorter2.tests"
+
+    def _read_ids(self, fmt):
+        with open(str(fmt)) as fh:
+            return [line[1:].split()[0] for line in fh if line.startswith(">")]
+
+    def test_partition_sequences(self):
+        sequences = SequenceFile(self.get_data_path("fasta/contigs.fa"))
+
+        obs = partition_sequences(sequences, num_partitions=2)
+
+        self.assertEqual(list(obs), ["partition_0", "partition_1"])
+        self.assertEqual(self._read_ids(obs["partition_0"]), ["contig_3", "contig_4"])
+        self.assertEqual(self._read_ids(obs["partition_1"]), ["contig_1", "contig_2"])
+
+    def test_partition_sequences_single(self):
+        sequences = SequenceFile(self.get_data_path("fasta/contigs.fa"))
+
+        obs = partition_sequences(sequences)
+
+        self.assertEqual(
+            self._read_ids(obs["partition_0"]),
+            ["contig_1", "contig_2", "contig_3", "contig_4"],
+        )
+
+    def test_partition_sequences_compressed(self):
+        sequences = SequenceFile(self.get_data_path("fasta/contigs.fa.bgz"))
+
+        obs = partition_sequences(sequences, num_partitions=2)
+
+        self.assertEqual(self._read_ids(obs["partition_0"]), ["contig_3", "contig_4"])
+        self.assertEqual(self._read_ids(obs["partition_1"]), ["contig_1", "contig_2"])
@@ -7,14 +7,32 @@
 # ----------------------------------------------------------------------------
 
 
+import json
+import os
+import shutil
 import subprocess
+import tempfile
+import threading
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
 import pandas as pd
 import qiime2
 
-from q2_virsorter2.virsorter2_run import run, vs2_run_execution
+from q2_virsorter2._events import EventStream
+from q2_virsorter2._history import database_manifest
+from q2_virsorter2._sharding import RUN_OUTPUTS
+from q2_virsorter2._worker import WorkerServer
+from q2_virsorter2.virsorter2_run import (
+    _classify_partition,
+    classify,
+    run,
+    vs2_run_execution,
+    vs2_run_on_worker,
+    vs2_run_sharded,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
 
 
 class TestVirsorter2Run(unittest.TestCase):
@@ -61,7 +79,58 @@ class TestVirsorter2Run(unittest.TestCase):
         ]
 
         # Assert the command was called
-        mock_run_command.assert_called_once_with(expected_cmd)
+        mock_run_command.assert_called_once_with(expected_cmd, events=None)
+
+    @patch("q2_virsorter2.virsorter2_run.run_command")
+    def test_vs2_run_execution_snakemake_args(self, mock_run_command):
+        mock_sequences = MagicMock()
+        mock_sequences.path = "/fake/sequences"
+        mock_database = MagicMock()
+        mock_database.path = "/fake/database"
+
+        vs2_run_execution(
+            "/fake/tmp",
+            mock_sequences,
+            mock_database,
+            n_jobs=5,
+            min_score=0.5,
+            min_length=0,
+            snakemake_args=["--resources", "disk_mb=100"],
+        )
+
+        # Snakemake arguments follow the target
+        cmd = mock_run_command.call_args[0][0]
+        self.assertEqual(cmd[-3:], ["all", "--resources", "disk_mb=100"])
+
+    @patch("q2_virsorter2.virsorter2_run.run_command")
+    def test_vs2_run_execution_profile(self, mock_run_command):
+        mock_sequences, mock_database = MagicMock(), MagicMock()
+
+        vs2_run_execution(
+            "/fake/tmp",
+            mock_sequences,
+            mock_database,
+            n_jobs=5,
+            min_score=0.5,
+            min_length=0,
+            snakemake_args=["--resources", "disk_mb=100"],
+            profile="fast",
+        )
+
+        # Profile options are passed to VirSorter2, before the target
+        cmd = mock_run_command.call_args[0][0]
+        self.assertEqual(
+            cmd[-7:],
+            [
+                "--use-conda-off",
+                "--provirus-off",
+                "--max-orf-per-seq",
+                "20",
+                "all",
+                "--resources",
+                "disk_mb=100",
+            ],
+        )
 
     @patch(
         "q2_virsorter2.virsorter2_run.run_command",
@@ -92,16 +161,14 @@ class TestVirsorter2Run(unittest.TestCase):
         )
 
     @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
-    @patch("q2_virsorter2.virsorter2_run.DNAFASTAFormat")
     @patch("q2_virsorter2.virsorter2_run.pd.read_csv")
-    @patch("shutil.copy")
+    @patch("shutil.move")
     @patch("tempfile.TemporaryDirectory")
-    def test_run_success(
+    def test_classify_success(
         self,
         mock_tempdir,
-        mock_shutil_copy,
+        mock_shutil_move,
         mock_read_csv,
-        mock_DNAFASTAFormat,
         mock_vs2_run_execution,
     ):
         # Mock the context managers
@@ -119,16 +186,24 @@ class TestVirsorter2Run(unittest.TestCase):
         mock_database.path = "/fake/database"
 
         # Call the function
-        result = run(
+        result = classify(
             mock_sequences, mock_database, n_jobs=5, min_score=0.5, min_length=0
         )
 
         # Assertions
         mock_vs2_run_execution.assert_called_once_with(
-            "/fake/tmp", mock_sequences, mock_database, 5, 0.5, 0
+            "/fake/tmp",
+            mock_sequences,
+            mock_database,
+            5,
+            0.5,
+            0,
+            snakemake_args=[],
+            events=ANY,
+            profile="default",
         )
-        mock_shutil_copy.assert_called_once_with(
-            "/fake/tmp/final-viral-combined.fa", str(result[0])
+        mock_shutil_move.assert_called_once_with(
+            "/fake/tmp/final-viral-combined.fa", result[0].path
         )
         mock_read_csv.assert_any_call(
             "/fake/tmp/final-viral-score.tsv", sep="\t", index_col=0
@@ -145,6 +220,533 @@ class TestVirsorter2Run(unittest.TestCase):
         self.assertEqual(result[1], expected_viral_score_metadata)
         self.assertEqual(result[2], expected_viral_boundary_metadata)
 
+    @patch("q2_virsorter2.virsorter2_run.ScratchMonitor")
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
+    @patch("q2_virsorter2.virsorter2_run.pd.read_csv")
+    @patch("shutil.move")
+    @patch("tempfile.TemporaryDirectory")
+    def test_classify_disk_aware(
+        self,
+        mock_tempdir,
+        mock_shutil_move,
+        mock_read_csv,
+        mock_vs2_run_execution,
+        mock_ScratchMonitor,
+    ):
+        mock_tempdir.return_value.__enter__.return_value = "/fake/tmp"
+        mock_read_csv.side_effect = [
+            pd.DataFrame({"mock": ["data"]}, index=["sample_1"]),
+            pd.DataFrame({"mock": ["data"]}, index=["sample_2"]),
+        ]
+
+        classify(
+            MagicMock(),
+            MagicMock(),
+            n_jobs=5,
+            prune_intermediates=True,
+            scratch_cap=1000,
+        )
+
+        # The work directory is watched and the cap is passed to Snakemake
+        mock_ScratchMonitor.assert_called_once_with(
+            "/fake/tmp", prune=True, cap_mb=1000
+        )
+        mock_ScratchMonitor.return_value.__enter__.assert_called_once()
+        self.assertEqual(
+            mock_vs2_run_execution.call_args.kwargs["snakemake_args"],
+            ["--default-resources", "--resources", "disk_mb=1000"],
+        )
+
+    @patch("q2_virsorter2.virsorter2_run.MemoryMonitor")
+    @patch("q2_virsorter2.virsorter2_run.memory_estimate")
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
+    @patch("q2_virsorter2.virsorter2_run.pd.read_csv")
+    @patch("shutil.move")
+    @patch("tempfile.TemporaryDirectory")
+    def test_classify_memory_aware(
+        self,
+        mock_tempdir,
+        mock_shutil_move,
+        mock_read_csv,
+        mock_vs2_run_execution,
+        mock_memory_estimate,
+        mock_MemoryMonitor,
+    ):
+        mock_tempdir.return_value.__enter__.return_value = "/fake/tmp"
+        mock_read_csv.side_effect = [
+            pd.DataFrame({"mock": ["data"]}, index=["sample_1"]),
+            pd.DataFrame({"mock": ["data"]}, index=["sample_2"]),
+        ]
+        mock_memory_estimate.return_value = "max(input.size_mb,1000)"
+        database = MagicMock(path="/fake/db")
+
+        classify(MagicMock(), database, n_jobs=5, memory_cap=8000)
+
+        # Jobs get per-job estimates and the budget is passed to Snakemake
+        mock_memory_estimate.assert_called_once_with("/fake/db", 8000)
+        self.assertEqual(
+            mock_vs2_run_execution.call_args.kwargs["snakemake_args"],
+            [
+                "--default-resources",
+                "mem_mb=max(input.size_mb,1000)",
+                "--resources",
+                "mem_mb=8000",
+            ],
+        )
+        mock_MemoryMonitor.assert_called_once_with(cap_mb=8000, events=ANY)
+        mock_MemoryMonitor.return_value.__enter__.assert_called_once()
+
+    @patch("q2_virsorter2.virsorter2_run.memory_estimate")
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_sharded")
+    @patch("q2_virsorter2.virsorter2_run.pd.read_csv")
+    @patch("shutil.move")
+    @patch("tempfile.TemporaryDirectory")
+    def test_classify_memory_aware_sharded(
+        self,
+        mock_tempdir,
+        mock_shutil_move,
+        mock_read_csv,
+        mock_vs2_run_sharded,
+        mock_memory_estimate,
+    ):
+        mock_tempdir.return_value.__enter__.return_value = "/fake/tmp"
+        mock_read_csv.side_effect = [
+            pd.DataFrame({"mock": ["data"]}, index=["sample_1"]),
+            pd.DataFrame({"mock": ["data"]}, index=["sample_2"]),
+        ]
+        mock_memory_estimate.return_value = "1000"
+
+        classify(MagicMock(), MagicMock(), n_jobs=4, memory_cap=8000, n_shards=8)
+
+        # Concurrently running shards share the budget
+        self.assertIn(
+            "mem_mb=2000", mock_vs2_run_sharded.call_args.kwargs["snakemake_args"]
+        )
+
+    @patch("q2_virsorter2.virsorter2_run.SequenceFile")
+    @patch("q2_virsorter2.virsorter2_run.stitch_windows")
+    @patch("q2_virsorter2.virsorter2_run.write_windows")
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
+    @patch("q2_virsorter2.virsorter2_run.pd.read_csv")
+    @patch("shutil.move")
+    @patch("tempfile.TemporaryDirectory")
+    def test_classify_windows(
+        self,
+        mock_tempdir,
+        mock_shutil_move,
+        mock_read_csv,
+        mock_vs2_run_execution,
+        mock_write_windows,
+        mock_stitch_windows,
+        mock_SequenceFile,
+    ):
+        mock_tempdir.return_value.__enter__.return_value = "/fake/tmp"
+        mock_read_csv.side_effect = [
+            pd.DataFrame({"mock": ["data"]}, index=["sample_1"]),
+            pd.DataFrame({"mock": ["data"]}, index=["sample_2"]),
+        ]
+        mock_write_windows.return_value = {"long__window_0": MagicMock()}
+        sequences = MagicMock(path="/fake/sequences")
+
+        classify(sequences, MagicMock(), window_size=50000, window_overlap=1000)
+
+        # The windows are classified and stitched back into the input contigs
+        mock_write_windows.assert_called_once_with(
+            "/fake/sequences", "/fake/tmp/windowed-sequences.fa", 50000, 1000
+        )
+        mock_SequenceFile.assert_called_once_with("/fake/tmp/windowed-sequences.fa")
+        self.assertEqual(
+            mock_vs2_run_execution.call_args.args[1], mock_SequenceFile.return_value
+        )
+        mock_stitch_windows.assert_called_once_with(
+            "/fake/tmp",
+            mock_write_windows.return_value,
+            "/fake/sequences",
+            50000,
+        )
+
+    @patch("q2_virsorter2.virsorter2_run.run_cancellable_command")
+    def test_vs2_run_sharded(self, mock_run_cancellable_command):
+        def fake_run(cmd, cancel, events=None):
+            # Write the outputs of "virsorter run" into the work directory
+            shutil.copytree(os.path.join(DATA, "type", "vs2_out"), cmd[3])
+            with open(os.path.join(cmd[3], "final-viral-combined.fa"), "w") as fh:
+                fh.write(f">{os.path.basename(cmd[3])}\nACGT\n")
+            return True
+
+        mock_run_cancellable_command.side_effect = fake_run
+        mock_sequences = MagicMock()
+        mock_sequences.path = os.path.join(DATA, "fasta", "contigs.fa")
+        mock_database = MagicMock()
+        mock_database.path = "/fake/database"
+        received = []
+
+        with tempfile.TemporaryDirectory() as tmp:
+            vs2_run_sharded(
+                tmp,
+                mock_sequences,
+                mock_database,
+                n_jobs=4,
+                min_score=0.5,
+                min_length=0,
+                n_shards=2,
+                events=EventStream(callback=received.append),
+            )
+
+            # Each shard gets half of the jobs and its own work directory
+            cmds = [c.args[0] for c in mock_run_cancellable_command.call_args_list]
+            self.assertEqual(len(cmds), 2)
+            self.assertEqual({cmd[cmd.index("-j") + 1] for cmd in cmds}, {"2"})
+            self.assertEqual(
+                sorted(cmd[cmd.index("-i") + 1] for cmd in cmds),
+                [os.path.join(tmp, "shards", f"shard-{i}.fasta") for i in range(2)],
+            )
+
+            with open(os.path.join(tmp, "final-viral-combined.fa")) as fh:
+                self.assertEqual(
+                    fh.read().split(),
+                    [">shard-0-attempt-1", "ACGT", ">shard-1-attempt-1", "ACGT"],
+                )
+            score_df = pd.read_csv(
+                os.path.join(tmp, "final-viral-score.tsv"), sep="\t", index_col=0
+            )
+            self.assertEqual(len(score_df), 16)
+
+        # Progress is reported as shards finish
+        progress = [e for e in received if e["event"] == "progress"]
+        self.assertEqual([e["contigs_processed"] for e in progress], [2, 4])
+        stages = [(e["event"], e["stage"]) for e in received if "stage" in e]
+        self.assertEqual(stages.count(("stage_finished", "shard")), 2)
+        self.assertEqual(stages[-1], ("stage_finished", "collate"))
+
+    @patch("q2_virsorter2.virsorter2_run.run_cancellable_command")
+    def test_vs2_run_sharded_retry_removes_attempt(self, mock_run_cancellable_command):
+        def fake_run(cmd, cancel, events=None):
+            shutil.copytree(os.path.join(DATA, "type", "vs2_out"), cmd[3])
+            with open(os.path.join(cmd[3], "final-viral-combined.fa"), "w") as fh:
+                fh.write(">contig\nACGT\n")
+            # The first attempt of every shard fails after writing its outputs
+            if cmd[3].endswith("-attempt-1"):
+                raise subprocess.CalledProcessError(1, "cmd")
+            return True
+
+        mock_run_cancellable_command.side_effect = fake_run
+        mock_sequences = MagicMock()
+        mock_sequences.path = os.path.join(DATA, "fasta", "contigs.fa")
+
+        with tempfile.TemporaryDirectory() as tmp, patch("builtins.print"):
+            vs2_run_sharded(
+                tmp,
+                mock_sequences,
+                MagicMock(),
+                n_jobs=2,
+                min_score=0.5,
+                min_length=0,
+                n_shards=2,
+                max_retries=1,
+            )
+
+            self.assertEqual(
+                sorted(
+                    d for d in os.listdir(os.path.join(tmp, "shards")) if "attempt" in d
+                ),
+                ["shard-0-attempt-2", "shard-1-attempt-2"],
+            )
+
+    @patch(
+        "q2_virsorter2.virsorter2_run.run_cancellable_command",
+        side_effect=subprocess.CalledProcessError(1, "cmd"),
+    )
+    def test_vs2_run_sharded_failure(self, mock_run_cancellable_command):
+        mock_sequences = MagicMock()
+        mock_sequences.path = os.path.join(DATA, "fasta", "contigs.fa")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaisesRegex(Exception, "while running virsorter2 run"):
+                vs2_run_sharded(
+                    tmp,
+                    mock_sequences,
+                    MagicMock(),
+                    n_jobs=4,
+                    min_score=0.5,
+                    min_length=0,
+                    n_shards=2,
+                )
+
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_sharded")
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
+    @patch("q2_virsorter2.virsorter2_run.pd.read_csv")
+    @patch("shutil.move")
+    @patch("tempfile.TemporaryDirectory")
+    def test_classify_sharded(
+        self,
+        mock_tempdir,
+        mock_shutil_move,
+        mock_read_csv,
+        mock_vs2_run_execution,
+        mock_vs2_run_sharded,
+    ):
+        mock_tempdir.return_value.__enter__.return_value = "/fake/tmp"
+        mock_read_csv.side_effect = [
+            pd.DataFrame({"mock": ["data"]}, index=["sample_1"]),
+            pd.DataFrame({"mock": ["data"]}, index=["sample_2"]),
+        ]
+        mock_sequences, mock_database = MagicMock(), MagicMock()
+
+        classify(
+            mock_sequences,
+            mock_database,
+            n_jobs=8,
+            n_shards=4,
+            shard_timeout=3600,
+            max_retries=2,
+            speculative=True,
+        )
+
+        mock_vs2_run_execution.assert_not_called()
+        mock_vs2_run_sharded.assert_called_once_with(
+            "/fake/tmp",
+            mock_sequences,
+            mock_database,
+            8,
+            0.5,
+            0,
+            snakemake_args=[],
+            n_shards=4,
+            shard_timeout=3600,
+            max_retries=2,
+            speculative=True,
+            events=ANY,
+            profile="default",
+        )
+
+    def test_vs2_run_on_worker(self):
+        requests = []
+
+        def fake_run(resources, work_dir, **kwargs):
+            requests.append(kwargs)
+            shutil.copytree(os.path.join(DATA, "type", "vs2_out"), work_dir)
+            open(os.path.join(work_dir, "final-viral-combined.fa"), "w").close()
+            return {"work_dir": work_dir}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            socket_path = os.path.join(tmp, "worker.sock")
+            server = WorkerServer(socket_path, {}, {"run": fake_run})
+            thread = threading.Thread(target=server.serve, daemon=True)
+            thread.start()
+
+            mock_sequences = MagicMock()
+            mock_sequences.path = "/fake/sequences"
+            mock_database = MagicMock()
+            mock_database.path = os.path.join(DATA, "type", "vs2_db")
+            try:
+                with patch.dict(os.environ, {"Q2_VIRSORTER2_CACHE_DIR": tmp}):
+                    vs2_run_on_worker(
+                        socket_path, tmp, mock_sequences, mock_database, 5, 0.5, 0
+                    )
+            finally:
+                server.shutdown()
+                thread.join()
+
+            self.assertEqual(
+                requests,
+                [
+                    {
+                        "sequences": "/fake/sequences",
+                        "n_jobs": 5,
+                        "min_score": 0.5,
+                        "min_length": 0,
+                        "database_manifest": database_manifest(mock_database.path),
+                        "snakemake_args": None,
+                        "profile": "default",
+                    }
+                ],
+            )
+            for fn in ["final-viral-combined.fa", "final-viral-score.tsv"]:
+                self.assertTrue(os.path.exists(os.path.join(tmp, fn)))
+
+    def test_vs2_run_on_worker_unreachable(self):
+        with self.assertRaisesRegex(Exception, "worker listening on /fake/sock"):
+            vs2_run_on_worker(
+                "/fake/sock", "/fake/tmp", MagicMock(), MagicMock(), 5, 0.5, 0
+            )
+
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_on_worker")
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
+    @patch("q2_virsorter2.virsorter2_run.pd.read_csv")
+    @patch("shutil.move")
+    @patch("tempfile.TemporaryDirectory")
+    def test_classify_on_worker(
+        self,
+        mock_tempdir,
+        mock_shutil_move,
+        mock_read_csv,
+        mock_vs2_run_execution,
+        mock_vs2_run_on_worker,
+    ):
+        mock_tempdir.return_value.__enter__.return_value = "/fake/tmp"
+        mock_read_csv.side_effect = [
+            pd.DataFrame({"mock": ["data"]}, index=["sample_1"]),
+            pd.DataFrame({"mock": ["data"]}, index=["sample_2"]),
+        ]
+        mock_sequences, mock_database = MagicMock(), MagicMock()
+
+        classify(mock_sequences, mock_database, n_jobs=5, worker_socket="/fake/sock")
+
+        mock_vs2_run_execution.assert_not_called()
+        mock_vs2_run_on_worker.assert_called_once_with(
+            "/fake/sock",
+            "/fake/tmp",
+            mock_sequences,
+            mock_database,
+            5,
+            0.5,
+            0,
+            snakemake_args=[],
+            profile="default",
+        )
+
+    def _pipeline_context(self):
+        mock_ctx = MagicMock()
+        actions = {
+            "partition_sequences": MagicMock(),
+            "classify": MagicMock(),
+            "_classify_partition": MagicMock(),
+            "collate_results": MagicMock(),
+        }
+        mock_ctx.get_action.side_effect = lambda plugin, action: actions[action]
+        return mock_ctx, actions
+
+    def test_run_pipeline(self):
+        mock_ctx, actions = self._pipeline_context()
+        actions["partition_sequences"].return_value = (
+            {"partition_0": "p0", "partition_1": "p1"},
+        )
+        actions["_classify_partition"].side_effect = [("r0",), ("r1",)]
+        actions["collate_results"].return_value = ("seqs", "score", "boundary")
+
+        result = run(
+            mock_ctx,
+            "sequences",
+            "database",
+            n_jobs=3,
+            compress_sequences=True,
+            num_partitions=2,
+        )
+
+        actions["partition_sequences"].assert_called_once_with("sequences", 2)
+        classify_method = actions["_classify_partition"]
+        self.assertEqual(classify_method.call_count, 2)
+        self.assertEqual(classify_method.call_args_list[1].args, ("p1", "database"))
+        self.assertEqual(classify_method.call_args_list[1].kwargs["n_jobs"], 3)
+        # Every partition tags its progress events with its ID
+        self.assertEqual(
+            classify_method.call_args_list[1].kwargs["partition"], "partition_1"
+        )
+        self.assertNotIn("num_partitions", classify_method.call_args_list[1].kwargs)
+        # Only the collated sequences are compressed
+        self.assertNotIn("compress_sequences", classify_method.call_args_list[1].kwargs)
+        actions["collate_results"].assert_called_once_with(
+            ["r0", "r1"], compress_sequences=True
+        )
+        actions["classify"].assert_not_called()
+        self.assertEqual(result, ("seqs", "score", "boundary"))
+
+    def test_run_pipeline_single_partition(self):
+        mock_ctx, actions = self._pipeline_context()
+        actions["classify"].return_value = ("seqs", "score", "boundary")
+        sequences = MagicMock()
+        sequences.type.__le__.return_value = True
+
+        result = run(mock_ctx, sequences, "database", n_jobs=3, compress_sequences=True)
+
+        # The sequences are neither partitioned nor collated
+        actions["classify"].assert_called_once()
+        self.assertEqual(actions["classify"].call_args.args, (sequences, "database"))
+        self.assertEqual(actions["classify"].call_args.kwargs["n_jobs"], 3)
+        self.assertTrue(actions["classify"].call_args.kwargs["compress_sequences"])
+        actions["partition_sequences"].assert_not_called()
+        actions["collate_results"].assert_not_called()
+        self.assertEqual(result, ("seqs", "score", "boundary"))
+
+    def test_run_pipeline_single_partition_compressed(self):
+        mock_ctx, actions = self._pipeline_context()
+        actions["partition_sequences"].return_value = ({"partition_0": "p0"},)
+        actions["_classify_partition"].return_value = ("r0",)
+        sequences = MagicMock()
+        sequences.type.__le__.return_value = False
+
+        run(mock_ctx, sequences, "database", n_jobs=3)
+
+        # Compressed sequences are decompressed into a single partition
+        actions["partition_sequences"].assert_called_once_with(sequences, 1)
+        actions["collate_results"].assert_called_once_with(
+            ["r0"], compress_sequences=False
+        )
+        actions["classify"].assert_not_called()
+
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
+    def test_classify_partition(self, mock_vs2_run_execution):
+        # VirSorter2 only writes the headers if there are no viral calls
+        def fake_run(tmp, *args, **kwargs):
+            open(os.path.join(tmp, "final-viral-combined.fa"), "w").close()
+            for fn in ["final-viral-score.tsv", "final-viral-boundary.tsv"]:
+                with open(os.path.join(tmp, fn), "w") as fh:
+                    fh.write("seqname\tmax_score\n")
+
+        mock_vs2_run_execution.side_effect = fake_run
+
+        results = _classify_partition(MagicMock(), MagicMock(), n_jobs=5)
+
+        mock_vs2_run_execution.assert_called_once()
+        for fn in ["final-viral-score.tsv", "final-viral-boundary.tsv"]:
+            with open(results.path / fn) as fh:
+                self.assertEqual(fh.read(), "seqname\tmax_score\n")
+        self.assertEqual(os.path.getsize(results.path / "final-viral-combined.fa"), 0)
+
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
+    def test_classify_partition_progress(self, mock_vs2_run_execution):
+        def fake_run(tmp, *args, **kwargs):
+            for fn in RUN_OUTPUTS.values():
+                open(os.path.join(tmp, fn), "w").close()
+
+        mock_vs2_run_execution.side_effect = fake_run
+        sequences = MagicMock()
+        sequences.path = os.path.join(DATA, "fasta", "contigs.fa")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            progress_fp = os.path.join(tmp, "progress.jsonl")
+            _classify_partition(
+                sequences,
+                MagicMock(),
+                progress_file=progress_fp,
+                partition="partition_1",
+            )
+            with open(progress_fp) as fh:
+                events = [json.loads(line) for line in fh]
+
+        # Partitions share the file, so every event names its partition
+        self.assertTrue(events)
+        self.assertEqual({e["partition"] for e in events}, {"partition_1"})
+        progress = [e for e in events if e["event"] == "progress"]
+        self.assertEqual([e["contigs_processed"] for e in progress], [0, 4])
+
+    @patch("q2_virsorter2.virsorter2_run.vs2_run_execution")
+    @patch("q2_virsorter2.virsorter2_run.pd.read_csv")
+    @patch("shutil.move")
+    @patch("tempfile.TemporaryDirectory")
+    def test_classify_no_viral_calls(
+        self, mock_tempdir, mock_shutil_move, mock_read_csv, mock_vs2_run_execution
+    ):
+        mock_tempdir.return_value.__enter__.return_value = "/fake/tmp"
+        mock_read_csv.side_effect = [
+            pd.DataFrame({"max_score": []}, index=pd.Index([], name="seqname")),
+            pd.DataFrame({"max_score": []}, index=pd.Index([], name="seqname")),
+        ]
+
+        with self.assertRaisesRegex(ValueError, "did not identify any viral"):
+            classify(MagicMock(), MagicMock(), n_jobs=5)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from q2_types.metadata import ImmutableMetadataDirectoryFormat
+
+from q2_virsorter2.virsorter2_summarize import (
+    _summarize_boundaries,
+    _summarize_scores,
+    summarize,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data", "type", "vs2_out")
+SCORE = os.path.join(DATA, "final-viral-score.tsv")
+BOUNDARY = os.path.join(DATA, "final-viral-boundary.tsv")
+
+
+class TestSummarize(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _metadata(self, fp, name):
+        path = os.path.join(self.tmp, name)
+        os.makedirs(path)
+        # Exported metadata has a row with the column types
+        with open(fp) as src, open(os.path.join(path, "metadata.tsv"), "w") as dst:
+            dst.write(src.readline())
+            dst.write("#q2:types\n")
+            dst.write(src.read())
+        return ImmutableMetadataDirectoryFormat(path, mode="r")
+
+    def test_summarize_scores(self):
+        summary = _summarize_scores(SCORE)
+
+        self.assertEqual(summary["n_calls"], 8)
+        self.assertEqual(summary["n_unscored"], 1)
+        self.assertEqual(summary["score_hist"].sum(), 7)
+        # The last bin includes a score of 1
+        self.assertEqual(summary["score_hist"][-1], 3)
+        self.assertEqual(summary["length_hist"].sum(), 8)
+        self.assertEqual(summary["density"].sum(), 7)
+        self.assertEqual(summary["groups"], {"dsDNAphage": 7, "ssDNA": 1})
+
+    def test_summarize_scores_in_chunks(self):
+        whole, chunked = _summarize_scores(SCORE), _summarize_scores(SCORE, 3)
+
+        self.assertEqual(whole["n_calls"], chunked["n_calls"])
+        self.assertEqual(whole["groups"], chunked["groups"])
+        self.assertTrue((whole["density"] == chunked["density"]).all())
+
+    def test_summarize_boundaries(self):
+        summary = _summarize_boundaries(BOUNDARY)
+
+        self.assertEqual(summary["n_regions"], 7)
+        self.assertEqual(summary["n_partial"], 1)
+        self.assertEqual(summary["region_length_hist"].sum(), 7)
+        self.assertEqual(summary["shapes"], {"linear": 6, "circular": 1})
+
+    def test_summarize(self):
+        output_dir = os.path.join(self.tmp, "out")
+        os.makedirs(output_dir)
+
+        summarize(
+            output_dir,
+            self._metadata(SCORE, "score"),
+            self._metadata(BOUNDARY, "boundary"),
+        )
+
+        with open(os.path.join(output_dir, "index.html")) as fh:
+            self.assertIn("VirSorter2 summary", fh.read())
+        with open(os.path.join(output_dir, "summary.json")) as fh:
+            summary = json.load(fh)
+        self.assertEqual(summary["n_calls"], 8)
+        self.assertEqual(len(summary["score_bins"]), 51)
+        self.assertEqual(len(summary["density"]), 50)
+        self.assertEqual(summary["shapes"], {"linear": 6, "circular": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
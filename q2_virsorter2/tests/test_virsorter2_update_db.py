@@ -0,0 +1,82 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import filecmp
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from q2_virsorter2.types._format import Virsorter2DbDirFmt
+from q2_virsorter2.virsorter2_update_db import _hash_tree, diff_trees, update_db
+
+DB = os.path.join(os.path.dirname(__file__), "data", "type", "vs2_db")
+
+
+class TestVirsorter2UpdateDb(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database = Virsorter2DbDirFmt(DB, mode="r")
+
+        # A new release with one changed, one added and one removed file
+        self.release = os.path.join(self.tmp.name, "release")
+        shutil.copytree(DB, self.release)
+        with open(os.path.join(self.release, "hmm/pfam/Pfam-A.tsv"), "a") as fh:
+            fh.write("PF99999.1\tNew-family\tNew family\tvir\n")
+        shutil.copytree(
+            os.path.join(DB, "group/dsDNAphage"),
+            os.path.join(self.release, "group/lavidaviridae"),
+        )
+        os.remove(os.path.join(self.release, "group/NCLDV/rbs-prodigal-train.db"))
+        os.makedirs(os.path.join(self.release, "conda_envs"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hash_tree_ignores_setup_leftovers(self):
+        obs = _hash_tree(self.release, n_jobs=2)
+        self.assertIn("hmm/pfam/Pfam-A.hmm", obs)
+        self.assertFalse(any(p.startswith("conda_envs") for p in obs))
+
+    def test_diff_trees(self):
+        old = {"a": "1", "b": "2", "c": "3"}
+        new = {"a": "1", "b": "x", "d": "4"}
+        self.assertEqual(
+            diff_trees(old, new),
+            {"added": ["d"], "removed": ["c"], "changed": ["b"], "unchanged": ["a"]},
+        )
+
+    def _assert_updated(self, result):
+        for rel_path in ["hmm/pfam/Pfam-A.tsv", "group/lavidaviridae/model"]:
+            self.assertTrue(
+                filecmp.cmp(
+                    os.path.join(self.release, rel_path),
+                    os.path.join(str(result.path), rel_path),
+                    shallow=False,
+                )
+            )
+        self.assertFalse(
+            os.path.exists(result.path / "group/NCLDV/rbs-prodigal-train.db")
+        )
+        self.assertTrue(os.path.isfile(result.path / "Done_all_setup"))
+
+    def test_update_db_from_directory(self):
+        result = update_db(self.database, self.release, n_jobs=2)
+        self._assert_updated(result)
+
+    def test_update_db_from_archive(self):
+        archive = os.path.join(self.tmp.name, "db.tgz")
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(self.release, arcname="db")
+
+        result = update_db(self.database, archive, n_jobs=2)
+        self._assert_updated(result)
+
+
+if __name__ == "__main__":
+    unittest.main()
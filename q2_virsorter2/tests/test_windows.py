@@ -0,0 +1,231 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from q2_virsorter2._fasta import iter_fasta
+from q2_virsorter2._windows import (
+    Window,
+    stitch_windows,
+    window_starts,
+    write_windows,
+)
+
+SCORE_COLUMNS = [
+    "seqname",
+    "dsDNAphage",
+    "max_score",
+    "max_score_group",
+    "length",
+    "hallmark",
+    "viral",
+    "cellular",
+]
+BOUNDARY_COLUMNS = [
+    "seqname",
+    "trim_orf_index_start",
+    "trim_bp_start",
+    "trim_bp_end",
+    "partial",
+    "shape",
+    "seqname_new",
+]
+
+
+class TestWindows(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        rng = random.Random(42)
+        self.long = "".join(rng.choice("ACGT") for _ in range(250))
+        self.sequences_fp = os.path.join(self.tmp, "input.fa")
+        with open(self.sequences_fp, "w") as fh:
+            fh.write(f">long\n{self.long}\n>short\nACGTACGT\n")
+
+    def test_window_starts(self):
+        self.assertEqual(window_starts(50, 100, 20), [0])
+        self.assertEqual(window_starts(100, 100, 20), [0])
+        self.assertEqual(window_starts(250, 100, 20), [0, 80, 150])
+        self.assertEqual(window_starts(260, 100, 20), [0, 80, 160])
+
+    def test_window_starts_overlap_too_large(self):
+        with self.assertRaisesRegex(ValueError, "must be smaller"):
+            window_starts(250, 100, 100)
+
+    def test_write_windows(self):
+        windows_fp = os.path.join(self.tmp, "windows.fa")
+        windows = write_windows(self.sequences_fp, windows_fp, 100, 20)
+
+        self.assertEqual(
+            windows,
+            {
+                "long__window_0": Window("long", 0, 250, 3),
+                "long__window_80": Window("long", 80, 250, 3),
+                "long__window_150": Window("long", 150, 250, 3),
+            },
+        )
+        with open(windows_fp, "rb") as fh:
+            records = dict(iter_fasta(fh))
+        self.assertEqual(records["long__window_80"].decode(), self.long[80:180])
+        self.assertEqual(records["long__window_150"].decode(), self.long[150:])
+        self.assertEqual(records["short"], b"ACGTACGT")
+
+    def _write_outputs(self, scores, boundaries, sequences):
+        pd.DataFrame(scores, columns=SCORE_COLUMNS).to_csv(
+            os.path.join(self.tmp, "final-viral-score.tsv"), sep="\t", index=False
+        )
+        pd.DataFrame(boundaries, columns=BOUNDARY_COLUMNS).to_csv(
+            os.path.join(self.tmp, "final-viral-boundary.tsv"), sep="\t", index=False
+        )
+        with open(os.path.join(self.tmp, "final-viral-combined.fa"), "w") as fh:
+            fh.write("".join(f">{name}\n{seq}\n" for name, seq in sequences))
+
+    def _read(self, name):
+        return pd.read_csv(
+            os.path.join(self.tmp, name), sep="\t", dtype=str, keep_default_na=False
+        )
+
+    def test_stitch_windows_edge_crossing_call(self):
+        windows = write_windows(
+            self.sequences_fp, os.path.join(self.tmp, "w.fa"), 100, 20
+        )
+        # A provirus at 61-130 of the contig is cut by the edge of the first
+        # window and complete in the second one
+        self._write_outputs(
+            [
+                ["long__window_0||0_partial", 0.6, 0.6, "dsDNAphage", 40, 0, 50, 0],
+                ["long__window_80||0_partial", 0.9, 0.9, "dsDNAphage", 50, 1, 80, 0],
+                ["short||full", 0.7, 0.7, "dsDNAphage", 8, 0, 100, 0],
+            ],
+            [
+                [
+                    "long__window_0",
+                    3,
+                    61,
+                    100,
+                    1,
+                    "linear",
+                    "long__window_0||0_partial",
+                ],
+                [
+                    "long__window_80",
+                    1,
+                    1,
+                    50,
+                    1,
+                    "linear",
+                    "long__window_80||0_partial",
+                ],
+                ["short", 1, 1, 8, 0, "linear", "short||full"],
+            ],
+            [("long__window_0||0_partial", "A"), ("short||full", "ACGTACGT")],
+        )
+
+        stitch_windows(self.tmp, windows, self.sequences_fp, 100)
+
+        scores = self._read("final-viral-score.tsv")
+        self.assertEqual(list(scores["seqname"]), ["short||full", "long||0_partial"])
+        self.assertEqual(list(scores["max_score"]), ["0.7", "0.9"])
+        self.assertEqual(list(scores["length"]), ["8", "70"])
+        boundaries = self._read("final-viral-boundary.tsv")
+        self.assertEqual(
+            boundaries.iloc[1].to_dict(),
+            {
+                "seqname": "long",
+                "trim_orf_index_start": "",
+                "trim_bp_start": "61",
+                "trim_bp_end": "130",
+                "partial": "1",
+                "shape": "linear",
+                "seqname_new": "long||0_partial",
+            },
+        )
+        with open(os.path.join(self.tmp, "final-viral-combined.fa"), "rb") as fh:
+            records = dict(iter_fasta(fh))
+        self.assertEqual(
+            records,
+            {"short||full": b"ACGTACGT", "long||0_partial": self.long[60:130].encode()},
+        )
+
+    def test_stitch_windows_full_contig(self):
+        windows = write_windows(
+            self.sequences_fp, os.path.join(self.tmp, "w.fa"), 100, 20
+        )
+        self._write_outputs(
+            [
+                [f"long__window_{s}||full", score, score, "dsDNAphage", 100, 1, 80, 0]
+                for s, score in [(0, 0.8), (80, 0.95), (150, 0.7)]
+            ],
+            [
+                [
+                    f"long__window_{s}",
+                    1,
+                    1 + trim,
+                    100,
+                    0,
+                    "linear",
+                    f"long__window_{s}||full",
+                ]
+                for s, trim in [(0, 4), (80, 0), (150, 0)]
+            ],
+            [],
+        )
+
+        stitch_windows(self.tmp, windows, self.sequences_fp, 100)
+
+        scores = self._read("final-viral-score.tsv")
+        self.assertEqual(
+            scores[["seqname", "max_score", "length"]].values.tolist(),
+            [["long||full", "0.95", "246"]],
+        )
+        boundaries = self._read("final-viral-boundary.tsv")
+        self.assertEqual(
+            boundaries[["trim_bp_start", "trim_bp_end", "partial"]].values.tolist(),
+            [["5", "250", "0"]],
+        )
+
+    def test_stitch_windows_separate_calls(self):
+        windows = write_windows(
+            self.sequences_fp, os.path.join(self.tmp, "w.fa"), 100, 20
+        )
+        self._write_outputs(
+            [
+                ["long__window_0||0_partial", 0.6, 0.6, "dsDNAphage", 20, 0, 50, 0],
+                ["long__window_150||0_partial", 0.9, 0.9, "dsDNAphage", 20, 1, 80, 0],
+            ],
+            [
+                ["long__window_0", 1, 11, 30, 1, "linear", "long__window_0||0_partial"],
+                [
+                    "long__window_150",
+                    1,
+                    51,
+                    70,
+                    1,
+                    "linear",
+                    "long__window_150||0_partial",
+                ],
+            ],
+            [],
+        )
+
+        stitch_windows(self.tmp, windows, self.sequences_fp, 100)
+
+        boundaries = self._read("final-viral-boundary.tsv")
+        self.assertEqual(
+            boundaries[["seqname_new", "trim_bp_start", "trim_bp_end"]].values.tolist(),
+            [["long||0_partial", "11", "30"], ["long||1_partial", "201", "220"]],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,267 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from pyhmmer.plan7 import OptimizedProfile
+
+from q2_virsorter2._classifier import GroupClassifier
+from q2_virsorter2._history import database_manifest
+from q2_virsorter2._hmmsearch import PATH_ENV, SOCKET_ENV
+from q2_virsorter2._worker import (
+    FairQueue,
+    WorkerServer,
+    _hmmsearch_job,
+    _rescore_job,
+    _run_job,
+    _tblout_job,
+    load_database,
+    submit_job,
+)
+from q2_virsorter2.tests.test_classifier import LinearModel, make_features
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+class TestFairQueue(unittest.TestCase):
+    def test_round_robin(self):
+        queue = FairQueue()
+        for i in range(3):
+            queue.put("greedy", f"g{i}")
+        queue.put("polite", "p0")
+        queue.put("other", "o0")
+
+        self.assertEqual(len(queue), 5)
+        obs = [queue.get() for _ in range(5)]
+        self.assertEqual(obs, ["g0", "p0", "o0", "g1", "g2"])
+
+    def test_get_timeout(self):
+        self.assertIsNone(FairQueue().get(timeout=0.01))
+
+
+class TestWorkerServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp.name, "worker.sock")
+        self.loads = 0
+
+        def load(resources):
+            # Stands in for a job using the pre-loaded database
+            return {"database": resources["database"], "calls": self.loads}
+
+        def fail(resources):
+            raise ValueError("broken job")
+
+        self.handlers = {"load": load, "fail": fail}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _start(self, **kwargs):
+        server = WorkerServer(
+            self.socket_path, {"database": "/fake/db"}, self.handlers, **kwargs
+        )
+        thread = threading.Thread(target=server.serve, daemon=True)
+        thread.start()
+        return server, thread
+
+    def test_submit_job(self):
+        server, thread = self._start()
+        try:
+            obs = submit_job(self.socket_path, "load", timeout=5)
+            self.assertEqual(obs, {"database": "/fake/db", "calls": 0})
+        finally:
+            server.shutdown()
+            thread.join()
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_submit_job_failure(self):
+        server, thread = self._start()
+        try:
+            with self.assertRaisesRegex(Exception, "ValueError: broken job"):
+                submit_job(self.socket_path, "fail", timeout=5)
+            with self.assertRaisesRegex(Exception, "Unknown operation 'nope'"):
+                submit_job(self.socket_path, "nope", timeout=5)
+        finally:
+            server.shutdown()
+            thread.join()
+
+    def test_concurrent_clients(self):
+        server, thread = self._start(n_workers=2)
+        results = []
+
+        def call(client):
+            results.append(submit_job(self.socket_path, "load", client=client))
+
+        try:
+            callers = [
+                threading.Thread(target=call, args=(f"client-{i % 2}",))
+                for i in range(6)
+            ]
+            for caller in callers:
+                caller.start()
+            for caller in callers:
+                caller.join(5)
+        finally:
+            server.shutdown()
+            thread.join()
+        self.assertEqual(len(results), 6)
+
+    def test_idle_timeout(self):
+        server, thread = self._start(idle_timeout=0.2)
+        submit_job(self.socket_path, "load", timeout=5)
+
+        start = time.monotonic()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+class TestWorkerJobs(unittest.TestCase):
+    def test_load_database(self):
+        db = os.path.join(DATA, "type", "vs2_db")
+        resources = load_database(db)
+
+        self.assertEqual(resources["database"], db)
+        self.assertEqual(resources["run_database"], db)
+        self.assertEqual(resources["manifest"], database_manifest(db))
+        self.assertEqual(list(resources["hmms"]), ["hmm/pfam/Pfam-A.hmm"])
+        (profile,) = resources["hmms"]["hmm/pfam/Pfam-A.hmm"]
+        # Profiles are kept in the form they are searched in
+        self.assertIsInstance(profile, OptimizedProfile)
+
+    def _proteins(self, resources, tmp):
+        proteins = os.path.join(tmp, "proteins.faa")
+        # The consensus of the profile is a guaranteed hit
+        consensus = resources["hmms"]["hmm/pfam/Pfam-A.hmm"][0].consensus
+        with open(proteins, "w") as fh:
+            fh.write(f">prot_1\n{consensus.upper()}\n>prot_2\nMKKKKKKK\n")
+        return proteins
+
+    def test_hmmsearch_job(self):
+        resources = load_database(os.path.join(DATA, "type", "vs2_db"))
+        with tempfile.TemporaryDirectory() as tmp:
+            proteins = self._proteins(resources, tmp)
+            output = os.path.join(tmp, "hits.tsv")
+
+            obs = _hmmsearch_job(resources, proteins, output)
+
+            self.assertEqual(obs, {"output": output, "n_hits": 1})
+            with open(output) as fh:
+                lines = [line.split("\t") for line in fh.read().splitlines()]
+            self.assertEqual(
+                lines[0], ["protein", "profile", "hmm_file", "score", "evalue"]
+            )
+            self.assertEqual(
+                lines[1][:3], ["prot_1", "AF2331-like", "hmm/pfam/Pfam-A.hmm"]
+            )
+
+    def test_tblout_job(self):
+        db = os.path.join(DATA, "type", "vs2_db")
+        resources = load_database(db)
+        with tempfile.TemporaryDirectory() as tmp:
+            proteins = self._proteins(resources, tmp)
+            output = os.path.join(tmp, "hits.tbl")
+
+            _tblout_job(
+                resources,
+                os.path.join(db, "hmm", "pfam", "Pfam-A.hmm"),
+                proteins,
+                output,
+                T=10.0,
+            )
+
+            with open(output) as fh:
+                lines = fh.read().splitlines()
+            self.assertTrue(lines[0].startswith("#"))
+            rows = [line.split() for line in lines if not line.startswith("#")]
+            self.assertEqual(
+                [row[:3] for row in rows], [["prot_1", "-", "AF2331-like"]]
+            )
+
+            # Other files are not served
+            with self.assertRaisesRegex(ValueError, "not an HMM file"):
+                _tblout_job(resources, "/other/file.hmm", proteins, output)
+
+    def test_run_job(self):
+        db = os.path.join(DATA, "type", "vs2_db")
+        resources = load_database(db)
+        hmm_fp = os.path.join(db, "hmm", "pfam", "Pfam-A.hmm")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            proteins = self._proteins(resources, tmp)
+            output = os.path.join(tmp, "hits.tbl")
+            envs = []
+
+            # Searches of the run are served by the worker
+            def fake_run_command(cmd, env):
+                envs.append(env)
+                subprocess.run(
+                    ["hmmsearch", "-T", "10", "--tblout", output, "--cpu", "1"]
+                    + ["--noali", "-o", os.devnull, hmm_fp, proteins],
+                    env=env,
+                    check=True,
+                )
+
+            with patch(
+                "q2_virsorter2._worker.run_command", side_effect=fake_run_command
+            ) as run_command:
+                _run_job(
+                    resources,
+                    "seqs.fa",
+                    "/fake/work",
+                    4,
+                    0.5,
+                    0,
+                    resources["manifest"],
+                )
+
+            self.assertIn(db, run_command.call_args.args[0])
+            with open(output) as fh:
+                rows = [line.split() for line in fh if not line.startswith("#")]
+            self.assertEqual([row[0] for row in rows], ["prot_1"])
+
+        self.assertEqual(envs[0][PATH_ENV], os.environ.get("PATH", os.defpath))
+        # The server of the run is shut down with it
+        self.assertFalse(os.path.exists(envs[0][SOCKET_ENV]))
+
+    def test_run_job_other_database(self):
+        resources = {"database": "/worker/db", "manifest": "abc"}
+        with patch("q2_virsorter2._worker.run_command") as run_command:
+            with self.assertRaisesRegex(ValueError, "/worker/db.*abc.*def"):
+                _run_job(resources, "seqs.fa", "/fake/work", 4, 0.5, 0, "def")
+            run_command.assert_not_called()
+
+    def test_rescore_job(self):
+        features = make_features(3)
+        weights = np.zeros(len(features.columns))
+        classifier = GroupClassifier({"dsDNAphage": LinearModel(weights)})
+        resources = {"database": None, "classifier": classifier}
+        with tempfile.TemporaryDirectory() as tmp:
+            features_fp = os.path.join(tmp, "all.pdg.ftr")
+            features.to_csv(features_fp, sep="\t")
+            output = os.path.join(tmp, "scores.tsv")
+
+            obs = _rescore_job(resources, features_fp, output)
+
+            self.assertEqual(obs, {"output": output, "n_contigs": 3})
+            scores = pd.read_csv(output, sep="\t", index_col=0)
+            self.assertEqual(list(scores.index), list(features.index))
+            self.assertEqual(list(scores["max_score"]), [0.5, 0.5, 0.5])
+
+
+if __name__ == "__main__":
+    unittest.main()
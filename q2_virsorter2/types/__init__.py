@@ -6,15 +6,30 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 from ._format import (
+    BgzfIndexFormat,
+    FastaIndexFormat,
     GeneralBinaryFileFormat,
     GeneralTSVFormat,
+    GzippedDNAFASTAFormat,
+    GzippedDNASequencesDirFmt,
     HallmarkGeneListFormat,
     HMMFormat,
+    IndexedDNAFASTADirFmt,
     RbsCatetoryFormat,
     RbsCatetoryNotesFormat,
+    Virsorter2CompressedDbDirFmt,
     Virsorter2DbDirFmt,
+    Virsorter2DbIndexFormat,
+    Virsorter2ResultsDirFmt,
+    Virsorter2TableFormat,
+)
+from ._type import (
+    CompressedSequence,
+    IndexedSequence,
+    Virsorter2CompressedDb,
+    Virsorter2Db,
+    Virsorter2Results,
 )
-from ._type import Virsorter2Db
 
 __all__ = [
     "Virsorter2Db",
@@ -25,4 +40,17 @@ __all__ = [
     "RbsCatetoryNotesFormat",
     "RbsCatetoryFormat",
     "GeneralTSVFormat",
+    "FastaIndexFormat",
+    "IndexedDNAFASTADirFmt",
+    "IndexedSequence",
+    "Virsorter2CompressedDb",
+    "Virsorter2CompressedDbDirFmt",
+    "Virsorter2DbIndexFormat",
+    "CompressedSequence",
+    "GzippedDNAFASTAFormat",
+    "GzippedDNASequencesDirFmt",
+    "BgzfIndexFormat",
+    "Virsorter2Results",
+    "Virsorter2ResultsDirFmt",
+    "Virsorter2TableFormat",
 ]
@@ -5,13 +5,27 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import itertools
+import os
 import subprocess
+import zlib
 
 import pandas as pd
 from pyhmmer.plan7 import HMMFile
+from q2_types.feature_data import DNAFASTAFormat
 from qiime2.core.exceptions import ValidationError
 from qiime2.plugin import model
 
+from q2_virsorter2._compression import (
+    INDEX_FILE,
+    decompress_directory,
+    is_gzip,
+    open_compressed,
+    read_gzi,
+    read_index,
+)
+from q2_virsorter2._fasta import _index_records
+
 
 # Format for validating general TSV files
 class GeneralTSVFormat(model.TextFileFormat):
@@ -208,3 +222,150 @@ class Virsorter2DbDirFmt(model.DirectoryFormat):
     @db_files.set_path_maker
     def db_files_path_maker(self, sample_id):
         return "group/{}/{}.db".format(sample_id[0], sample_id[1])
+
+
+# Format for validating the index of a compressed Virsorter2 database
+class Virsorter2DbIndexFormat(model.TextFileFormat):
+    def _validate(self, n_records=None):
+        try:
+            entries = read_index(str(self))
+        except ValueError as e:
+            raise ValidationError(f"File could not be parsed: {e}")
+
+        if not entries:
+            raise ValidationError("The index is empty.")
+
+    def _validate_(self, level):
+        self._validate()
+
+
+# Directory format for the Virsorter2 Database with block-compressed files
+class Virsorter2CompressedDbDirFmt(model.DirectoryFormat):
+    index = model.File(INDEX_FILE, format=Virsorter2DbIndexFormat)
+    compressed_files = model.FileCollection(r".+\.gz$", format=GeneralBinaryFileFormat)
+
+    @compressed_files.set_path_maker
+    def compressed_files_path_maker(self, rel_path):
+        return "{}.gz".format(rel_path)
+
+    def _validate_(self, level):
+        for entry in read_index(str(self.path / INDEX_FILE)):
+            fp = self.path / "{}.gz".format(entry.path)
+            if not fp.is_file():
+                raise ValidationError(f"Compressed file of {entry.path} is missing.")
+            if fp.stat().st_size != sum(entry.blocks):
+                raise ValidationError(f"Compressed file of {entry.path} is truncated.")
+
+        # Decompress every file to verify its checksum, without writing it
+        if level == "max":
+            try:
+                decompress_directory(str(self.path), None, n_jobs=os.cpu_count() or 1)
+            except (ValueError, OSError, EOFError, zlib.error) as e:
+                raise ValidationError(f"Database could not be decompressed: {e}")
+
+
+# Format for validating samtools-compatible FASTA index (.fai) files
+class FastaIndexFormat(model.TextFileFormat):
+    def _validate(self, n_records=None):
+        with open(str(self)) as fh:
+            for line_number, line in enumerate(fh, start=1):
+                if n_records is not None and line_number > n_records:
+                    break
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 5:
+                    raise ValidationError(
+                        f"Line {line_number}: Expected 5 fields, but found "
+                        f"{len(fields)}."
+                    )
+                if not fields[0]:
+                    raise ValidationError(f"Line {line_number}: Name is empty.")
+                if not all(field.isdigit() for field in fields[1:]):
+                    raise ValidationError(
+                        f"Line {line_number}: Length, offset and line lengths "
+                        "must be non-negative integers."
+                    )
+
+    def _validate_(self, level):
+        self._validate(n_records={"min": 10, "max": None}[level])
+
+
+# Directory format for DNA sequences stored together with their index
+class IndexedDNAFASTADirFmt(model.DirectoryFormat):
+    sequences = model.File(r"dna-sequences.fasta", format=DNAFASTAFormat)
+    index = model.File(r"dna-sequences.fasta.fai", format=FastaIndexFormat)
+
+
+# Format for gzip (or BGZF) compressed DNA sequences in FASTA format
+class GzippedDNAFASTAFormat(model.BinaryFileFormat):
+    def _validate(self, n_records=None):
+        if not is_gzip(str(self)):
+            raise ValidationError("The file is not gzip compressed.")
+
+        # Only the start of the file is decompressed for minimal validation
+        try:
+            with open_compressed(str(self)) as fh:
+                records = _index_records(fh)
+                for _ in itertools.islice(records, n_records):
+                    pass
+        except (OSError, EOFError, ValueError) as e:
+            raise ValidationError(f"File could not be parsed: {e}")
+
+    def _validate_(self, level):
+        self._validate(n_records={"min": 10, "max": None}[level])
+
+
+# Format for validating the block offsets (.gzi) of BGZF compressed files
+class BgzfIndexFormat(model.BinaryFileFormat):
+    def _validate_(self, level):
+        try:
+            offsets = read_gzi(str(self))
+        except ValueError as e:
+            raise ValidationError(str(e))
+        if offsets != sorted(offsets):
+            raise ValidationError("Block offsets are not in ascending order.")
+
+
+# Directory format for compressed DNA sequences. BGZF compressed sequences
+# can be indexed for random access (as with "samtools faidx").
+class GzippedDNASequencesDirFmt(model.DirectoryFormat):
+    sequences = model.File(r"dna-sequences.fasta.gz", format=GzippedDNAFASTAFormat)
+    index = model.File(
+        r"dna-sequences.fasta.gz.fai", format=FastaIndexFormat, optional=True
+    )
+    gzi = model.File(
+        r"dna-sequences.fasta.gz.gzi", format=BgzfIndexFormat, optional=True
+    )
+
+
+# Format for validating the score and boundary tables written by VirSorter2.
+# Tables without any viral calls only consist of the header.
+class Virsorter2TableFormat(model.TextFileFormat):
+    def _validate(self, n_records=None):
+        with open(str(self)) as fh:
+            header = fh.readline().rstrip("\n").split("\t")
+            if header[0] != "seqname":
+                raise ValidationError("The table must start with a 'seqname' column.")
+            for line_number, line in enumerate(fh, start=2):
+                if n_records is not None and line_number > n_records + 1:
+                    break
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != len(header):
+                    raise ValidationError(
+                        f"Line {line_number}: Expected {len(header)} fields, but "
+                        f"found {len(fields)}."
+                    )
+                if not fields[0]:
+                    raise ValidationError(f"Line {line_number}: seqname is empty.")
+
+    def _validate_(self, level):
+        self._validate(n_records={"min": 10, "max": None}[level])
+
+
+# Directory format for the results of a single VirSorter2 run, which may
+# not contain any viral calls
+class Virsorter2ResultsDirFmt(model.DirectoryFormat):
+    viral_sequences = model.File(r"final-viral-combined.fa", format=DNAFASTAFormat)
+    viral_score = model.File(r"final-viral-score.tsv", format=Virsorter2TableFormat)
+    viral_boundary = model.File(
+        r"final-viral-boundary.tsv", format=Virsorter2TableFormat
+    )
@@ -0,0 +1,135 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+
+from q2_types.feature_data import DNAFASTAFormat, DNASequencesDirectoryFormat
+
+from q2_virsorter2._compression import (
+    compress_directory,
+    materialize_directory,
+    open_compressed,
+)
+from q2_virsorter2._fasta import SequenceFile, build_fasta_index, compress_fasta
+from q2_virsorter2.plugin_setup import plugin
+from q2_virsorter2.types._format import (
+    GzippedDNAFASTAFormat,
+    GzippedDNASequencesDirFmt,
+    IndexedDNAFASTADirFmt,
+    Virsorter2CompressedDbDirFmt,
+    Virsorter2DbDirFmt,
+)
+
+
+def _index_fasta(fasta_fp):
+    # Copy and index the sequences in a single pass
+    result = IndexedDNAFASTADirFmt()
+    build_fasta_index(
+        fasta_fp,
+        str(result.path / "dna-sequences.fasta.fai"),
+        copy_to=str(result.path / "dna-sequences.fasta"),
+    )
+    return result
+
+
+@plugin.register_transformer
+def _1(ff: DNAFASTAFormat) -> IndexedDNAFASTADirFmt:
+    return _index_fasta(str(ff))
+
+
+@plugin.register_transformer
+def _2(ff: DNASequencesDirectoryFormat) -> IndexedDNAFASTADirFmt:
+    return _index_fasta(str(ff.path / "dna-sequences.fasta"))
+
+
+@plugin.register_transformer
+def _3(ff: IndexedDNAFASTADirFmt) -> DNAFASTAFormat:
+    result = DNAFASTAFormat()
+    shutil.copyfile(str(ff.path / "dna-sequences.fasta"), str(result))
+    return result
+
+
+@plugin.register_transformer
+def _4(ff: Virsorter2DbDirFmt) -> Virsorter2CompressedDbDirFmt:
+    result = Virsorter2CompressedDbDirFmt()
+    compress_directory(str(ff.path), str(result.path), n_jobs=os.cpu_count() or 1)
+    return result
+
+
+@plugin.register_transformer
+def _5(ff: Virsorter2CompressedDbDirFmt) -> Virsorter2DbDirFmt:
+    # Decompressed databases are cached, so this is only slow the first time
+    return Virsorter2DbDirFmt(materialize_directory(str(ff.path)), mode="r")
+
+
+@plugin.register_transformer
+def _6(ff: DNAFASTAFormat) -> SequenceFile:
+    return SequenceFile(str(ff))
+
+
+@plugin.register_transformer
+def _7(ff: DNASequencesDirectoryFormat) -> SequenceFile:
+    return SequenceFile(ff.path / "dna-sequences.fasta")
+
+
+@plugin.register_transformer
+def _8(ff: GzippedDNASequencesDirFmt) -> SequenceFile:
+    # The sequences are decompressed by the consumer while reading
+    return SequenceFile(ff.path / "dna-sequences.fasta.gz")
+
+
+@plugin.register_transformer
+def _9(ff: GzippedDNASequencesDirFmt) -> DNAFASTAFormat:
+    result = DNAFASTAFormat()
+    with open_compressed(
+        str(ff.path / "dna-sequences.fasta.gz"), n_jobs=os.cpu_count() or 1
+    ) as fh, open(str(result), "wb") as out:
+        shutil.copyfileobj(fh, out)
+    return result
+
+
+@plugin.register_transformer
+def _10(ff: GzippedDNAFASTAFormat) -> GzippedDNASequencesDirFmt:
+    result = GzippedDNASequencesDirFmt()
+    shutil.copyfile(str(ff), str(result.path / "dna-sequences.fasta.gz"))
+    return result
+
+
+@plugin.register_transformer
+def _11(ff: IndexedDNAFASTADirFmt) -> SequenceFile:
+    # The stored index spares consumers another pass over the sequences
+    return SequenceFile(
+        ff.path / "dna-sequences.fasta", ff.path / "dna-sequences.fasta.fai"
+    )
+
+
+@plugin.register_transformer
+def _12(ff: SequenceFile) -> GzippedDNASequencesDirFmt:
+    # Sequences written as indexed BGZF by the action are taken over as is
+    if isinstance(ff.owner, GzippedDNASequencesDirFmt):
+        return ff.owner
+    result = GzippedDNASequencesDirFmt()
+    with ff.open(n_jobs=os.cpu_count() or 1) as fh:
+        compress_fasta(
+            fh,
+            str(result.path / "dna-sequences.fasta.gz"),
+            n_jobs=os.cpu_count() or 1,
+        )
+    return result
+
+
+@plugin.register_transformer
+def _13(ff: SequenceFile) -> DNASequencesDirectoryFormat:
+    if isinstance(ff.owner, DNASequencesDirectoryFormat):
+        return ff.owner
+    result = DNASequencesDirectoryFormat()
+    with ff.open(n_jobs=os.cpu_count() or 1) as fh, open(
+        str(result.path / "dna-sequences.fasta"), "wb"
+    ) as out:
+        shutil.copyfileobj(fh, out)
+    return result
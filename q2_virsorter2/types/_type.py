@@ -5,6 +5,13 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+from q2_types.feature_data import FeatureData
 from qiime2.plugin import SemanticType
 
 Virsorter2Db = SemanticType("Virsorter2Db")
+Virsorter2CompressedDb = SemanticType("Virsorter2CompressedDb")
+Virsorter2Results = SemanticType("Virsorter2Results")
+CompressedSequence = SemanticType(
+    "CompressedSequence", variant_of=FeatureData.field["type"]
+)
+IndexedSequence = SemanticType("IndexedSequence", variant_of=FeatureData.field["type"])
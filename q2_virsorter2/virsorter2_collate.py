@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+
+import pandas as pd
+import qiime2
+from q2_types.feature_data import DNASequencesDirectoryFormat
+
+from q2_virsorter2._fasta import SequenceFile
+from q2_virsorter2._sharding import RUN_OUTPUTS
+from q2_virsorter2.types._format import (
+    GzippedDNASequencesDirFmt,
+    Virsorter2ResultsDirFmt,
+)
+
+
+def sequences_output(compress):
+    """
+    Create the file that the viral sequences of an action are written to.
+
+    Args:
+    compress (bool): Write the sequences as indexed BGZF, to be returned
+        as FeatureData[CompressedSequence].
+
+    Returns:
+    SequenceFile: The (not yet existing) file in the directory format of
+        the output.
+    """
+
+    if compress:
+        result = GzippedDNASequencesDirFmt()
+        return SequenceFile(result.path / "dna-sequences.fasta.gz", owner=result)
+    result = DNASequencesDirectoryFormat()
+    return SequenceFile(result.path / "dna-sequences.fasta", owner=result)
+
+
+def _collate_table(results, fn):
+    # Partitions without any viral calls only contribute the header
+    frames = [pd.read_csv(str(r.path / fn), sep="\t", index_col=0) for r in results]
+    frames = [df for df in frames if not df.empty]
+
+    # QIIME 2 metadata needs at least one ID
+    if not frames:
+        raise ValueError(
+            "VirSorter2 did not identify any viral sequences in any partition."
+        )
+    df = pd.concat(frames)
+    df.index.name = "sample_name"
+    return qiime2.Metadata(df)
+
+
+def collate_results(
+    results: Virsorter2ResultsDirFmt, compress_sequences: bool = False
+) -> (SequenceFile, qiime2.Metadata, qiime2.Metadata):
+    if not results:
+        raise ValueError("No results were given to collate.")
+
+    viral_score = _collate_table(results, RUN_OUTPUTS["score"])
+    viral_boundary = _collate_table(results, RUN_OUTPUTS["boundary"])
+
+    # Stream the sequences of all partitions into a single file
+    collated_sequences = sequences_output(compress_sequences)
+    with collated_sequences.create(n_jobs=os.cpu_count() or 1) as out:
+        for partition in results:
+            with open(str(partition.path / RUN_OUTPUTS["sequences"]), "rb") as fh:
+                shutil.copyfileobj(fh, out)
+
+    return collated_sequences, viral_score, viral_boundary
@@ -0,0 +1,18 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from q2_virsorter2._compression import compress_directory
+from q2_virsorter2.types._format import Virsorter2CompressedDbDirFmt, Virsorter2DbDirFmt
+
+
+# Compress every file of the Virsorter2 database
+def compress_db(
+    database: Virsorter2DbDirFmt, n_jobs: int = 1
+) -> Virsorter2CompressedDbDirFmt:
+    result = Virsorter2CompressedDbDirFmt()
+    compress_directory(str(database.path), str(result.path), n_jobs=n_jobs)
+    return result
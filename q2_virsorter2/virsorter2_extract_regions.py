@@ -0,0 +1,75 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+import qiime2
+from q2_types.feature_data import DNAFASTAFormat
+
+from q2_virsorter2._fasta import IndexedFasta
+from q2_virsorter2.types._format import IndexedDNAFASTADirFmt
+
+BOUNDARY_COLUMNS = ["trim_bp_start", "trim_bp_end"]
+
+
+# Compute 0-based, half-open trim coordinates for all boundaries at once
+def _compute_trim_coordinates(boundary_df: pd.DataFrame, index: dict):
+    missing = [col for col in BOUNDARY_COLUMNS if col not in boundary_df.columns]
+    if missing:
+        raise ValueError(
+            "The viral boundary metadata is missing the following "
+            f"column(s): {', '.join(missing)}."
+        )
+
+    df = boundary_df.dropna(subset=BOUNDARY_COLUMNS)
+    unknown = df.index.difference(list(index))
+    if len(unknown):
+        raise ValueError(
+            "The following sequence(s) from the viral boundary metadata were "
+            f"not found in the input sequences: {', '.join(unknown[:10])}."
+        )
+
+    names = df.index.to_numpy()
+    lengths = np.fromiter((index[n].length for n in names), np.int64, len(names))
+    offsets = np.fromiter((index[n].offset for n in names), np.int64, len(names))
+
+    # VirSorter2 reports 1-based, inclusive coordinates
+    starts = np.clip(df["trim_bp_start"].to_numpy(np.int64) - 1, 0, lengths)
+    ends = np.clip(df["trim_bp_end"].to_numpy(np.int64), starts, lengths)
+
+    if "seqname_new" in df.columns:
+        new_ids = df["seqname_new"].fillna(pd.Series(names, index=df.index))
+    else:
+        new_ids = pd.Series(names, index=df.index)
+
+    # Visit the non-empty regions in file order so that reads are sequential
+    order = np.argsort(offsets, kind="stable")
+    order = order[ends[order] > starts[order]]
+    return names[order], new_ids.to_numpy()[order], starts[order], ends[order]
+
+
+def extract_regions(
+    sequences: IndexedDNAFASTADirFmt,
+    viral_boundary: qiime2.Metadata,
+) -> DNAFASTAFormat:
+    regions = DNAFASTAFormat()
+    boundary_df = viral_boundary.to_dataframe()
+
+    with IndexedFasta(
+        sequences.path / "dna-sequences.fasta",
+        sequences.path / "dna-sequences.fasta.fai",
+    ) as fasta:
+        names, new_ids, starts, ends = _compute_trim_coordinates(
+            boundary_df, fasta.index
+        )
+
+        # Only one region is held in memory at any time
+        with open(str(regions), "w") as fh:
+            for name, new_id, start, end in zip(names, new_ids, starts, ends):
+                fh.write(f">{new_id}\n{fasta.fetch(name, start, end)}\n")
+
+    return regions
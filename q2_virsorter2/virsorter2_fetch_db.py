@@ -5,10 +5,16 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import hashlib
 import os
 import shutil
 import subprocess
+import tarfile
+import zlib
 
+from q2_virsorter2._compression import extract_archive, get_cache_dir
+from q2_virsorter2._download import cached_download
+from q2_virsorter2._history import RunRecorder
 from q2_virsorter2._utils import run_command
 from q2_virsorter2.types._format import Virsorter2DbDirFmt
 
@@ -37,16 +43,90 @@ def vs2_setup(database, n_jobs):
 
 
 # Fetch the Virsorter2 database
-def fetch_db(n_jobs: int = 10) -> Virsorter2DbDirFmt:
-    # Initialize a directory format object to store the Minimap2 index
-    database = Virsorter2DbDirFmt()
+def fetch_db(
+    n_jobs: int = 10, url: str = None, checksum: str = None
+) -> Virsorter2DbDirFmt:
+    # Run metrics are only recorded if a history file is configured
+    with RunRecorder("fetch_db", parameters=locals()) as recorder:
+        if url is not None:
+            database = _fetch_archive(url, checksum, n_jobs)
+        else:
+            # Initialize a directory format object to store the Minimap2 index
+            database = Virsorter2DbDirFmt()
+
+            # Construct the command to build the Minimap2 index file
+            vs2_setup(database, n_jobs)
+
+            _remove_setup_leftovers(database)
+        recorder.database = database.path
+
+    return database
+
+
+# Download the database archive (resuming and caching it) and import it
+def _fetch_archive(url, checksum, n_jobs):
+    try:
+        archive = cached_download(
+            url,
+            os.path.join(get_cache_dir(), "downloads"),
+            checksum=_parse_checksum(checksum) if checksum else None,
+            n_jobs=n_jobs,
+        )
+    except OSError as e:
+        raise Exception(
+            f"An error was encountered while downloading the database: {e}. "
+            "Run the action again to resume the download."
+        )
+    return import_db(archive, n_jobs=n_jobs)
 
-    # Construct the command to build the Minimap2 index file
-    vs2_setup(database, n_jobs)
 
-    # Clean up the unnecessary directories
+# Clean up the unnecessary directories
+def _remove_setup_leftovers(database):
     for dir_name in [".snakemake", "conda_envs"]:
         if os.path.exists(os.path.join(str(database.path), dir_name)):
             shutil.rmtree(os.path.join(str(database.path), dir_name))
 
+
+# Split a checksum given as "<algorithm>:<digest>" (e.g., "md5:8a1f...")
+def _parse_checksum(checksum):
+    algorithm, sep, digest = checksum.partition(":")
+    if not sep or algorithm.lower() not in hashlib.algorithms_available:
+        raise ValueError(
+            f"Invalid checksum '{checksum}'. Checksums must be given as "
+            "'<algorithm>:<digest>', e.g. 'md5:<digest>'."
+        )
+    return algorithm.lower(), digest.lower()
+
+
+# Import the Virsorter2 database from a local archive
+def import_db(
+    archive: str, checksum: str = None, n_jobs: int = 4
+) -> Virsorter2DbDirFmt:
+    algorithm, expected = _parse_checksum(checksum) if checksum else ("md5", None)
+
+    database = Virsorter2DbDirFmt()
+
+    # Stream, verify and extract the archive in a single pass; the archive
+    # distributed by VirSorter2 has all files below a "db" directory
+    try:
+        observed = extract_archive(
+            archive, str(database.path), n_jobs, algorithm, strip_prefix="db"
+        )
+    except (tarfile.TarError, zlib.error, EOFError, OSError) as e:
+        raise Exception(
+            f"An error was encountered while extracting the database archive: {e}"
+        )
+
+    if expected is not None and observed != expected:
+        raise ValueError(
+            f"The checksum of {archive} ({algorithm}:{observed}) does not match "
+            f"the expected checksum ({algorithm}:{expected})."
+        )
+    print(f"Imported the database from {archive} ({algorithm}:{observed}).")
+
+    _remove_setup_leftovers(database)
+
+    # "virsorter setup" marks a complete database with this file
+    open(os.path.join(str(database.path), "Done_all_setup"), "a").close()
+
     return database
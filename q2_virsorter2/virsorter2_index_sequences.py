@@ -0,0 +1,15 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from q2_virsorter2.types._format import IndexedDNAFASTADirFmt
+
+
+# The sequences are copied and indexed in a single pass by the transformer
+# from FeatureData[Sequence]; storing the index in the artifact lets later
+# actions access the sequences randomly without indexing them again
+def index_sequences(sequences: IndexedDNAFASTADirFmt) -> IndexedDNAFASTADirFmt:
+    return sequences
@@ -0,0 +1,198 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import os
+import tempfile
+
+from q2_types.feature_data import DNAFASTAFormat
+from q2_types.metadata import ImmutableMetadataDirectoryFormat
+
+from q2_virsorter2._fasta import SequenceFile
+from q2_virsorter2._merge import (
+    FastaPool,
+    group_by_key,
+    merge_runs,
+    read_header,
+    read_records,
+    sort_records,
+)
+from q2_virsorter2.virsorter2_collate import sequences_output
+
+
+def _table_fp(metadata):
+    return str(metadata.path / "metadata.tsv")
+
+
+def _check_headers(table_fps):
+    """All tables must have the same columns to be merged."""
+    header = read_header(table_fps[0])
+    for table_fp in table_fps[1:]:
+        if read_header(table_fp) != header:
+            raise ValueError(
+                f"Unexpected header in {table_fp}, all tables must have the "
+                f"same columns: {header}."
+            )
+    return header
+
+
+def _sorted_runs(table_fps, tmp, name, key_column=0):
+    run_fps = []
+    for source, table_fp in enumerate(table_fps):
+        records = read_records(table_fp, source, key_column)
+        run_fps.extend(sort_records(records, tmp, f"{name}-{source}"))
+    return run_fps
+
+
+def _rank(row, score_column):
+    score = row.split("\t")[score_column]
+    # Calls without a score rank below all scored calls
+    return float(score) if score not in ("", "nan", "NaN") else float("-inf")
+
+
+def _select_records(score_runs, score_column, sequences, tmp):
+    """
+    Selects the records to keep from the merged score tables.
+
+    The best-scoring record is kept for every ID (the first input wins
+    ties). Records of different IDs with identical sequences are reduced
+    to the best-scoring one (the first ID wins ties), using a hash of the
+    sequence. Both steps are external sorts, so that neither the IDs nor
+    the hashes are held in memory.
+
+    Returns:
+    tuple: Runs of the kept (ID, input) pairs in ID order, the number of
+        kept records, the number of duplicate IDs and the number of
+        duplicate sequences that were removed.
+    """
+
+    counts = {"ids": 0, "duplicate_ids": 0, "kept": 0}
+
+    def best_per_id():
+        for key, records in group_by_key(merge_runs(score_runs, tmp)):
+            counts["ids"] += 1
+            counts["duplicate_ids"] += len(records) - 1
+            # Records are ordered by input, so max() keeps the first of ties
+            _, source, row = max(records, key=lambda r: _rank(r[2], score_column))
+
+            sequence = sequences.fetch(source, key)
+            if sequence is None:
+                # Calls without a sequence are only deduplicated by their ID
+                digest = f"id:{key}"
+            else:
+                digest = hashlib.blake2b(sequence.upper().encode(), digest_size=16)
+                digest = f"sequence:{digest.hexdigest()}"
+            yield digest, source, f"{_rank(row, score_column)!r}\t{key}"
+
+    def best_per_digest(digest_runs):
+        for _, records in group_by_key(merge_runs(digest_runs, tmp)):
+            # Rows are "rank, ID", so the first ID wins ties
+            _, source, rank_key = min(
+                records, key=lambda r: (-float(r[2].split("\t")[0]), r[2])
+            )
+            counts["kept"] += 1
+            yield rank_key.split("\t", 1)[1], source, ""
+
+    digest_runs = sort_records(best_per_id(), tmp, "digest")
+    kept_runs = sort_records(best_per_digest(digest_runs), tmp, "kept")
+    return (
+        kept_runs,
+        counts["kept"],
+        counts["duplicate_ids"],
+        counts["ids"] - counts["kept"],
+    )
+
+
+def _write_table(header, records, kept_runs, tmp, table_fp, on_write=None):
+    """
+    Writes the kept rows, calling 'on_write' with every (ID, input).
+
+    The records and the kept pairs are both in (ID, input) order, so they
+    are joined in a single pass.
+    """
+    kept = merge_runs(kept_runs, tmp)
+    next_kept = next(kept, None)
+    with open(table_fp, "w") as out:
+        out.write("\t".join(header) + "\n")
+        for key, source, row in records:
+            while next_kept is not None and next_kept[:2] < (key, source):
+                next_kept = next(kept, None)
+            if next_kept is not None and next_kept[:2] == (key, source):
+                out.write(row + "\n")
+                if on_write is not None:
+                    on_write(key, source)
+
+
+def merge_results(
+    viral_sequences: DNAFASTAFormat,
+    viral_score: ImmutableMetadataDirectoryFormat,
+    viral_boundary: ImmutableMetadataDirectoryFormat,
+    compress_sequences: bool = False,
+) -> (
+    SequenceFile,
+    ImmutableMetadataDirectoryFormat,
+    ImmutableMetadataDirectoryFormat,
+):
+    if not (len(viral_sequences) == len(viral_score) == len(viral_boundary)):
+        raise ValueError(
+            "The same number of viral sequences, score and boundary tables "
+            "must be given."
+        )
+
+    score_fps = [_table_fp(md) for md in viral_score]
+    boundary_fps = [_table_fp(md) for md in viral_boundary]
+    score_header = _check_headers(score_fps)
+    boundary_header = _check_headers(boundary_fps)
+
+    merged_sequences = sequences_output(compress_sequences)
+    merged_score = ImmutableMetadataDirectoryFormat()
+    merged_boundary = ImmutableMetadataDirectoryFormat()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Every table is sorted on its own, so that all of them can be
+        # merged in a streaming pass with a bounded number of open files
+        score_runs = _sorted_runs(score_fps, tmp, "score")
+        # Boundaries are matched to the scores by the name of the call
+        boundary_runs = _sorted_runs(
+            boundary_fps,
+            tmp,
+            "boundary",
+            key_column=boundary_header.index("seqname_new"),
+        )
+
+        with FastaPool([str(s) for s in viral_sequences], tmp) as sequences:
+            kept_runs, n_kept, n_duplicate_ids, n_duplicate_sequences = _select_records(
+                score_runs, score_header.index("max_score"), sequences, tmp
+            )
+
+            # The sequences are written in the order of the score table
+            with merged_sequences.create(n_jobs=os.cpu_count() or 1) as out:
+                _write_table(
+                    score_header,
+                    merge_runs(score_runs, tmp),
+                    kept_runs,
+                    tmp,
+                    _table_fp(merged_score),
+                    on_write=lambda key, source: sequences.write_record(
+                        source, key, out
+                    ),
+                )
+
+        _write_table(
+            boundary_header,
+            merge_runs(boundary_runs, tmp),
+            kept_runs,
+            tmp,
+            _table_fp(merged_boundary),
+        )
+
+    print(
+        f"Merged {len(viral_score)} result sets into {n_kept} viral calls, "
+        f"removing {n_duplicate_ids} duplicate ID(s) and "
+        f"{n_duplicate_sequences} duplicate sequence(s)."
+    )
+    return merged_sequences, merged_score, merged_boundary
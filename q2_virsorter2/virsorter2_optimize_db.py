@@ -0,0 +1,21 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from q2_virsorter2._hmm_dedup import deduplicate_database
+from q2_virsorter2.types._format import Virsorter2DbDirFmt
+
+
+# Store HMM profiles shared by several files of the database only once
+def optimize_db(database: Virsorter2DbDirFmt) -> Virsorter2DbDirFmt:
+    result = Virsorter2DbDirFmt()
+    stats = deduplicate_database(str(database.path), str(result.path))
+    print(
+        f"Deduplicated {stats['profiles']} HMM profiles into {stats['unique']} "
+        f"distinct ones; {stats['shared']} of them are shared by several "
+        "files and stored only once."
+    )
+    return result
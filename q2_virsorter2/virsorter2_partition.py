@@ -0,0 +1,35 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+
+from q2_types.feature_data import DNAFASTAFormat
+
+from q2_virsorter2._fasta import SequenceFile
+from q2_virsorter2._sharding import partition_sequence_file
+
+
+def partition_sequences(
+    sequences: SequenceFile, num_partitions: int = 1
+) -> DNAFASTAFormat:
+    partitions = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Split the sequences into partitions of similar total length;
+        # BGZF compressed input is decompressed in parallel
+        shard_fps = partition_sequence_file(
+            sequences, tmp, num_partitions, n_jobs=os.cpu_count() or 1
+        )
+
+        for i, shard_fp in enumerate(shard_fps):
+            partition = DNAFASTAFormat()
+            shutil.move(shard_fp, str(partition))
+            partitions[f"partition_{i}"] = partition
+
+    return partitions
@@ -5,30 +5,73 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import contextlib
 import os
 import shutil
 import subprocess
 import tempfile
+import threading
 
 import pandas as pd
 import qiime2
-from q2_types.feature_data import DNAFASTAFormat
+from q2_types.feature_data import DNAFASTAFormat, FeatureData, Sequence
 
-from q2_virsorter2._utils import run_command
-from q2_virsorter2.types._format import Virsorter2DbDirFmt
+from q2_virsorter2._events import EventStream, count_fasta_records
+from q2_virsorter2._fasta import SequenceFile
+from q2_virsorter2._history import RunRecorder, database_manifest
+from q2_virsorter2._hmm_dedup import expand_database, is_deduplicated
+from q2_virsorter2._memory import MemoryMonitor, memory_estimate
+from q2_virsorter2._scheduler import run_shards
+from q2_virsorter2._scratch import ScratchMonitor, get_directory_size
+from q2_virsorter2._sharding import (
+    RUN_OUTPUTS,
+    collate_run_outputs,
+    partition_fasta,
+)
+from q2_virsorter2._utils import (
+    _construct_snakemake_resources,
+    run_cancellable_command,
+    run_command,
+)
+from q2_virsorter2._windows import stitch_windows, write_windows
+from q2_virsorter2._worker import submit_job
+from q2_virsorter2.types._format import Virsorter2DbDirFmt, Virsorter2ResultsDirFmt
+from q2_virsorter2.virsorter2_collate import sequences_output
 
+# Named sets of "virsorter run" options, trading accuracy for speed. The
+# agreement of each profile with "default" is measured by
+# benchmarks/bench_profiles.py.
+RUN_PROFILES = {
+    # Skips the provirus boundary extension and samples at most 20 ORFs per
+    # sequence for the taxonomic features (which needs the former)
+    "fast": ["--provirus-off", "--max-orf-per-seq", "20"],
+    "default": [],
+    # Scores against the models of all viral groups, not only the dsDNA
+    # phages and ssDNA viruses
+    "sensitive": ["--include-groups", "dsDNAphage,NCLDV,RNA,ssDNA,lavidaviridae"],
+}
 
-# Create the command to fetch the Virsorter2 database
-def vs2_run_execution(tmp, sequences, database, n_jobs, min_score, min_length):
+
+# Create the "virsorter run" command
+def _construct_run_cmd(
+    work_dir,
+    sequences_fp,
+    database_fp,
+    n_jobs,
+    min_score,
+    min_length,
+    snakemake_args,
+    profile="default",
+):
     cmd = [
         "virsorter",
         "run",
         "-w",
-        str(tmp),
+        str(work_dir),
         "-d",
-        str(database.path),
+        str(database_fp),
         "-i",
-        str(sequences.path),
+        str(sequences_fp),
         "-j",
         str(n_jobs),
         "--min-score",
@@ -36,10 +79,40 @@ def vs2_run_execution(tmp, sequences, database, n_jobs, min_score, min_length):
         "--min-length",
         str(min_length),
         "--use-conda-off",
+        *RUN_PROFILES[profile],
     ]
 
+    # Anything after the target is passed through to Snakemake
+    if snakemake_args:
+        cmd.extend(["all", *snakemake_args])
+    return cmd
+
+
+# Execute "virsorter run" on all sequences at once
+def vs2_run_execution(
+    tmp,
+    sequences,
+    database,
+    n_jobs,
+    min_score,
+    min_length,
+    snakemake_args=None,
+    events=None,
+    profile="default",
+):
+    cmd = _construct_run_cmd(
+        tmp,
+        sequences.path,
+        database.path,
+        n_jobs,
+        min_score,
+        min_length,
+        snakemake_args,
+        profile=profile,
+    )
+
     try:
-        run_command(cmd)
+        run_command(cmd, events=events)
     except subprocess.CalledProcessError as e:
         raise Exception(
             "An error was encountered while running virsorter2 run, "
@@ -48,40 +121,405 @@ def vs2_run_execution(tmp, sequences, database, n_jobs, min_score, min_length):
         )
 
 
-def run(
+# Execute "virsorter run" on balanced shards of the sequences and collate
+# the outputs of all shards into "tmp"
+def vs2_run_sharded(
+    tmp,
+    sequences,
+    database,
+    n_jobs,
+    min_score,
+    min_length,
+    snakemake_args=None,
+    n_shards=1,
+    shard_timeout=None,
+    max_retries=0,
+    speculative=False,
+    events=None,
+    profile="default",
+):
+    events = events or EventStream()
+    shard_fps = partition_fasta(
+        str(sequences.path), os.path.join(tmp, "shards"), n_shards
+    )
+    if not shard_fps:
+        raise Exception("No sequences were found in the input.")
+
+    # Share the available jobs between the concurrently running shards
+    n_workers = min(len(shard_fps), n_jobs)
+    jobs_per_shard = max(1, n_jobs // n_workers)
+
+    # Progress is counted once per shard, even if a copy finishes as well
+    finished, lock = set(), threading.Lock()
+
+    def run_attempt(shard_fp, attempt, cancel):
+        work_dir = f"{os.path.splitext(shard_fp)[0]}-attempt-{attempt}"
+        cmd = _construct_run_cmd(
+            work_dir,
+            shard_fp,
+            database.path,
+            jobs_per_shard,
+            min_score,
+            min_length,
+            snakemake_args,
+            profile=profile,
+        )
+        shard = os.path.basename(shard_fp)
+        # Work directories of failed and abandoned attempts are removed right
+        # away, so that retries do not multiply the disk usage
+        try:
+            with events.stage("shard", shard=shard, attempt=attempt):
+                completed = run_cancellable_command(cmd, cancel, events=events)
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+        if not completed or cancel.is_set():
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return None
+
+        with lock:
+            first = shard_fp not in finished
+            finished.add(shard_fp)
+        if first and events.active:
+            events.advance(count_fasta_records(shard_fp))
+        return work_dir
+
+    try:
+        work_dirs = run_shards(
+            shard_fps,
+            run_attempt,
+            n_workers,
+            timeout=shard_timeout,
+            max_retries=max_retries,
+            speculative=speculative,
+            discard=lambda work_dir: shutil.rmtree(work_dir, ignore_errors=True),
+        )
+    except Exception as e:
+        raise Exception(
+            f"An error was encountered while running virsorter2 run: {e} "
+            "Please inspect stdout and stderr to learn more."
+        )
+
+    with events.stage("collate"):
+        collate_run_outputs(work_dirs, tmp)
+
+
+# Execute "virsorter run" through a worker that holds its own copy of the
+# database, which must have the files of the given one
+def vs2_run_on_worker(
+    worker_socket,
+    tmp,
+    sequences,
+    database,
+    n_jobs,
+    min_score,
+    min_length,
+    snakemake_args=None,
+    profile="default",
+):
+    # The worker may run on behalf of several callers, so it gets its own
+    # work directory that "virsorter run" is allowed to create
+    work_dir = os.path.join(tmp, "worker")
+    try:
+        submit_job(
+            worker_socket,
+            "run",
+            sequences=str(sequences.path),
+            work_dir=work_dir,
+            n_jobs=n_jobs,
+            min_score=min_score,
+            min_length=min_length,
+            database_manifest=database_manifest(str(database.path)),
+            snakemake_args=snakemake_args,
+            profile=profile,
+        )
+    except Exception as e:
+        raise Exception(
+            f"An error was encountered while running virsorter2 run on the "
+            f"worker listening on {worker_socket}: {e}"
+        )
+
+    for fn in RUN_OUTPUTS.values():
+        shutil.move(os.path.join(work_dir, fn), os.path.join(tmp, fn))
+
+
+@contextlib.contextmanager
+def _run_virsorter2(
+    action,
+    parameters,
+    sequences,
+    database,
+    n_jobs,
+    min_score,
+    min_length,
+    profile,
+    prune_intermediates,
+    scratch_cap,
+    memory_cap,
+    window_size,
+    window_overlap,
+    n_shards,
+    shard_timeout,
+    max_retries,
+    speculative,
+    worker_socket,
+    progress_file,
+    partition=None,
+):
+    """Runs VirSorter2 and yields the directory holding its final outputs."""
+    # Run metrics are only recorded if a history file is configured
+    recorder = RunRecorder(
+        action,
+        parameters=parameters,
+        input_fp=str(sequences.path),
+        database=database.path,
+    )
+
+    # "virsorter run" expects the original HMM files of deduplicated databases;
+    # a worker expands its own copy
+    if not worker_socket and is_deduplicated(database.path):
+        database = Virsorter2DbDirFmt(expand_database(database.path), mode="r")
+
+    # Progress events are only emitted if requested; partitions of a run
+    # share the file, so their events are tagged with the partition
+    events = EventStream(
+        progress_file,
+        callback=recorder.on_event if recorder.active else None,
+        tags={"partition": partition} if partition is not None else None,
+    )
+    n_contigs = count_fasta_records(str(sequences.path)) if events.active else 0
+    recorder.n_contigs = n_contigs if events.active else None
+
+    # Let Snakemake keep the summed disk and memory estimates of running jobs
+    # under the caps. Shards run concurrently, so they share the memory cap.
+    sharded = not worker_socket and (n_shards > 1 or max_retries or shard_timeout)
+    job_memory = memory_cap
+    if memory_cap and sharded:
+        job_memory = max(memory_cap // min(n_shards, n_jobs), 1)
+    snakemake_args = _construct_snakemake_resources(
+        {"disk_mb": scratch_cap, "mem_mb": job_memory},
+        {"mem_mb": memory_estimate(database.path, job_memory)} if job_memory else None,
+    )
+
+    with recorder, tempfile.TemporaryDirectory() as tmp:
+        # In disk-aware mode the work directory is watched during the run
+        if prune_intermediates or scratch_cap:
+            monitor = ScratchMonitor(tmp, prune=prune_intermediates, cap_mb=scratch_cap)
+        else:
+            monitor = contextlib.nullcontext()
+        events.probes["scratch_mb"] = lambda: round(get_directory_size(tmp) / 2**20, 1)
+        # The memory actually used by the jobs is reported against the budget
+        if memory_cap:
+            memory = MemoryMonitor(cap_mb=memory_cap, events=events)
+        else:
+            memory = contextlib.nullcontext()
+
+        # Long contigs are cut into windows that are processed in parallel
+        windows = None
+        if window_size:
+            windows_fp = os.path.join(tmp, "windowed-sequences.fa")
+            windows = write_windows(
+                str(sequences.path), windows_fp, window_size, window_overlap
+            )
+            input_sequences = sequences
+            sequences = SequenceFile(windows_fp)
+            if events.active:
+                n_contigs = count_fasta_records(windows_fp)
+
+        # Execute the "virsorter2 run" command, split into shards that are
+        # individually supervised if requested
+        with monitor, memory, events, events.stage("classify"):
+            events.set_total(n_contigs)
+            if worker_socket:
+                vs2_run_on_worker(
+                    worker_socket,
+                    tmp,
+                    sequences,
+                    database,
+                    n_jobs,
+                    min_score,
+                    min_length,
+                    snakemake_args=snakemake_args,
+                    profile=profile,
+                )
+                events.finish()
+            elif sharded:
+                vs2_run_sharded(
+                    tmp,
+                    sequences,
+                    database,
+                    n_jobs,
+                    min_score,
+                    min_length,
+                    snakemake_args=snakemake_args,
+                    n_shards=n_shards,
+                    shard_timeout=shard_timeout,
+                    max_retries=max_retries,
+                    speculative=speculative,
+                    events=events,
+                    profile=profile,
+                )
+            else:
+                vs2_run_execution(
+                    tmp,
+                    sequences,
+                    database,
+                    n_jobs,
+                    min_score,
+                    min_length,
+                    snakemake_args=snakemake_args,
+                    events=events,
+                    profile=profile,
+                )
+                events.finish()
+
+        # Calls made on windows are moved back into contig coordinates
+        if windows:
+            stitch_windows(tmp, windows, str(input_sequences.path), window_size)
+
+        yield tmp
+
+
+def _read_viral_table(tmp, fn):
+    df = pd.read_csv(os.path.join(tmp, fn), sep="\t", index_col=0)
+    df.index.name = "sample_name"
+    return df
+
+
+def classify(
     sequences: DNAFASTAFormat,
     database: Virsorter2DbDirFmt,
     n_jobs: int = 10,
     min_score: float = 0.5,
     min_length: int = 0,
-) -> (DNAFASTAFormat, qiime2.Metadata, qiime2.Metadata):
-
-    viral_sequences = DNAFASTAFormat()
+    profile: str = "default",
+    prune_intermediates: bool = False,
+    scratch_cap: int = None,
+    memory_cap: int = None,
+    window_size: int = None,
+    window_overlap: int = 100000,
+    n_shards: int = 1,
+    shard_timeout: int = None,
+    max_retries: int = 0,
+    speculative: bool = False,
+    worker_socket: str = None,
+    progress_file: str = None,
+    compress_sequences: bool = False,
+) -> (SequenceFile, qiime2.Metadata, qiime2.Metadata):
+    parameters = {
+        k: v for k, v in locals().items() if k not in ["sequences", "database"]
+    }
+    kwargs = {k: v for k, v in parameters.items() if k != "compress_sequences"}
+    viral_sequences = sequences_output(compress_sequences)
 
-    with tempfile.TemporaryDirectory() as tmp:
-        # Execute the "virsorter2 run" command
-        vs2_run_execution(tmp, sequences, database, n_jobs, min_score, min_length)
-
-        # Copy the combined viral sequences file
-        shutil.copy(
-            os.path.join(tmp, "final-viral-combined.fa"),
-            os.path.join(str(viral_sequences)),
-        )
+    with _run_virsorter2("classify", parameters, sequences, database, **kwargs) as tmp:
+        # Take over the combined viral sequences, compressing them if requested
+        combined_fp = os.path.join(tmp, "final-viral-combined.fa")
+        if viral_sequences.compressed:
+            with open(combined_fp, "rb") as fh, viral_sequences.create(n_jobs) as out:
+                shutil.copyfileobj(fh, out)
+        else:
+            shutil.move(combined_fp, viral_sequences.path)
 
-        # Read the viral score file into a DataFrame
-        viral_score_df = pd.read_csv(
-            os.path.join(tmp, "final-viral-score.tsv"), sep="\t", index_col=0
-        )
-        viral_score_df.index.name = "sample_name"
+        viral_score_df = _read_viral_table(tmp, "final-viral-score.tsv")
+        viral_boundary_df = _read_viral_table(tmp, "final-viral-boundary.tsv")
 
-        # Read the viral boundary file into a DataFrame
-        viral_boundary_df = pd.read_csv(
-            os.path.join(tmp, "final-viral-boundary.tsv"), sep="\t", index_col=0
+    # QIIME 2 metadata needs at least one ID
+    if viral_score_df.empty:
+        raise ValueError(
+            "VirSorter2 did not identify any viral sequences in the input. "
+            "Use the run pipeline to classify inputs that may not contain any."
         )
-        viral_boundary_df.index.name = "sample_name"
 
     return (
         viral_sequences,
         qiime2.Metadata(viral_score_df),
         qiime2.Metadata(viral_boundary_df),
     )
+
+
+def _classify_partition(
+    sequences: DNAFASTAFormat,
+    database: Virsorter2DbDirFmt,
+    n_jobs: int = 10,
+    min_score: float = 0.5,
+    min_length: int = 0,
+    profile: str = "default",
+    prune_intermediates: bool = False,
+    scratch_cap: int = None,
+    memory_cap: int = None,
+    window_size: int = None,
+    window_overlap: int = 100000,
+    n_shards: int = 1,
+    shard_timeout: int = None,
+    max_retries: int = 0,
+    speculative: bool = False,
+    worker_socket: str = None,
+    progress_file: str = None,
+    partition: str = None,
+) -> Virsorter2ResultsDirFmt:
+    kwargs = {k: v for k, v in locals().items() if k not in ["sequences", "database"]}
+    results = Virsorter2ResultsDirFmt()
+
+    # The outputs are kept as they are, so that partitions without any viral
+    # calls can be collated as well
+    with _run_virsorter2("classify", kwargs, sequences, database, **kwargs) as tmp:
+        for fn in RUN_OUTPUTS.values():
+            shutil.move(os.path.join(tmp, fn), str(results.path / fn))
+
+    return results
+
+
+def run(
+    ctx,
+    sequences,
+    database,
+    n_jobs=10,
+    min_score=0.5,
+    min_length=0,
+    profile="default",
+    prune_intermediates=False,
+    scratch_cap=None,
+    memory_cap=None,
+    window_size=None,
+    window_overlap=100000,
+    n_shards=1,
+    shard_timeout=None,
+    max_retries=0,
+    speculative=False,
+    worker_socket=None,
+    progress_file=None,
+    compress_sequences=False,
+    num_partitions=1,
+):
+    kwargs = {
+        k: v
+        for k, v in locals().items()
+        if k not in ["ctx", "sequences", "database", "num_partitions"]
+    }
+    # Only the collated sequences are compressed
+    compress_sequences = kwargs.pop("compress_sequences")
+
+    # Uncompressed sequences that are not partitioned are classified directly
+    if num_partitions == 1 and sequences.type <= FeatureData[Sequence]:
+        classify_method = ctx.get_action("virsorter2", "classify")
+        return classify_method(
+            sequences, database, compress_sequences=compress_sequences, **kwargs
+        )
+
+    partition_method = ctx.get_action("virsorter2", "partition_sequences")
+    classify_method = ctx.get_action("virsorter2", "_classify_partition")
+    collate_method = ctx.get_action("virsorter2", "collate_results")
+
+    (partitioned_sequences,) = partition_method(sequences, num_partitions)
+
+    # Partitions are classified independently, so the executor can run
+    # them concurrently
+    results = []
+    for partition_id, partition in partitioned_sequences.items():
+        (partition_results,) = classify_method(
+            partition, database, partition=partition_id, **kwargs
+        )
+        results.append(partition_results)
+
+    return collate_method(results, compress_sequences=compress_sequences)
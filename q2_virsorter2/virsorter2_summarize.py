@@ -0,0 +1,215 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import html
+import json
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from q2_types.metadata import ImmutableMetadataDirectoryFormat
+
+# Bins are fixed, so the summary has the same size for any input
+SCORE_BINS = np.linspace(0, 1, 51)
+LENGTH_BINS = np.logspace(2, 7, 51)
+MAX_CATEGORIES = 20
+CHUNK_SIZE = 100_000
+
+
+def _read_chunks(fp, columns, chunk_size=CHUNK_SIZE):
+    """Reads selected columns of a metadata table in chunks."""
+    with open(fp) as fh:
+        fh.readline()
+        # Tables exported by QIIME 2 have a row with column types
+        skiprows = [1] if fh.readline().startswith("#q2:") else None
+    return pd.read_csv(
+        fp,
+        sep="\t",
+        usecols=columns,
+        skiprows=skiprows,
+        chunksize=chunk_size,
+        keep_default_na=False,
+        na_values=[""],
+    )
+
+
+def _clip_lengths(lengths):
+    # Values outside of the bins are counted in the outermost bins
+    return np.clip(lengths, LENGTH_BINS[0], LENGTH_BINS[-1])
+
+
+def _summarize_scores(score_fp, chunk_size=CHUNK_SIZE):
+    summary = {
+        "n_calls": 0,
+        "n_unscored": 0,
+        "score_hist": np.zeros(len(SCORE_BINS) - 1, dtype=np.int64),
+        "length_hist": np.zeros(len(LENGTH_BINS) - 1, dtype=np.int64),
+        "density": np.zeros((len(LENGTH_BINS) - 1, len(SCORE_BINS) - 1), np.int64),
+        "groups": Counter(),
+    }
+    columns = ["max_score", "max_score_group", "length"]
+    for chunk in _read_chunks(score_fp, columns, chunk_size):
+        scores = chunk["max_score"].to_numpy(dtype=float)
+        lengths = _clip_lengths(chunk["length"].to_numpy(dtype=float))
+        scored = ~np.isnan(scores)
+
+        summary["n_calls"] += len(chunk)
+        summary["n_unscored"] += int((~scored).sum())
+        summary["score_hist"] += np.histogram(scores[scored], SCORE_BINS)[0]
+        summary["length_hist"] += np.histogram(lengths, LENGTH_BINS)[0]
+        summary["density"] += np.histogram2d(
+            lengths[scored], scores[scored], [LENGTH_BINS, SCORE_BINS]
+        )[0].astype(np.int64)
+        summary["groups"].update(chunk["max_score_group"].value_counts().to_dict())
+    return summary
+
+
+def _summarize_boundaries(boundary_fp, chunk_size=CHUNK_SIZE):
+    summary = {
+        "n_regions": 0,
+        "n_partial": 0,
+        "region_length_hist": np.zeros(len(LENGTH_BINS) - 1, dtype=np.int64),
+        "shapes": Counter(),
+    }
+    columns = ["trim_bp_start", "trim_bp_end", "partial", "shape"]
+    for chunk in _read_chunks(boundary_fp, columns, chunk_size):
+        lengths = (chunk["trim_bp_end"] - chunk["trim_bp_start"] + 1).to_numpy(float)
+
+        summary["n_regions"] += len(chunk)
+        summary["n_partial"] += int((chunk["partial"] == 1).sum())
+        summary["region_length_hist"] += np.histogram(
+            _clip_lengths(lengths), LENGTH_BINS
+        )[0]
+        summary["shapes"].update(chunk["shape"].value_counts().to_dict())
+    return summary
+
+
+def _top_categories(counts):
+    """Keeps the most frequent categories and merges the rest."""
+    top = counts.most_common(MAX_CATEGORIES)
+    rest = sum(counts.values()) - sum(n for _, n in top)
+    return top + [("other", rest)] if rest else top
+
+
+def _svg_histogram(counts, edges, title, x_label, log_x=False):
+    width, height, pad = 480, 240, 40
+    bar_width = (width - 2 * pad) / len(counts)
+    top = max(int(counts.max()), 1)
+    bars = "".join(
+        f'<rect x="{pad + i * bar_width:.1f}" '
+        f'y="{height - pad - (height - 2 * pad) * c / top:.1f}" '
+        f'width="{bar_width:.1f}" height="{(height - 2 * pad) * c / top:.1f}" '
+        f'fill="#4c72b0"><title>{edges[i]:.3g}-{edges[i + 1]:.3g}: {c}'
+        "</title></rect>"
+        for i, c in enumerate(counts)
+    )
+    fmt = (lambda v: f"{v:.0e}") if log_x else (lambda v: f"{v:.2g}")
+    return (
+        f'<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">'
+        f'<text x="{width / 2}" y="20" text-anchor="middle">{title}</text>{bars}'
+        f'<text x="{pad}" y="{height - 20}">{fmt(edges[0])}</text>'
+        f'<text x="{width - pad}" y="{height - 20}" text-anchor="end">'
+        f"{fmt(edges[-1])}</text>"
+        f'<text x="{width / 2}" y="{height - 5}" text-anchor="middle">{x_label}'
+        f'</text><text x="5" y="{pad}">{top}</text></svg>'
+    )
+
+
+def _svg_density(density):
+    size, pad = 400, 40
+    n_rows, n_cols = density.shape
+    cell_w, cell_h = (size - 2 * pad) / n_cols, (size - 2 * pad) / n_rows
+    # A log scale keeps sparse regions visible next to dense ones
+    scale = np.log1p(density) / max(np.log1p(density.max()), 1)
+    cells = "".join(
+        f'<rect x="{pad + j * cell_w:.1f}" '
+        f'y="{size - pad - (i + 1) * cell_h:.1f}" width="{cell_w:.1f}" '
+        f'height="{cell_h:.1f}" fill="#4c72b0" '
+        f'fill-opacity="{scale[i, j]:.2f}"><title>{density[i, j]}</title></rect>'
+        for i, j in zip(*np.nonzero(density))
+    )
+    return (
+        f'<svg width="{size}" height="{size}" xmlns="http://www.w3.org/2000/svg">'
+        f'<text x="{size / 2}" y="20" text-anchor="middle">Length vs. score'
+        f'</text>{cells}<text x="{size / 2}" y="{size - 5}" '
+        'text-anchor="middle">max score (0-1)</text>'
+        f'<text x="12" y="{size / 2}" transform="rotate(-90 12 {size / 2})" '
+        'text-anchor="middle">length (1e2-1e7 bp, log)</text></svg>'
+    )
+
+
+def _html_table(title, rows):
+    body = "".join(
+        f"<tr><td>{html.escape(str(k))}</td><td>{v}</td></tr>" for k, v in rows
+    )
+    return f"<h3>{title}</h3><table><tr><th></th><th>Count</th></tr>{body}</table>"
+
+
+def _render(scores, boundaries):
+    sections = [
+        _html_table(
+            "Overview",
+            [
+                ("Viral calls", scores["n_calls"]),
+                ("Calls without score", scores["n_unscored"]),
+                ("Viral regions", boundaries["n_regions"]),
+                ("Partial regions (proviruses)", boundaries["n_partial"]),
+            ],
+        ),
+        _svg_histogram(scores["score_hist"], SCORE_BINS, "Max score", "score"),
+        _svg_histogram(
+            scores["length_hist"], LENGTH_BINS, "Call length", "bp", log_x=True
+        ),
+        _svg_histogram(
+            boundaries["region_length_hist"],
+            LENGTH_BINS,
+            "Trimmed region length",
+            "bp",
+            log_x=True,
+        ),
+        _svg_density(scores["density"]),
+        _html_table("Best-scoring group", _top_categories(scores["groups"])),
+        _html_table("Shape", _top_categories(boundaries["shapes"])),
+    ]
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+        "<title>VirSorter2 summary</title><style>body{font-family:sans-serif}"
+        "table{border-collapse:collapse}td,th{padding:2px 8px}</style></head>"
+        "<body><h2>VirSorter2 summary</h2>"
+        + "".join(f"<div>{s}</div>" for s in sections)
+        + "<p><a href='summary.json'>Download the binned data</a></p></body></html>"
+    )
+
+
+def _to_json(scores, boundaries):
+    return {
+        "score_bins": SCORE_BINS.tolist(),
+        "length_bins": LENGTH_BINS.tolist(),
+        **{
+            k: v.tolist() if isinstance(v, np.ndarray) else v
+            for k, v in {**scores, **boundaries}.items()
+            if k not in ["groups", "shapes"]
+        },
+        "groups": dict(_top_categories(scores["groups"])),
+        "shapes": dict(_top_categories(boundaries["shapes"])),
+    }
+
+
+def summarize(
+    output_dir: str,
+    viral_score: ImmutableMetadataDirectoryFormat,
+    viral_boundary: ImmutableMetadataDirectoryFormat,
+) -> None:
+    # Both tables are read in a single chunked pass into fixed-size bins
+    scores = _summarize_scores(str(viral_score.path / "metadata.tsv"))
+    boundaries = _summarize_boundaries(str(viral_boundary.path / "metadata.tsv"))
+
+    with open(os.path.join(output_dir, "index.html"), "w") as fh:
+        fh.write(_render(scores, boundaries))
+    with open(os.path.join(output_dir, "summary.json"), "w") as fh:
+        json.dump(_to_json(scores, boundaries), fh)
@@ -0,0 +1,126 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Bokulich Lab.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from q2_virsorter2._compression import extract_archive
+from q2_virsorter2._utils import link_or_copy
+from q2_virsorter2.types._format import Virsorter2DbDirFmt
+
+# Left behind by "virsorter setup" and not part of the database
+IGNORED_DIRS = (".snakemake", "conda_envs")
+
+
+def _hash_file(fp, chunk_size=2**20):
+    digest = hashlib.sha256()
+    with open(fp, "rb") as fh:
+        while chunk := fh.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_tree(directory, n_jobs=1):
+    """
+    Compute the checksums of all database files below a directory.
+
+    Args:
+    directory (str): The database directory.
+    n_jobs (int): Number of files hashed concurrently.
+
+    Returns:
+    dict: Checksums keyed by the path of the files relative to 'directory'.
+    """
+
+    rel_paths = []
+    for root, dirs, files in os.walk(directory):
+        if root == directory:
+            dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+        for name in files:
+            rel_paths.append(os.path.relpath(os.path.join(root, name), directory))
+
+    with ThreadPoolExecutor(n_jobs) as pool:
+        digests = pool.map(_hash_file, [os.path.join(directory, p) for p in rel_paths])
+        return dict(zip(rel_paths, digests))
+
+
+def diff_trees(old, new):
+    """
+    Compare the checksums of two database versions.
+
+    Args:
+    old (dict): Checksums of the current database (see '_hash_tree').
+    new (dict): Checksums of the new release.
+
+    Returns:
+    dict: Sorted lists of "added", "removed", "changed" and "unchanged" paths.
+    """
+
+    return {
+        "added": sorted(new.keys() - old.keys()),
+        "removed": sorted(old.keys() - new.keys()),
+        "changed": sorted(p for p in new.keys() & old.keys() if new[p] != old[p]),
+        "unchanged": sorted(p for p in new.keys() & old.keys() if new[p] == old[p]),
+    }
+
+
+def _report_changes(diff):
+    print(
+        f"Database update: {len(diff['changed'])} changed, "
+        f"{len(diff['added'])} added, {len(diff['removed'])} removed and "
+        f"{len(diff['unchanged'])} unchanged file(s)."
+    )
+    for status in ["changed", "added", "removed"]:
+        for rel_path in diff[status]:
+            print(f"  {status}: {rel_path}")
+
+
+def _apply_update(database_path, release_path, result_path, n_jobs):
+    diff = diff_trees(
+        _hash_tree(database_path, n_jobs), _hash_tree(release_path, n_jobs)
+    )
+
+    # Unchanged files are reused from the current database; only the new
+    # and changed files are written.
+    copies = [(database_path, p) for p in diff["unchanged"]]
+    copies += [(release_path, p) for p in diff["changed"] + diff["added"]]
+    with ThreadPoolExecutor(n_jobs) as pool:
+        futures = [
+            pool.submit(
+                link_or_copy,
+                os.path.join(root, rel_path),
+                os.path.join(result_path, rel_path),
+            )
+            for root, rel_path in copies
+        ]
+        for future in futures:
+            future.result()
+
+    return diff
+
+
+# Update the Virsorter2 database to a newer release
+def update_db(
+    database: Virsorter2DbDirFmt, release: str, n_jobs: int = 4
+) -> Virsorter2DbDirFmt:
+    result = Virsorter2DbDirFmt()
+
+    if os.path.isdir(release):
+        diff = _apply_update(str(database.path), release, str(result.path), n_jobs)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            extract_archive(release, tmp, n_jobs, strip_prefix="db")
+            diff = _apply_update(str(database.path), tmp, str(result.path), n_jobs)
+
+    _report_changes(diff)
+
+    # "virsorter setup" marks a complete database with this file
+    open(os.path.join(str(result.path), "Done_all_setup"), "a").close()
+
+    return result